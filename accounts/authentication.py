@@ -0,0 +1,136 @@
+# accounts/authentication.py
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.translation import gettext_lazy as _
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import AuthenticationFailed
+
+
+class TokenUserCache:
+    """
+    Кэш "токен → пользователь" (LRU + TTL) для REST и WebSocket.
+
+    Снимает запрос Token + User с каждого аутентифицированного запроса.
+    Удаление токена и сохранение пользователя (роль, is_active) сбрасывают
+    записи сигналами (accounts/signals.py). Без общего кэша это действует
+    только в текущем процессе — другие видят изменения не позже чем через
+    AUTH_TOKEN_CACHE_TTL секунд. С AUTH_TOKEN_CACHE_ALIAS записи хранятся в
+    общем Django-кэше, и сброс сразу виден всем воркерам.
+    """
+    shared_key_prefix = 'auth:token:'
+
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def ttl(self):
+        return getattr(settings, 'AUTH_TOKEN_CACHE_TTL', 60)
+
+    @property
+    def max_entries(self):
+        return getattr(settings, 'AUTH_TOKEN_CACHE_MAX_ENTRIES', 10000)
+
+    @property
+    def shared_cache(self):
+        alias = getattr(settings, 'AUTH_TOKEN_CACHE_ALIAS', None)
+        return caches[alias] if alias else None
+
+    def resolve(self, key):
+        """Возвращает пользователя по ключу токена или None, если токена нет."""
+        shared = self.shared_cache
+        if shared is not None:
+            return self._resolve_shared(shared, key)
+
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                # Копия, чтобы изменения request.user не попадали в кэш
+                return copy.copy(entry[1])
+            self.misses += 1
+
+        try:
+            user = Token.objects.select_related('user').get(key=key).user
+        except Token.DoesNotExist:
+            return None
+
+        with self._lock:
+            self._entries[key] = (now + self.ttl, user)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return copy.copy(user)
+
+    def _resolve_shared(self, shared, key):
+        user = shared.get(self.shared_key_prefix + key)
+        with self._lock:
+            if user is not None:
+                self.hits += 1
+                return user
+            self.misses += 1
+
+        try:
+            user = Token.objects.select_related('user').get(key=key).user
+        except Token.DoesNotExist:
+            return None
+        shared.set(self.shared_key_prefix + key, user, self.ttl)
+        return user
+
+    def purge(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+        shared = self.shared_cache
+        if shared is not None:
+            shared.delete(self.shared_key_prefix + key)
+
+    def purge_user(self, user_id):
+        """Удаляет из кэша все токены пользователя."""
+        with self._lock:
+            for key in [k for k, (_, user) in self._entries.items() if user.pk == user_id]:
+                del self._entries[key]
+        shared = self.shared_cache
+        if shared is not None:
+            keys = Token.objects.filter(user_id=user_id).values_list('key', flat=True)
+            shared.delete_many([self.shared_key_prefix + key for key in keys])
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'size': len(self._entries)}
+
+
+token_cache = TokenUserCache()
+
+
+def get_user_for_token(key):
+    return token_cache.resolve(key)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication, которая берёт пользователя из TokenUserCache."""
+
+    def authenticate_credentials(self, key):
+        user = get_user_for_token(key)
+        if user is None:
+            raise AuthenticationFailed(_('Invalid token.'))
+
+        if not user.is_active:
+            raise AuthenticationFailed(_('User inactive or deleted.'))
+
+        return (user, key)
@@ -1,9 +1,10 @@
 from channels.auth import AuthMiddlewareStack
-from rest_framework.authtoken.models import Token
 from channels.db import database_sync_to_async
 from django.contrib.auth.models import AnonymousUser
 from urllib.parse import parse_qs
 
+from .authentication import get_user_for_token
+
 
 @database_sync_to_async
 def get_user_from_token(scope):
@@ -19,12 +20,10 @@ def get_user_from_token(scope):
         token_key = query_params['token'][0]
 
     if token_key:
-        try:
-            # Шукаємо токен у базі даних
-            token = Token.objects.get(key=token_key)
-            return token.user
-        except Token.DoesNotExist:
-            pass
+        # Шукаємо користувача через спільний кеш токенів (БД лише при промаху)
+        user = get_user_for_token(token_key)
+        if user is not None:
+            return user
 
     return AnonymousUser()
 
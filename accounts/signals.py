@@ -0,0 +1,30 @@
+# accounts/signals.py
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from .authentication import token_cache
+
+User = get_user_model()
+
+
+@receiver(post_delete, sender=Token)
+def purge_deleted_token(sender, instance, **kwargs):
+    """Удалённый токен (логаут, админка, удаление пользователя) перестаёт приниматься сразу."""
+    token_cache.purge(instance.key)
+    transaction.on_commit(lambda: token_cache.purge(instance.key))
+
+
+@receiver(post_save, sender=User)
+def purge_changed_user(sender, instance, update_fields=None, **kwargs):
+    """
+    Роль, is_active и прочие поля пользователя берутся из кэша токенов —
+    после сохранения его записи сбрасываются (сразу и ещё раз после коммита,
+    чтобы другой воркер не успел закэшировать старое состояние).
+    """
+    if update_fields is not None and set(update_fields) <= {'last_login'}:
+        return
+    token_cache.purge_user(instance.pk)
+    transaction.on_commit(lambda: token_cache.purge_user(instance.pk))
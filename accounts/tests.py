@@ -1,3 +1,82 @@
-from django.test import TestCase
+from django.contrib.auth import get_user_model
+from django.test import override_settings
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APITestCase
 
-# Create your tests here.
+from .authentication import TokenUserCache, token_cache
+from .middleware import get_user_from_token
+
+User = get_user_model()
+
+
+class TokenCacheTests(APITestCase):
+    """Кэш "токен → пользователь" для REST и WebSocket."""
+
+    def setUp(self):
+        token_cache.clear()
+        self.user = User.objects.create_user(username='agent', password='pass', role='user')
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def test_repeated_requests_skip_token_lookup(self):
+        self.assertEqual(self.client.get('/api/auth/profile/').status_code, 200)
+
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/auth/profile/')
+
+        self.assertEqual(response.data['username'], 'agent')
+        self.assertEqual(token_cache.stats(), {'hits': 1, 'misses': 1, 'size': 1})
+
+    def test_logout_purges_cached_token(self):
+        self.client.get('/api/auth/profile/')
+
+        self.assertEqual(self.client.post('/api/auth/logout/').status_code, 200)
+
+        self.assertEqual(self.client.get('/api/auth/profile/').status_code, 401)
+
+    def test_token_deletion_and_user_changes_purge_cache(self):
+        self.client.get('/api/auth/profile/')
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get('/api/auth/profile/').status_code, 401)
+
+        self.user.is_active = True
+        self.user.save()
+        self.client.get('/api/auth/profile/')
+        # Удаление токена в обход LogoutView (админка, скрипты)
+        self.token.delete()
+        self.assertEqual(self.client.get('/api/auth/profile/').status_code, 401)
+
+    @override_settings(
+        CACHES={
+            'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+            'tokens': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'tokens'},
+        },
+        AUTH_TOKEN_CACHE_ALIAS='tokens',
+    )
+    def test_shared_cache_purges_other_processes(self):
+        # Кэш другого воркера: собственный объект, общий лишь Django-кэш
+        other_process = TokenUserCache()
+        self.assertEqual(other_process.resolve(self.token.key).pk, self.user.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(other_process.resolve(self.token.key).role, 'user')
+
+        self.user.role = 'editor'
+        self.user.save()
+        self.assertEqual(other_process.resolve(self.token.key).role, 'editor')
+
+        self.assertEqual(self.client.post('/api/auth/logout/').status_code, 200)
+        self.assertIsNone(other_process.resolve(self.token.key))
+
+    def test_websocket_middleware_shares_cache(self):
+        scope = {'query_string': f'token={self.token.key}'.encode()}
+        self.client.get('/api/auth/profile/')
+
+        user = get_user_from_token.func(scope)
+
+        self.assertEqual(user.pk, self.user.pk)
+        self.assertEqual(token_cache.stats()['hits'], 1)
+
+    def test_unknown_token(self):
+        self.client.credentials(HTTP_AUTHORIZATION='Token unknown')
+        self.assertEqual(self.client.get('/api/auth/profile/').status_code, 401)
@@ -81,6 +81,6 @@ class LogoutView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def post(self, request):
-        # Удаляем токен
+        # Запись в кэше аутентификации сбрасывает сигнал post_delete (accounts/signals.py)
         Token.objects.filter(user=request.user).delete()
         return Response({"success": "Logged out successfully"}, status=status.HTTP_200_OK)
\ No newline at end of file
@@ -0,0 +1,86 @@
+# benchmarks/chat_connect.py
+"""
+Порівнює вартість підключення ChatConsumer у режимах доставки 'chat' та 'user':
+затримку connect та кількість підписок у channel layer (= підписок у Redis
+для RedisPubSubChannelLayer).
+
+    python -m benchmarks.chat_connect --chats 10 100 500 --sockets 50
+"""
+import argparse
+import asyncio
+import json
+
+from benchmarks.common import Timer, bulk_chats, bulk_users, percentiles, setup_django, teardown_django
+
+
+def provision(chats_per_user, sockets):
+    """Створює користувачів з токенами та chats_per_user чатів на кожного."""
+    from django.contrib.auth import get_user_model
+
+    get_user_model().objects.all().delete()
+    users = bulk_users(sockets)
+    for user, _ in users:
+        bulk_chats([[user.id]] * chats_per_user)
+    return [key for _, key in users]
+
+
+async def connect_all(application, tokens):
+    from channels.testing import WebsocketCommunicator
+
+    samples = []
+    communicators = []
+    for key in tokens:
+        communicator = WebsocketCommunicator(application, f'/ws/chat/0/?token={key}')
+        with Timer() as timer:
+            connected, _ = await communicator.connect()
+        assert connected
+        samples.append(timer.elapsed)
+        communicators.append(communicator)
+
+    for communicator in communicators:
+        await communicator.disconnect()
+    return samples
+
+
+def run(chat_counts, sockets):
+    from channels.layers import get_channel_layer
+    from channels.routing import URLRouter
+    from django.test.utils import override_settings
+    from accounts.middleware import TokenAuthMiddlewareStack
+    from chat.routing import websocket_urlpatterns
+
+    application = TokenAuthMiddlewareStack(URLRouter(websocket_urlpatterns))
+    results = []
+    for chats_per_user in chat_counts:
+        tokens = provision(chats_per_user, sockets)
+        for mode in ('chat', 'user'):
+            with override_settings(CHAT_DELIVERY_MODE=mode):
+                layer = get_channel_layer()
+                layer.reset_counters()
+                samples = asyncio.run(connect_all(application, tokens))
+                results.append({
+                    'mode': mode,
+                    'chats_per_user': chats_per_user,
+                    'sockets': sockets,
+                    'connect': percentiles(samples),
+                    # +1: підписка на власний канал сокета
+                    'subscriptions_per_socket': layer.counters['group_add'] / sockets + 1,
+                })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--chats', type=int, nargs='+', default=[10, 100, 500])
+    parser.add_argument('--sockets', type=int, default=50)
+    args = parser.parse_args()
+
+    old_name = setup_django()
+    try:
+        print(json.dumps(run(args.chats, args.sockets), indent=2))
+    finally:
+        teardown_django(old_name)
+
+
+if __name__ == '__main__':
+    main()
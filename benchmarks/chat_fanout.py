@@ -0,0 +1,94 @@
+# benchmarks/chat_fanout.py
+"""
+CPU на одну розсилку повідомлення для груп різного розміру: старий формат
+(кожен отримувач робить json.dumps своєї копії події) проти нового (кадр
+кодується відправником один раз, отримувачі пересилають рядок без змін).
+
+    python -m benchmarks.chat_fanout --sizes 10 100 1000 --messages 200
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+
+import django
+
+
+async def _noop_send(*args, **kwargs):
+    pass
+
+
+def make_receivers(count):
+    from chat.consumers import ChatConsumer
+
+    receivers = []
+    for _ in range(count):
+        consumer = ChatConsumer()
+        consumer.send = _noop_send
+        receivers.append(consumer)
+    return receivers
+
+
+def sample_payload(i):
+    return {
+        'id': i,
+        'chat': 1,
+        'sender': {'id': 7, 'username': 'agent'},
+        'content': 'Добрий день! Замовлення #%d відправлено, трек-номер надішлемо окремо.' % i,
+        'timestamp': '2026-10-18T12:00:00.000000+00:00',
+    }
+
+
+async def fan_out(receivers, messages, encode_once):
+    from chat.encoding import dumps
+
+    for i in range(messages):
+        payload = sample_payload(i)
+        if encode_once:
+            event = {'type': 'chat.message', 'frame': dumps({
+                'message': payload, 'sender': 'agent',
+                'timestamp': payload['timestamp'], 'chat_id': 1,
+            })}
+        else:
+            event = {'type': 'chat.message', 'message': payload, 'sender': 'agent',
+                     'timestamp': payload['timestamp'], 'chat_id': 1}
+        for receiver in receivers:
+            # Channel layer доставляє кожному отримувачу власну копію події
+            await receiver.chat_message(dict(event))
+
+
+def measure(size, messages, encode_once):
+    receivers = make_receivers(size)
+    start = time.process_time()
+    asyncio.run(fan_out(receivers, messages, encode_once))
+    return (time.process_time() - start) / messages
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 1000])
+    parser.add_argument('--messages', type=int, default=200)
+    args = parser.parse_args()
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'crm_backend.settings')
+    django.setup()
+
+    from chat import encoding
+
+    results = []
+    for size in args.sizes:
+        per_receiver = measure(size, args.messages, encode_once=False)
+        encode_once = measure(size, args.messages, encode_once=True)
+        results.append({
+            'group_size': size,
+            'encoder': 'orjson' if encoding.orjson is not None else 'json',
+            'per_receiver_encode_us': round(per_receiver * 1e6, 1),
+            'encode_once_us': round(encode_once * 1e6, 1),
+            'speedup': round(per_receiver / encode_once, 2) if encode_once else None,
+        })
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
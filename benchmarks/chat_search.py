@@ -0,0 +1,99 @@
+# benchmarks/chat_search.py
+"""
+Затримка повнотекстового пошуку (chat.search) на великій історії повідомлень.
+
+    python -m benchmarks.chat_search --messages 1000000 --chats 2000 --queries 200
+"""
+import argparse
+import json
+import random
+
+from benchmarks.common import Timer, percentiles, setup_django, teardown_django
+
+VOCABULARY = (
+    'заказ доставка счёт оплата возврат склад менеджер клиент договор скидка '
+    'накладная курьер адрес телефон претензия гарантия товар цена остаток отгрузка '
+    'invoice shipping refund warehouse discount contract delivery payment order'
+).split()
+
+
+def provision(messages, chats, member_chats, batch_size=10000):
+    from django.contrib.auth import get_user_model
+    from chat.models import Chat, Message
+
+    User = get_user_model()
+    rng = random.Random(42)
+    reader, writer = User.objects.bulk_create([User(username='reader'), User(username='writer')])
+
+    chat_objs = Chat.objects.bulk_create([Chat() for _ in range(chats)])
+    through = Chat.participants.through
+    user_column = Chat.participants.field.m2m_reverse_name()
+    rows = [through(chat_id=chat.id, **{user_column: writer.id}) for chat in chat_objs]
+    rows += [through(chat_id=chat.id, **{user_column: reader.id}) for chat in chat_objs[:member_chats]]
+    through.objects.bulk_create(rows)
+
+    chat_ids = [chat.id for chat in chat_objs]
+    created = 0
+    while created < messages:
+        count = min(batch_size, messages - created)
+        Message.objects.bulk_create([
+            Message(
+                chat_id=rng.choice(chat_ids),
+                sender_id=writer.id,
+                content=' '.join(rng.choices(VOCABULARY, k=rng.randint(4, 16))) + f' #{created + i}',
+            )
+            for i in range(count)
+        ])
+        created += count
+    return reader
+
+
+def run(args):
+    from chat.search import search_messages
+
+    with Timer() as timer:
+        reader = provision(args.messages, args.chats, args.member_chats)
+    provision_seconds = timer.elapsed
+
+    rng = random.Random(7)
+    single, double, prefix = [], [], []
+    for _ in range(args.queries):
+        for samples, query in (
+            (single, rng.choice(VOCABULARY)),
+            (double, ' '.join(rng.sample(VOCABULARY, 2))),
+            (prefix, rng.choice(VOCABULARY)[:3]),
+        ):
+            with Timer() as timer:
+                search_messages(reader, query, page_size=args.page_size)
+            samples.append(timer.elapsed)
+
+    return {
+        'messages': args.messages,
+        'chats': args.chats,
+        'reader_chats': args.member_chats,
+        'provision_seconds': round(provision_seconds, 1),
+        'single_term': percentiles(single),
+        'two_terms': percentiles(double),
+        'prefix': percentiles(prefix),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--messages', type=int, default=200000)
+    parser.add_argument('--chats', type=int, default=2000)
+    parser.add_argument('--member-chats', type=int, default=100,
+                        help="У скількох чатах бере участь користувач, що шукає.")
+    parser.add_argument('--queries', type=int, default=100)
+    parser.add_argument('--page-size', type=int, default=50)
+    args = parser.parse_args()
+
+    old_name = setup_django()
+    try:
+        print(json.dumps(run(args), indent=2))
+    finally:
+        teardown_django(old_name)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+# benchmarks/common.py
+"""
+Спільне оточення для бенчмарків: тимчасова тестова БД та in-memory channel layer,
+щоб результати можна було порівнювати між збірками без Redis.
+
+Запуск: python -m benchmarks.<назва> [--help]
+"""
+import os
+import statistics
+import time
+
+import django
+
+
+def setup_django():
+    """Ініціалізує Django, створює тимчасову БД і підміняє channel layer."""
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'crm_backend.settings')
+    django.setup()
+
+    from django.db import connection
+    from django.test.utils import override_settings, setup_test_environment
+
+    setup_test_environment()
+    override_settings(
+        CHANNEL_LAYERS={'default': {'BACKEND': 'benchmarks.common.CountingChannelLayer'}},
+        DEBUG=False,
+    ).enable()
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    return old_name
+
+
+def teardown_django(old_name):
+    from django.db import connection
+
+    connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+def make_counting_layer():
+    from channels.layers import InMemoryChannelLayer
+
+    class _CountingChannelLayer(InMemoryChannelLayer):
+        """
+        In-memory layer, що рахує операції з групами. RedisPubSubChannelLayer
+        робить одну підписку на канал сокета плюс одну на кожен group_add,
+        тому ці лічильники відповідають кількості підписок у Redis.
+        """
+        counters = {'group_add': 0, 'group_send': 0}
+
+        async def group_add(self, group, channel):
+            type(self).counters['group_add'] += 1
+            return await super().group_add(group, channel)
+
+        async def group_send(self, group, message):
+            type(self).counters['group_send'] += 1
+            return await super().group_send(group, message)
+
+        @classmethod
+        def reset_counters(cls):
+            for key in cls.counters:
+                cls.counters[key] = 0
+
+    return _CountingChannelLayer
+
+
+def __getattr__(name):
+    # Клас створюється ліниво: channels імпортується лише після django.setup()
+    if name == 'CountingChannelLayer':
+        globals()[name] = make_counting_layer()
+        return globals()[name]
+    raise AttributeError(name)
+
+
+def bulk_users(count, prefix='bench'):
+    """Створює користувачів з токенами пачкою (без хешування паролів). Повертає [(user, key)]."""
+    from django.contrib.auth import get_user_model
+    from rest_framework.authtoken.models import Token
+
+    User = get_user_model()
+    users = User.objects.bulk_create(
+        [User(username=f'{prefix}_{i}', role='user') for i in range(count)]
+    )
+    tokens = Token.objects.bulk_create(
+        [Token(user=user, key=f'{user.id:040d}') for user in users]
+    )
+    return [(user, token.key) for user, token in zip(users, tokens)]
+
+
+def bulk_chats(member_lists, is_group_chat=False):
+    """
+    Створює чати пачкою: по одному на кожен список ID учасників. bulk_create
+    не викликає m2m_changed, тому ReadReceipt теж створюються тут.
+    """
+    from chat.models import Chat, ReadReceipt
+
+    chats = Chat.objects.bulk_create(
+        [Chat(is_group_chat=is_group_chat) for _ in member_lists]
+    )
+    through = Chat.participants.through
+    user_column = Chat.participants.field.m2m_reverse_name()
+    memberships, receipts = [], []
+    for chat, member_ids in zip(chats, member_lists):
+        for user_id in member_ids:
+            memberships.append(through(chat_id=chat.id, **{user_column: user_id}))
+            receipts.append(ReadReceipt(chat_id=chat.id, user_id=user_id))
+    through.objects.bulk_create(memberships, batch_size=5000)
+    ReadReceipt.objects.bulk_create(receipts, batch_size=5000)
+    return chats
+
+
+def percentiles(samples):
+    """p50/p95/p99 та середнє у мілісекундах."""
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+
+    def pick(q):
+        return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000, 3)
+
+    return {
+        'count': len(ordered),
+        'mean_ms': round(statistics.fmean(ordered) * 1000, 3),
+        'p50_ms': pick(0.50),
+        'p95_ms': pick(0.95),
+        'p99_ms': pick(0.99),
+    }
+
+
+class Timer:
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed = time.perf_counter() - self.start
@@ -0,0 +1,124 @@
+# benchmarks/task_bulk.py
+"""
+Пропускна здатність пакетних операцій над задачами (tasks/bulk.py) проти
+послідовних запитів до TaskViewSet: створення, перенесення в іншу колонку
+та призначення виконавця для --items задач. Для кожного способу — час,
+кількість SQL-запитів і задач на секунду.
+
+    python -m benchmarks.task_bulk --items 200 500
+"""
+import argparse
+import json
+
+from benchmarks.common import Timer, setup_django, teardown_django
+
+
+def provision():
+    from django.contrib.auth import get_user_model
+    from tasks.models import Status
+    from tasks.statuses import status_registry
+
+    User = get_user_model()
+    admin = User.objects.create(username='bench_admin', role='admin')
+    member = User.objects.create(username='bench_member', role='user')
+    todo = Status.objects.create(title='TODO', order=0)
+    done = Status.objects.create(title='DONE', order=1)
+    status_registry.invalidate()
+    return admin, member, todo, done
+
+
+def measure(callback):
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    with CaptureQueriesContext(connection) as queries, Timer() as timer:
+        callback()
+    return timer.elapsed, len(queries)
+
+
+def summary(items, elapsed, queries):
+    return {
+        'seconds': round(elapsed, 3),
+        'queries': queries,
+        'tasks_per_second': round(items / elapsed, 1) if elapsed else None,
+    }
+
+
+def run_size(client, admin, member, todo, done, items):
+    from tasks.models import Task
+
+    Task.objects.all().delete()
+    results = {}
+
+    def per_item_create():
+        for i in range(items):
+            response = client.post('/api/tasks/tasks/', {'title': f'single {i}', 'status_id': todo.id}, format='json')
+            assert response.status_code == 201, response.data
+
+    def bulk_create():
+        payload = {'tasks': [{'title': f'bulk {i}', 'status_id': todo.id} for i in range(items)]}
+        response = client.post('/api/tasks/tasks/bulk/', payload, format='json')
+        assert response.status_code == 201, response.data
+
+    results['create'] = {
+        'per_item': summary(items, *measure(per_item_create)),
+        'bulk': summary(items, *measure(bulk_create)),
+    }
+
+    single_ids = list(Task.objects.filter(title__startswith='single').values_list('id', flat=True))
+    bulk_ids = list(Task.objects.filter(title__startswith='bulk').values_list('id', flat=True))
+
+    def per_item_move():
+        for task_id in single_ids:
+            response = client.patch(f'/api/tasks/tasks/{task_id}/', {'status_id': done.id}, format='json')
+            assert response.status_code == 200, response.data
+
+    def bulk_move():
+        response = client.post('/api/tasks/tasks/bulk/move/', {'ids': bulk_ids, 'status_id': done.id}, format='json')
+        assert response.status_code == 200, response.data
+
+    results['move'] = {
+        'per_item': summary(items, *measure(per_item_move)),
+        'bulk': summary(items, *measure(bulk_move)),
+    }
+
+    def per_item_assign():
+        # TaskViewSet не змінює виконавців існуючої задачі — порівнюємо з assigned_to.add() по одній
+        for task in Task.objects.filter(id__in=single_ids):
+            task.assigned_to.add(member)
+
+    def bulk_assign():
+        response = client.post('/api/tasks/tasks/bulk/assign/', {'ids': bulk_ids, 'add': [member.id]}, format='json')
+        assert response.status_code == 200, response.data
+
+    results['assign'] = {
+        'per_item': summary(items, *measure(per_item_assign)),
+        'bulk': summary(items, *measure(bulk_assign)),
+    }
+    return results
+
+
+def run(sizes):
+    from rest_framework.test import APIClient
+
+    admin, member, todo, done = provision()
+    client = APIClient()
+    client.force_authenticate(admin)
+    return {items: run_size(client, admin, member, todo, done, items) for items in sizes}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--items', type=int, nargs='+', default=[200],
+                        help="Скільки задач обробляти за один прогін.")
+    args = parser.parse_args()
+
+    old_name = setup_django()
+    try:
+        print(json.dumps(run(args.items), indent=2))
+    finally:
+        teardown_django(old_name)
+
+
+if __name__ == '__main__':
+    main()
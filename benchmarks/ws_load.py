@@ -0,0 +1,210 @@
+# benchmarks/ws_load.py
+"""
+Навантажувальний тест ChatConsumer на asyncio.
+
+Створює користувачів і чати пачками, відкриває тисячі одночасних сокетів з
+токенами (in-process через ASGI, in-memory channel layer — без Redis),
+надсилає send_message та mark_as_read із заданою частотою і звітує у JSON
+перцентилі часу підключення та затримки send → receive для кожного отримувача.
+
+    python -m benchmarks.ws_load --users 2000 --chat-size 10 --rate 200 --duration 10
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+
+from benchmarks.common import bulk_chats, bulk_users, percentiles, setup_django, teardown_django
+
+LOAD_PREFIX = 'load:'
+
+
+class Client:
+    def __init__(self, communicator, user_id, chat_id):
+        self.communicator = communicator
+        self.user_id = user_id
+        self.chat_id = chat_id
+
+
+class LoadRun:
+    def __init__(self, args):
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.sent_at = {}
+        self.fanout_samples = []
+        self.connect_samples = []
+        self.delivered_messages = set()
+        self.started_at = None
+        self.last_delivery_at = None
+        self.counters = {'sent': 0, 'mark_as_read': 0, 'delivered': 0, 'connect_failed': 0}
+
+    # --- Підготовка ---
+
+    def provision(self):
+        users = bulk_users(self.args.users, prefix='load')
+        size = self.args.chat_size
+        groups = [users[i:i + size] for i in range(0, len(users), size)]
+        chats = bulk_chats([[user.id for user, _ in group] for group in groups], is_group_chat=size > 2)
+        return [
+            (user.id, key, chat.id)
+            for chat, group in zip(chats, groups)
+            for user, key in group
+        ]
+
+    # --- Сокети ---
+
+    async def connect(self, application, user_id, key, chat_id):
+        from channels.testing import WebsocketCommunicator
+
+        communicator = WebsocketCommunicator(application, f'/ws/chat/{chat_id}/?token={key}')
+        start = time.perf_counter()
+        connected, _ = await communicator.connect(timeout=self.args.timeout)
+        if not connected:
+            self.counters['connect_failed'] += 1
+            return None
+        self.connect_samples.append(time.perf_counter() - start)
+        return Client(communicator, user_id, chat_id)
+
+    async def connect_all(self, application, accounts):
+        clients = []
+        step = self.args.connect_concurrency
+        for i in range(0, len(accounts), step):
+            batch = await asyncio.gather(*(
+                self.connect(application, *account) for account in accounts[i:i + step]
+            ))
+            clients.extend(client for client in batch if client is not None)
+        return clients
+
+    async def read_frames(self, client):
+        while True:
+            try:
+                raw = await client.communicator.receive_from(timeout=3600)
+            except (asyncio.TimeoutError, asyncio.CancelledError):
+                return
+            received_at = time.perf_counter()
+            content = json.loads(raw).get('message', {}).get('content', '')
+            if content.startswith(LOAD_PREFIX):
+                sent_at = self.sent_at.get(content)
+                if sent_at is not None:
+                    self.fanout_samples.append(received_at - sent_at)
+                    self.counters['delivered'] += 1
+                    self.delivered_messages.add(content)
+                    self.last_delivery_at = received_at
+
+    # --- Навантаження ---
+
+    async def drive(self, clients):
+        interval = 1.0 / self.args.rate
+        deadline = time.perf_counter() + self.args.duration
+        next_at = time.perf_counter()
+        seq = 0
+        while time.perf_counter() < deadline:
+            client = self.rng.choice(clients)
+            content = f'{LOAD_PREFIX}{seq}'
+            self.sent_at[content] = time.perf_counter()
+            await client.communicator.send_json_to({
+                'command': 'send_message', 'chat_id': client.chat_id, 'content': content,
+            })
+            self.counters['sent'] += 1
+            seq += 1
+
+            if self.rng.random() < self.args.read_ratio:
+                reader = self.rng.choice(clients)
+                await reader.communicator.send_json_to({'command': 'mark_as_read', 'chat_id': reader.chat_id})
+                self.counters['mark_as_read'] += 1
+
+            next_at += interval
+            await asyncio.sleep(max(0.0, next_at - time.perf_counter()))
+
+    async def run(self, application, accounts):
+        clients = await self.connect_all(application, accounts)
+        readers = [asyncio.create_task(self.read_frames(client)) for client in clients]
+
+        started = self.started_at = time.perf_counter()
+        await self.drive(clients)
+        elapsed = time.perf_counter() - started
+        # Даємо доставити "хвіст" розсилок
+        await asyncio.sleep(self.args.drain)
+
+        for task in readers:
+            task.cancel()
+        await asyncio.gather(*readers, return_exceptions=True)
+        for client in clients:
+            await client.communicator.disconnect()
+        return len(clients), elapsed
+
+    def report(self, connected, elapsed):
+        from django.conf import settings
+        from chat.throttling import consumer_metrics
+
+        # Кадр отримують усі учасники чату, включно з відправником
+        expected = self.counters['sent'] * self.args.chat_size
+        return {
+            'config': {
+                'users': self.args.users,
+                'chat_size': self.args.chat_size,
+                'target_rate': self.args.rate,
+                'duration': self.args.duration,
+                'read_ratio': self.args.read_ratio,
+                'persistence': settings.CHAT_PERSISTENCE_MODE,
+            },
+            'sockets': connected,
+            'counters': self.counters,
+            'achieved_rate': round(self.counters['sent'] / elapsed, 1) if elapsed else None,
+            # Скільки повідомлень на секунду реально оброблено (збережено/розіслано)
+            'delivered_rate': round(
+                len(self.delivered_messages) / (self.last_delivery_at - self.started_at), 1
+            ) if self.last_delivery_at else None,
+            'delivery_ratio': round(self.counters['delivered'] / expected, 4) if expected else None,
+            'connect': percentiles(self.connect_samples),
+            'fanout_latency': percentiles(self.fanout_samples),
+            # Відхилені лімітами команди та відкинуті кадри повільних клієнтів
+            'consumer_metrics': consumer_metrics.stats(),
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--chat-size', type=int, default=10)
+    parser.add_argument('--rate', type=float, default=100, help="send_message на секунду (сумарно).")
+    parser.add_argument('--duration', type=float, default=10, help="Тривалість навантаження, секунд.")
+    parser.add_argument('--read-ratio', type=float, default=0.5,
+                        help="Скільки mark_as_read припадає на одне send_message.")
+    parser.add_argument('--connect-concurrency', type=int, default=200)
+    parser.add_argument('--drain', type=float, default=2.0)
+    parser.add_argument('--timeout', type=float, default=30.0)
+    parser.add_argument('--persistence', choices=['sync', 'pipeline'], default=None,
+                        help="Перевизначити CHAT_PERSISTENCE_MODE.")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help="Записати JSON-звіт у файл замість stdout.")
+    args = parser.parse_args()
+
+    old_name = setup_django()
+    try:
+        from channels.routing import URLRouter
+        from django.test.utils import override_settings
+        from accounts.middleware import TokenAuthMiddlewareStack
+        from chat.routing import websocket_urlpatterns
+
+        if args.persistence:
+            override_settings(CHAT_PERSISTENCE_MODE=args.persistence).enable()
+
+        load = LoadRun(args)
+        accounts = load.provision()
+        application = TokenAuthMiddlewareStack(URLRouter(websocket_urlpatterns))
+        connected, elapsed = asyncio.run(load.run(application, accounts))
+        report = json.dumps(load.report(connected, elapsed), indent=2)
+    finally:
+        teardown_django(old_name)
+
+    if args.output:
+        with open(args.output, 'w') as fh:
+            fh.write(report)
+    else:
+        print(report)
+
+
+if __name__ == '__main__':
+    main()
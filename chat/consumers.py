@@ -1,10 +1,32 @@
+import asyncio
 import json
+import logging
+from django.conf import settings
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
 from django.contrib.auth import get_user_model
+from django.utils import timezone
 from .models import Chat, Message, ReadReceipt  # Додано імпорт ReadReceipt
+from .encoding import dumps
+from .membership import get_member_ids, is_member, membership
+from .pipeline import (
+    PERSISTENCE_PIPELINE, get_persistence_mode, message_pipeline, new_ulid, normalize_ulid,
+)
+from .receipts import receipt_buffer
+from .presence import call_async, contact_ids, presence, presence_group_name
+from .throttling import consumer_metrics, socket_bucket, user_buckets
+from .delivery import (
+    DELIVERY_MODE_USER, chat_group_name, get_delivery_mode, get_target_groups,
+    group_send_many, user_group_name,
+)
 
 User = get_user_model()
+logger = logging.getLogger(__name__)
+
+SLOW_CONSUMER_DROP = 'drop'
+SLOW_CONSUMER_DISCONNECT = 'disconnect'
+# Код закриття для клієнта, що не встигає читати кадри
+CLOSE_CODE_SLOW_CONSUMER = 4008
 
 
 class ChatConsumer(AsyncWebsocketConsumer):
@@ -16,13 +38,18 @@ class ChatConsumer(AsyncWebsocketConsumer):
             return
 
         self.chat_group_names = []
+        self.socket_bucket = socket_bucket()
+        self.start_outbound()
 
-        # Отримуємо ID чатів, у яких бере участь користувач
-        chat_ids = await self.get_user_chat_ids(self.user)
+        if get_delivery_mode() == DELIVERY_MODE_USER:
+            # Одна група на сокет: підключення не залежить від кількості чатів
+            self.chat_group_names.append(user_group_name(self.user.id))
+        else:
+            # Отримуємо ID чатів, у яких бере участь користувач
+            chat_ids = await self.get_user_chat_ids(self.user)
+            self.chat_group_names.extend(chat_group_name(chat_id) for chat_id in chat_ids)
 
-        for chat_id in chat_ids:
-            group_name = f'chat_{chat_id}'
-            self.chat_group_names.append(group_name)
+        for group_name in self.chat_group_names:
             await self.channel_layer.group_add(
                 group_name,
                 self.channel_name
@@ -30,8 +57,30 @@ class ChatConsumer(AsyncWebsocketConsumer):
 
         await self.accept()
 
+        # Присутність живе лише в пам'яті (chat/presence.py), БД не зачіпається
+        self.presence_subscriptions = set()
+        await call_async(presence.connect, self.user.id)
+        await presence.publish(self.channel_layer, self.user.id)
+
     async def disconnect(self, close_code):
-        for group_name in self.chat_group_names:
+        self.stop_outbound()
+
+        if hasattr(self, 'presence_subscriptions'):
+            if await call_async(presence.disconnect, self.user.id):
+                await presence.publish(self.channel_layer, self.user.id)
+            for user_id in self.presence_subscriptions:
+                await self.channel_layer.group_discard(presence_group_name(user_id), self.channel_name)
+
+        # Гарантовано записуємо відкладені відмітки "прочитано" цього користувача
+        if getattr(self, 'user', None) is not None and self.user.is_authenticated:
+            await database_sync_to_async(receipt_buffer.flush)(user_id=self.user.id)
+
+        # Дописуємо буфер конвеєра, якщо цього вимагають гарантії збереження; учасники
+        # (і ще підключені сокети відправника) отримують 'persisted' з id та seq
+        if message_pipeline.durability == 'flush' and message_pipeline.pending_count():
+            await message_pipeline.flush_and_notify(self.channel_layer)
+
+        for group_name in getattr(self, 'chat_group_names', []):
             await self.channel_layer.group_discard(
                 group_name,
                 self.channel_name
@@ -40,7 +89,7 @@ class ChatConsumer(AsyncWebsocketConsumer):
     async def receive(self, text_data):
         """
         Обробляє вхідні повідомлення з WebSocket.
-        Підтримує команди 'send_message' та 'mark_as_read'.
+        Підтримує команди 'send_message', 'mark_as_read', 'resume', 'presence' та 'typing'.
         """
         data = json.loads(text_data)
         command = data.get('command')
@@ -51,9 +100,20 @@ class ChatConsumer(AsyncWebsocketConsumer):
             await self.close()
             return
 
+        if not self.allow_command(user):
+            await self.send(text_data=dumps({
+                'type': 'throttled',
+                'command': command,
+                'retry_after': round(self.throttle_retry_after, 3),
+            }))
+            return
+
         if command == 'send_message':
             message_content = data.get('content')
-            await self.send_chat_message(chat_id, user.id, message_content)
+            if get_persistence_mode() == PERSISTENCE_PIPELINE:
+                await self.enqueue_chat_message(chat_id, user, message_content, data.get('client_id'))
+            else:
+                await self.send_chat_message(chat_id, user, message_content)
 
         # 💡 НОВИЙ ОБРОБНИК: Позначення чату як прочитаного
         elif command == 'mark_as_read':
@@ -61,10 +121,112 @@ class ChatConsumer(AsyncWebsocketConsumer):
                 # Викликаємо асинхронний метод, який оновлює базу даних
                 await self.mark_chat_as_read(int(chat_id), user)
 
+        # Heartbeat присутності та (від)підписка на статус інших користувачів
+        elif command == 'presence':
+            await self.handle_presence(data.get('subscribe'), data.get('unsubscribe'))
+
+        elif command == 'typing':
+            await self.handle_typing(chat_id, bool(data.get('is_typing', True)))
+
+        # Дозавантаження пропущеного після перепідключення: {'chats': {chat_id: last_seq}}
+        elif command == 'resume':
+            chats = data.get('chats')
+            if isinstance(chats, dict):
+                await self.resume_chats(chats, user)
+
+    # -----------------------------------------------------------
+    # ОБМЕЖЕННЯ ВХІДНИХ КОМАНД І ЧЕРГА ВИХІДНИХ КАДРІВ
+    # -----------------------------------------------------------
+
+    def allow_command(self, user):
+        """Перевіряє ліміти сокета (CHAT_WS_SOCKET_*) і користувача (CHAT_WS_USER_*)."""
+        bucket = getattr(self, 'socket_bucket', None)
+        if bucket is not None and not bucket.consume():
+            consumer_metrics.incr('throttled_socket')
+            self.throttle_retry_after = bucket.retry_after()
+            return False
+
+        bucket = user_buckets.get(user.id)
+        if not bucket.consume():
+            consumer_metrics.incr('throttled_user')
+            self.throttle_retry_after = bucket.retry_after()
+            return False
+        return True
+
+    def start_outbound(self):
+        """
+        Обмежена черга вихідних кадрів (CHAT_WS_OUTBOUND_QUEUE_SIZE) і задача,
+        що пише їх у сокет. Якщо клієнт читає повільніше, ніж надходять кадри,
+        спрацьовує CHAT_WS_SLOW_CONSUMER_POLICY: 'drop' відкидає нові кадри
+        (клієнт отримає 'overflow' і дозавантажить пропущене командою
+        'resume'), 'disconnect' закриває з'єднання.
+        """
+        self.outbound = asyncio.Queue(maxsize=getattr(settings, 'CHAT_WS_OUTBOUND_QUEUE_SIZE', 256))
+        self.outbound_dropped = 0
+        self.outbound_closed = False
+        self.outbound_task = asyncio.ensure_future(self.write_outbound())
+
+    def stop_outbound(self):
+        task = getattr(self, 'outbound_task', None)
+        if task is not None:
+            task.cancel()
+            self.outbound_task = None
+
+    async def write_outbound(self):
+        while True:
+            frame = await self.outbound.get()
+            await super().send(text_data=frame)
+
+    async def send(self, text_data=None, bytes_data=None, close=False):
+        """Кадри з текстом проходять через обмежену чергу сокета."""
+        outbound = getattr(self, 'outbound', None)
+        if outbound is None or text_data is None or close:
+            await super().send(text_data=text_data, bytes_data=bytes_data, close=close)
+            return
+        if self.outbound_closed:
+            return
+
+        if self.outbound_dropped and outbound.qsize() < outbound.maxsize - 1:
+            outbound.put_nowait(dumps({'type': 'overflow', 'dropped': self.outbound_dropped}))
+            self.outbound_dropped = 0
+
+        try:
+            outbound.put_nowait(text_data)
+        except asyncio.QueueFull:
+            await self.handle_slow_consumer()
+            return
+        consumer_metrics.observe_queue_depth(outbound.qsize())
+
+    async def send_reliable(self, text_data):
+        """Відповідь на команду клієнта: чекає місця в черзі замість відкидання."""
+        if getattr(self, 'outbound', None) is None:
+            await super().send(text_data=text_data)
+        elif not self.outbound_closed:
+            await self.outbound.put(text_data)
+
+    async def handle_slow_consumer(self):
+        policy = getattr(settings, 'CHAT_WS_SLOW_CONSUMER_POLICY', SLOW_CONSUMER_DROP)
+        if policy == SLOW_CONSUMER_DISCONNECT:
+            consumer_metrics.incr('slow_disconnects')
+            logger.warning("Закриваємо повільний сокет користувача %s", getattr(self.user, 'id', None))
+            self.outbound_closed = True
+            self.stop_outbound()
+            await self.close(code=CLOSE_CODE_SLOW_CONSUMER)
+        else:
+            consumer_metrics.incr('dropped_frames')
+            self.outbound_dropped += 1
+
     async def chat_message(self, event):
         """
         Отримує повідомлення з групового каналу (channel_layer) та відправляє його на WS.
+        Кадр уже закодований відправником один раз (поле 'frame'), тому тут він
+        пересилається без змін.
         """
+        if 'frame' in event:
+            await self.send(text_data=event['frame'])
+            return
+
+        # Події старого формату (без готового кадру), наприклад від інших воркерів під час деплою
         await self.send(text_data=json.dumps({
             'message': event['message'],
             'sender': event['sender'],
@@ -83,81 +245,234 @@ class ChatConsumer(AsyncWebsocketConsumer):
         return list(Chat.objects.filter(participants=user).values_list('id', flat=True))
 
     @database_sync_to_async
-    def create_message(self, chat_id, sender_id, content):
+    def create_message(self, chat_id, sender, content):
         """Створює нове повідомлення в базі даних."""
+        # Перевірка участі через кешований індекс членства (без сканування учасників)
+        if not is_member(chat_id, sender.id):
+            return None
+
+        message = Message.objects.create(chat_id=int(chat_id), sender=sender, content=content)
+        # Учасники потрібні для розсилки в режимі 'user' (групи user_{id})
+        message.participant_ids = get_member_ids(chat_id)
+
+        # 💡 Оновлення ReadReceipt: відправник прочитав, іншим +1 до непрочитаних
+        ReadReceipt.objects.register_message(message)
+
+        return message
+
+    async def send_chat_message(self, chat_id, sender, content):
+        """Обробляє відправку повідомлення, створює його та розсилає."""
+        message = await self.create_message(chat_id, sender, content)
+
+        if message:
+            await self.broadcast_message(message, message.participant_ids)
+
+    async def enqueue_chat_message(self, chat_id, sender, content, client_id=None):
+        """
+        Режим конвеєра: перевіряє участь за кешем, призначає ULID, одразу
+        розсилає повідомлення й ставить його в чергу на пакетний запис.
+        """
+        if not isinstance(content, str) or not content:
+            return
         try:
-            chat = Chat.objects.get(pk=chat_id)
-            sender = User.objects.get(pk=sender_id)
+            chat_id = int(chat_id)
+        except (TypeError, ValueError):
+            return
 
-            # Перевірка участі
-            if sender not in chat.participants.all():
-                return None
+        member_ids = membership.peek(chat_id)
+        if member_ids is None:
+            member_ids = await database_sync_to_async(get_member_ids)(chat_id)
+        if sender.id not in member_ids:
+            return
 
-            message = Message.objects.create(chat=chat, sender=sender, content=content)
+        message = Message(
+            chat_id=chat_id,
+            sender=sender,
+            content=content,
+            uid=normalize_ulid(client_id) or new_ulid(),
+            timestamp=timezone.now(),
+        )
+        message_pipeline.submit(message)
+        await self.broadcast_message(message, member_ids)
 
-            # 💡 Автоматичне оновлення ReadReceipt для відправника
-            ReadReceipt.objects.update_or_create(
-                chat=chat,
-                user=sender,
-                defaults={'last_read_message': message}
-            )
+    @staticmethod
+    def message_payload(message):
+        """Дані повідомлення для кадрів (id та seq = None, доки конвеєр не записав його)."""
+        return {
+            'id': message.id,
+            'uid': message.uid,
+            'seq': message.seq,
+            'chat': message.chat_id,
+            'sender': {'id': message.sender.id, 'username': message.sender.username},
+            'content': message.content,
+            'timestamp': message.timestamp.isoformat(),
+        }
 
-            return message
+    async def broadcast_message(self, message, participant_ids):
+        """Кодує кадр один раз і розсилає його учасникам чату."""
+        group_names = get_target_groups(message.chat_id, participant_ids)
 
-        except (Chat.DoesNotExist, User.DoesNotExist):
-            return None
+        # Підготовка даних для розсилки
+        message_data = self.message_payload(message)
 
-    async def send_chat_message(self, chat_id, sender_id, content):
-        """Обробляє відправку повідомлення, створює його та розсилає."""
-        message = await self.create_message(chat_id, sender_id, content)
+        # Кадр кодуємо один раз — отримувачі пересилають його без повторного json.dumps
+        frame = dumps({
+            'message': message_data,
+            'sender': message.sender.username,  # Можна використовувати для відображення
+            'timestamp': message.timestamp.isoformat(),
+            'chat_id': message.chat_id,
+        })
 
-        if message:
-            group_name = f'chat_{chat_id}'
-
-            # Підготовка даних для розсилки
-            message_data = {
-                'id': message.id,
-                'chat': message.chat_id,
-                'sender': {'id': message.sender.id, 'username': message.sender.username},
-                'content': message.content,
-                'timestamp': message.timestamp.isoformat(),
+        await group_send_many(
+            self.channel_layer,
+            group_names,
+            {
+                'type': 'chat.message',
+                'frame': frame,
             }
-
-            await self.channel_layer.group_send(
-                group_name,
-                {
-                    'type': 'chat.message',
-                    'message': message_data,
-                    'sender': message.sender.username,  # Можна використовувати для відображення
-                    'timestamp': message.timestamp.isoformat(),
-                    'chat_id': chat_id,
-                }
-            )
+        )
 
     @database_sync_to_async
     def mark_chat_as_read(self, chat_id, user):
         """
-        Синхронно знаходить чат та оновлює ReadReceipt для користувача.
-        Викликається, коли користувач відкриває чат через WS.
+        Відмічає чат прочитаним до останнього повідомлення.
+        Викликається, коли користувач відкриває чат через WS. Запис у БД
+        відкладається й об'єднується з іншими (див. chat/receipts.py).
+        """
+        # Перевіряємо, чи є користувач учасником
+        if not is_member(chat_id, user.id):
+            return
+
+        receipt_buffer.mark(chat_id, user.id)
+
+    # -----------------------------------------------------------
+    # ПРИСУТНІСТЬ І НАБІР ТЕКСТУ
+    # -----------------------------------------------------------
+
+    @staticmethod
+    def parse_user_ids(value):
+        if not isinstance(value, list):
+            return []
+        user_ids = []
+        for item in value:
+            try:
+                user_ids.append(int(item))
+            except (TypeError, ValueError):
+                continue
+        return user_ids
+
+    async def handle_presence(self, subscribe=None, unsubscribe=None):
+        """
+        Heartbeat сокета. 'subscribe' / 'unsubscribe' — списки ID користувачів,
+        чиї оновлення присутності потрібні клієнту (не більше
+        CHAT_PRESENCE_MAX_SUBSCRIPTIONS); на нові підписки одразу приходить
+        знімок їхнього стану. Підписатися можна лише на співрозмовників —
+        користувачів, з якими є спільний чат; решта ID мовчки ігнорується.
         """
+        await call_async(presence.heartbeat, self.user.id)
+
+        for user_id in self.parse_user_ids(unsubscribe):
+            if user_id in self.presence_subscriptions:
+                self.presence_subscriptions.discard(user_id)
+                await self.channel_layer.group_discard(presence_group_name(user_id), self.channel_name)
+
+        limit = getattr(settings, 'CHAT_PRESENCE_MAX_SUBSCRIPTIONS', 500)
+        requested = [
+            user_id for user_id in dict.fromkeys(self.parse_user_ids(subscribe))
+            if user_id not in self.presence_subscriptions
+        ][:max(limit - len(self.presence_subscriptions), 0)]
+        contacts = await database_sync_to_async(contact_ids)(self.user, requested) if requested else set()
+        added = []
+        for user_id in requested:
+            if user_id not in contacts:
+                continue
+            self.presence_subscriptions.add(user_id)
+            added.append(user_id)
+            await self.channel_layer.group_add(presence_group_name(user_id), self.channel_name)
+
+        if added:
+            statuses = await call_async(presence.statuses, added)
+            await self.send_reliable(dumps({
+                'type': 'presence_snapshot',
+                'users': {str(user_id): status for user_id, status in statuses.items()},
+            }))
+
+        await presence.publish(self.channel_layer, self.user.id)
+
+    async def handle_typing(self, chat_id, is_typing):
+        """Розсилає 'typing' іншим учасникам чату, не частіше ніж раз на CHAT_TYPING_INTERVAL."""
         try:
-            chat = Chat.objects.get(pk=chat_id)
-
-            # Перевіряємо, чи є користувач учасником
-            if user not in chat.participants.all():
-                return
-
-            # Знаходимо останнє повідомлення в чаті
-            # Використовуємо .messages, оскільки ми це виправили у models.py
-            last_message = chat.messages.filter(sender__isnull=False).order_by('-timestamp').first()
-
-            if last_message:
-                # Створюємо або оновлюємо ReadReceipt
-                ReadReceipt.objects.update_or_create(
-                    chat=chat,
-                    user=user,
-                    defaults={'last_read_message': last_message}
-                )
-
-        except Chat.DoesNotExist:
-            pass
\ No newline at end of file
+            chat_id = int(chat_id)
+        except (TypeError, ValueError):
+            return
+
+        member_ids = membership.peek(chat_id)
+        if member_ids is None:
+            member_ids = await database_sync_to_async(get_member_ids)(chat_id)
+        if self.user.id not in member_ids:
+            return
+        if not presence.claim_typing(self.user.id, chat_id, is_typing):
+            return
+
+        own_group = user_group_name(self.user.id)
+        group_names = [name for name in get_target_groups(chat_id, member_ids) if name != own_group]
+        frame = dumps({
+            'type': 'typing',
+            'chat_id': chat_id,
+            'user_id': self.user.id,
+            'username': self.user.username,
+            'is_typing': is_typing,
+            # Без повторної події індикатор гасне сам
+            'ttl': presence.typing_interval * 2 if is_typing else 0,
+        })
+        await group_send_many(self.channel_layer, group_names, {'type': 'chat.message', 'frame': frame})
+
+    # -----------------------------------------------------------
+    # ДОЗАВАНТАЖЕННЯ ПРОПУЩЕНОГО (resume)
+    # -----------------------------------------------------------
+
+    async def resume_chats(self, chats, user):
+        """
+        Для кожного чату надсилає повідомлення з seq > last_seq пачками по
+        CHAT_RESUME_BATCH_SIZE. Кожна пачка — діапазонне читання за індексом
+        (chat, seq). Після CHAT_RESUME_MAX_MESSAGES повідомлень на чат
+        надсилання припиняється з прапорцем 'truncated' — такий чат клієнту
+        дешевше перезавантажити через REST.
+        """
+        batch_size = getattr(settings, 'CHAT_RESUME_BATCH_SIZE', 100)
+        max_messages = getattr(settings, 'CHAT_RESUME_MAX_MESSAGES', 1000)
+
+        for raw_chat_id, raw_last_seq in chats.items():
+            try:
+                chat_id = int(raw_chat_id)
+                last_seq = max(int(raw_last_seq or 0), 0)
+            except (TypeError, ValueError):
+                continue
+            if not await database_sync_to_async(is_member)(chat_id, user.id):
+                continue
+
+            sent = 0
+            while True:
+                limit = min(batch_size, max_messages - sent)
+                messages, has_more = await self.get_messages_after(chat_id, last_seq, limit)
+                sent += len(messages)
+                truncated = has_more and sent >= max_messages
+                await self.send_reliable(dumps({
+                    'type': 'resume',
+                    'chat_id': chat_id,
+                    'messages': [self.message_payload(message) for message in messages],
+                    'has_more': has_more and not truncated,
+                    'truncated': truncated,
+                }))
+                if not has_more or truncated:
+                    break
+                last_seq = messages[-1].seq
+
+    @database_sync_to_async
+    def get_messages_after(self, chat_id, last_seq, limit):
+        """Повертає (повідомлення з seq > last_seq за зростанням seq, чи є ще)."""
+        rows = list(
+            Message.objects.filter(chat_id=chat_id, seq__gt=last_seq)
+            .select_related('sender').order_by('seq')[:limit + 1]
+        )
+        return rows[:limit], len(rows) > limit
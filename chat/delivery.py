@@ -0,0 +1,49 @@
+# chat/delivery.py
+"""
+Маршрутизація подій чату через channel layer.
+
+Підтримуються два режими (settings.CHAT_DELIVERY_MODE):
+
+* ``'chat'`` — кожен сокет підписується на групу ``chat_{id}`` для кожного
+  свого чату. Підключення коштує O(кількість чатів) підписок у Redis.
+* ``'user'`` — кожен сокет підписується лише на одну групу ``user_{id}``,
+  а розсилка йде в групи учасників чату. Підключення коштує O(1), а нові
+  чати стають "живими" одразу, без повторної підписки.
+"""
+from django.conf import settings
+
+from .membership import get_member_ids
+
+DELIVERY_MODE_CHAT = 'chat'
+DELIVERY_MODE_USER = 'user'
+
+
+def get_delivery_mode():
+    return getattr(settings, 'CHAT_DELIVERY_MODE', DELIVERY_MODE_USER)
+
+
+def chat_group_name(chat_id):
+    return f'chat_{chat_id}'
+
+
+def user_group_name(user_id):
+    return f'user_{user_id}'
+
+
+def get_target_groups(chat_id, participant_ids=None):
+    """
+    Групи, в які потрібно розіслати подію чату. У режимі 'user' потрібні ID
+    учасників; якщо їх не передано, вони беруться з індексу членства
+    (при промаху кешу — синхронний запит до БД).
+    """
+    if get_delivery_mode() == DELIVERY_MODE_USER:
+        if participant_ids is None:
+            participant_ids = get_member_ids(chat_id)
+        return [user_group_name(user_id) for user_id in participant_ids]
+    return [chat_group_name(chat_id)]
+
+
+async def group_send_many(channel_layer, group_names, event):
+    """Надсилає одну й ту саму подію в кожну з груп."""
+    for group_name in group_names:
+        await channel_layer.group_send(group_name, event)
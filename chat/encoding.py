@@ -0,0 +1,18 @@
+# chat/encoding.py
+"""
+Кодування WebSocket-кадрів. Використовує orjson, якщо він встановлений,
+інакше — стандартний json.
+"""
+import json
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - залежить від оточення
+    orjson = None
+
+
+def dumps(data):
+    """Серіалізує дані у JSON-рядок для відправки через WebSocket."""
+    if orjson is not None:
+        return orjson.dumps(data).decode('utf-8')
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':'))
@@ -0,0 +1,111 @@
+# chat/management/commands/archive_messages.py
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Max, Min, Q
+from django.utils import timezone
+
+from chat.models import ArchivedMessage, Chat, Message, ReadReceipt
+
+ARCHIVE_FIELDS = ('id', 'chat_id', 'sender_id', 'content', 'timestamp', 'uid', 'seq')
+
+
+class Command(BaseCommand):
+    help = (
+        "Переносит сообщения старше заданного возраста из Message в архивную таблицу "
+        "ArchivedMessage пачками. Каждая пачка — отдельная транзакция, поэтому прерванный "
+        "запуск можно просто повторить: он продолжит с оставшихся сообщений."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than-days', type=int,
+                            default=getattr(settings, 'CHAT_ARCHIVE_AFTER_DAYS', 180),
+                            help="Возраст сообщений (в днях), после которого они переносятся в архив.")
+        parser.add_argument('--batch-size', type=int,
+                            default=getattr(settings, 'CHAT_ARCHIVE_BATCH_SIZE', 1000),
+                            help="Количество сообщений, переносимых за одну транзакцию.")
+        parser.add_argument('--max-batches', type=int, default=None,
+                            help="Остановиться после указанного количества пачек.")
+        parser.add_argument('--report', action='store_true',
+                            help="Только показать размер оперативной и архивной таблиц.")
+
+    def handle(self, *args, older_than_days, batch_size, max_batches, report, **options):
+        cutoff = timezone.now() - timedelta(days=older_than_days)
+        if report:
+            self.report(cutoff)
+            return
+
+        moved = 0
+        batches = 0
+        while max_batches is None or batches < max_batches:
+            count = self.archive_batch(cutoff, batch_size)
+            if not count:
+                break
+            moved += count
+            batches += 1
+            self.stdout.write(f"Пачка {batches}: перенесено {count}.")
+
+        self.stdout.write(self.style.SUCCESS(f"Перенесено в архив: {moved} (пачек: {batches})."))
+
+    def candidates(self, cutoff):
+        # Сообщения, на которые ссылаются квитанции, остаются в оперативной таблице:
+        # иначе SET_NULL сбросил бы last_read_message и сломал счётчики непрочитанных
+        referenced = ReadReceipt.objects.filter(last_read_message__isnull=False).values('last_read_message')
+        return Message.objects.filter(timestamp__lt=cutoff).exclude(id__in=referenced)
+
+    def archive_batch(self, cutoff, batch_size):
+        """Переносит одну пачку самых старых сообщений. Возвращает их количество."""
+        with transaction.atomic():
+            # Самые старые сообщения — в начале первичного ключа, сканирование короткое
+            rows = list(self.candidates(cutoff).order_by('id').values(*ARCHIVE_FIELDS)[:batch_size])
+            if not rows:
+                return 0
+
+            ArchivedMessage.objects.bulk_create(
+                [ArchivedMessage(**row) for row in rows], ignore_conflicts=True,
+            )
+
+            newest = {}
+            for row in rows:
+                if row['chat_id'] not in newest or row['timestamp'] > newest[row['chat_id']]:
+                    newest[row['chat_id']] = row['timestamp']
+            for chat_id, timestamp in newest.items():
+                Chat.objects.filter(pk=chat_id).filter(
+                    Q(archived_until__isnull=True) | Q(archived_until__lt=timestamp),
+                ).update(archived_until=timestamp)
+
+            Message.objects.filter(id__in=[row['id'] for row in rows]).delete()
+        return len(rows)
+
+    def report(self, cutoff):
+        hot = Message.objects.aggregate(oldest=Min('timestamp'), newest=Max('timestamp'))
+        lines = [
+            f"Оперативная таблица: {Message.objects.count()} сообщений "
+            f"(с {hot['oldest'] or '—'} по {hot['newest'] or '—'}).",
+            f"Готовы к переносу (старше {cutoff:%Y-%m-%d}): {self.candidates(cutoff).count()}.",
+            f"Архив: {ArchivedMessage.objects.count()} сообщений.",
+        ]
+        for model in (Message, ArchivedMessage):
+            size = self.table_size(model._meta.db_table)
+            if size is not None:
+                lines.append(f"Размер {model._meta.db_table}: {size / 1024 / 1024:.1f} МБ.")
+        self.stdout.write('\n'.join(lines))
+
+    @staticmethod
+    def table_size(table):
+        """Размер таблицы в байтах (на PostgreSQL — с индексами), если СУБД умеет его сообщить."""
+        with connection.cursor() as cursor:
+            try:
+                if connection.vendor == 'postgresql':
+                    cursor.execute('SELECT pg_total_relation_size(%s)', [table])
+                elif connection.vendor == 'sqlite':
+                    # dbstat доступна, только если SQLite собран с SQLITE_ENABLE_DBSTAT_VTAB
+                    cursor.execute('SELECT SUM(pgsize) FROM dbstat WHERE name = %s', [table])
+                else:
+                    return None
+            except Exception:
+                return None
+            row = cursor.fetchone()
+        return row[0] if row else None
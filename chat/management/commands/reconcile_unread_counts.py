@@ -0,0 +1,61 @@
+# chat/management/commands/reconcile_unread_counts.py
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+
+from chat.models import Chat, ReadReceipt
+
+
+class Command(BaseCommand):
+    help = (
+        "Пересчитывает денормализованные счётчики непрочитанных сообщений "
+        "(ReadReceipt.unread_count) и создаёт недостающие квитанции для участников чатов."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help="Количество квитанций, пересчитываемых за один UPDATE.")
+        parser.add_argument('--chat', type=int, action='append', dest='chat_ids',
+                            help="Ограничить пересчёт указанными чатами (можно повторять).")
+
+    def handle(self, *args, batch_size, chat_ids, **options):
+        created = self.create_missing_receipts(chat_ids, batch_size)
+
+        receipts = ReadReceipt.objects.order_by('id')
+        if chat_ids:
+            receipts = receipts.filter(chat_id__in=chat_ids)
+
+        updated = 0
+        last_id = 0
+        while True:
+            ids = list(receipts.filter(id__gt=last_id).values_list('id', flat=True)[:batch_size])
+            if not ids:
+                break
+            with transaction.atomic():
+                updated += ReadReceipt.objects.filter(id__in=ids).recount()
+            last_id = ids[-1]
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Создано квитанций: {created}, пересчитано: {updated}."
+        ))
+
+    def create_missing_receipts(self, chat_ids, batch_size):
+        """Создаёт ReadReceipt для пар (чат, участник), у которых её ещё нет."""
+        through = Chat.participants.through
+        user_column = Chat.participants.field.m2m_reverse_name()
+
+        memberships = through.objects.annotate(
+            has_receipt=Exists(ReadReceipt.objects.filter(
+                chat_id=OuterRef('chat_id'),
+                user_id=OuterRef(user_column),
+            )),
+        ).filter(has_receipt=False)
+        if chat_ids:
+            memberships = memberships.filter(chat_id__in=chat_ids)
+
+        missing = [
+            ReadReceipt(chat_id=chat_id, user_id=user_id)
+            for chat_id, user_id in memberships.values_list('chat_id', user_column).iterator()
+        ]
+        ReadReceipt.objects.bulk_create(missing, batch_size=batch_size, ignore_conflicts=True)
+        return len(missing)
@@ -0,0 +1,139 @@
+# chat/membership.py
+"""
+Індекс членства в чатах: відповідає на is_member(chat_id, user_id) без запиту
+до БД при попаданні в кеш.
+
+Без спільного кешу склад учасників кешується в процесі (LRU + TTL) — це
+режим для одного процесу. Якщо задано спільний Django-кеш
+(settings.CHAT_MEMBERSHIP_CACHE_ALIAS), він стає єдиним джерелом: локальна
+копія не використовується, і зміни Chat.participants, що інвалідують кеш через
+m2m_changed (див. chat/signals.py), одразу видно в усіх воркерах. Тоді
+видалений учасник втрачає доступ до читання й надсилання в будь-якому процесі
+без очікування CHAT_MEMBERSHIP_TTL.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+from .models import Chat
+
+
+class MembershipIndex:
+    shared_key_prefix = 'chat:members:'
+
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    # --- Налаштування ---
+
+    @property
+    def ttl(self):
+        return getattr(settings, 'CHAT_MEMBERSHIP_TTL', 30)
+
+    @property
+    def max_entries(self):
+        return getattr(settings, 'CHAT_MEMBERSHIP_MAX_ENTRIES', 10000)
+
+    @property
+    def shared_cache(self):
+        alias = getattr(settings, 'CHAT_MEMBERSHIP_CACHE_ALIAS', None)
+        return caches[alias] if alias else None
+
+    # --- Публічний API ---
+
+    def get_member_ids(self, chat_id):
+        """Множина ID учасників чату (порожня, якщо чату не існує)."""
+        chat_id = int(chat_id)
+        if self.shared_cache is not None:
+            # Спільний кеш інвалідується з будь-якого процесу — локальна копія могла б застаріти
+            return self._load(chat_id)
+        now = time.monotonic()
+
+        with self._lock:
+            entry = self._entries.get(chat_id)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(chat_id)
+                return entry[1]
+
+        member_ids = self._load(chat_id)
+
+        with self._lock:
+            self._entries[chat_id] = (now + self.ttl, member_ids)
+            self._entries.move_to_end(chat_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return member_ids
+
+    def peek(self, chat_id):
+        """
+        Склад учасників з локального кешу або None — без звернення до БД і
+        мережі (можна викликати з циклу подій). Зі спільним кешем завжди None.
+        """
+        if self.shared_cache is not None:
+            return None
+        with self._lock:
+            entry = self._entries.get(int(chat_id))
+        if entry is not None and entry[0] > time.monotonic():
+            return entry[1]
+        return None
+
+    def is_member(self, chat_id, user_id):
+        try:
+            return int(user_id) in self.get_member_ids(chat_id)
+        except (TypeError, ValueError):
+            return False
+
+    def invalidate(self, *chat_ids):
+        """
+        Скидає кеш чатів зараз і ще раз після коммиту транзакції: інакше інший
+        процес міг би встигнути завантажити з БД ще старий склад.
+        """
+        self._invalidate(chat_ids)
+        transaction.on_commit(lambda: self._invalidate(chat_ids))
+
+    def _invalidate(self, chat_ids):
+        with self._lock:
+            for chat_id in chat_ids:
+                self._entries.pop(int(chat_id), None)
+        shared = self.shared_cache
+        if shared is not None:
+            shared.delete_many([self.shared_key_prefix + str(chat_id) for chat_id in chat_ids])
+
+    def clear(self):
+        """Очищує локальний кеш (спільний кеш живе за власним TTL)."""
+        with self._lock:
+            self._entries.clear()
+
+    # --- Завантаження ---
+
+    def _load(self, chat_id):
+        shared = self.shared_cache
+        key = self.shared_key_prefix + str(chat_id)
+        if shared is not None:
+            member_ids = shared.get(key)
+            if member_ids is not None:
+                return member_ids
+
+        user_column = Chat.participants.field.m2m_reverse_name()
+        member_ids = frozenset(
+            Chat.participants.through.objects.filter(chat_id=chat_id).values_list(user_column, flat=True)
+        )
+        if shared is not None:
+            shared.set(key, member_ids, self.ttl)
+        return member_ids
+
+
+membership = MembershipIndex()
+
+
+def is_member(chat_id, user_id):
+    return membership.is_member(chat_id, user_id)
+
+
+def get_member_ids(chat_id):
+    return membership.get_member_ids(chat_id)
@@ -0,0 +1,67 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:05
+
+from django.db import migrations, models
+from django.db.models import Count, Exists, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+BATCH_SIZE = 1000
+
+
+def backfill_unread_counts(apps, schema_editor):
+    """
+    Те саме, що й manage.py reconcile_unread_counts: створює квитанції
+    учасникам, у яких їх немає, і рахує unread_count за таблицею повідомлень
+    пачками по BATCH_SIZE квитанцій.
+    """
+    Chat = apps.get_model('chat', 'Chat')
+    Message = apps.get_model('chat', 'Message')
+    ReadReceipt = apps.get_model('chat', 'ReadReceipt')
+    db_alias = schema_editor.connection.alias
+    Participant = Chat.participants.through
+    user_column = Chat.participants.field.m2m_reverse_name()
+
+    memberships = Participant.objects.using(db_alias).annotate(
+        has_receipt=Exists(ReadReceipt.objects.using(db_alias).filter(
+            chat_id=OuterRef('chat_id'),
+            user_id=OuterRef(user_column),
+        )),
+    ).filter(has_receipt=False)
+    missing = [
+        ReadReceipt(chat_id=chat_id, user_id=user_id)
+        for chat_id, user_id in memberships.values_list('chat_id', user_column).iterator()
+    ]
+    ReadReceipt.objects.using(db_alias).bulk_create(missing, batch_size=BATCH_SIZE, ignore_conflicts=True)
+
+    unread = Message.objects.using(db_alias).filter(
+        chat=OuterRef('chat'),
+        id__gt=Coalesce(OuterRef('last_read_message'), 0),
+    ).exclude(sender=OuterRef('user')).order_by().values('chat').annotate(
+        count=Count('id'),
+    ).values('count')
+
+    receipts = ReadReceipt.objects.using(db_alias).order_by('id')
+    last_id = 0
+    while True:
+        ids = list(receipts.filter(id__gt=last_id).values_list('id', flat=True)[:BATCH_SIZE])
+        if not ids:
+            break
+        ReadReceipt.objects.using(db_alias).filter(id__in=ids).update(
+            unread_count=Coalesce(Subquery(unread), 0),
+        )
+        last_id = ids[-1]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0002_message_chat_ts_id_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='readreceipt',
+            name='unread_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Непрочитанные сообщения'),
+        ),
+        migrations.RunPython(backfill_unread_counts, migrations.RunPython.noop),
+    ]
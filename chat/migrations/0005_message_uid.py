@@ -0,0 +1,58 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:21
+
+from django.conf import settings
+from django.db import migrations, models
+
+# Тригери FTS5 з 0004_message_search_index. SQL скопійовано, а не імпортовано:
+# міграція має лишатися незмінною, хоч би як змінювався код застосунку
+SQLITE_TRIGGERS = [
+    "DROP TRIGGER IF EXISTS chat_message_fts_au",
+    "DROP TRIGGER IF EXISTS chat_message_fts_ad",
+    "DROP TRIGGER IF EXISTS chat_message_fts_ai",
+    """
+    CREATE TRIGGER chat_message_fts_ai AFTER INSERT ON chat_message BEGIN
+        INSERT INTO chat_message_fts(rowid, content) VALUES (new.id, new.content);
+    END
+    """,
+    """
+    CREATE TRIGGER chat_message_fts_ad AFTER DELETE ON chat_message BEGIN
+        INSERT INTO chat_message_fts(chat_message_fts, rowid, content) VALUES ('delete', old.id, old.content);
+    END
+    """,
+    """
+    CREATE TRIGGER chat_message_fts_au AFTER UPDATE OF content ON chat_message BEGIN
+        INSERT INTO chat_message_fts(chat_message_fts, rowid, content) VALUES ('delete', old.id, old.content);
+        INSERT INTO chat_message_fts(rowid, content) VALUES (new.id, new.content);
+    END
+    """,
+]
+
+
+def recreate_sqlite_triggers(apps, schema_editor):
+    """SQLite перебудовує chat_message при зміні схеми, і тригери зникають разом зі старою таблицею."""
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for statement in SQLITE_TRIGGERS:
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0004_message_search_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='message',
+            name='uid',
+            field=models.CharField(blank=True, editable=False, max_length=26, null=True, verbose_name='Клиентский идентификатор'),
+        ),
+        migrations.AddConstraint(
+            model_name='message',
+            constraint=models.UniqueConstraint(condition=models.Q(('uid__isnull', False)), fields=('uid',), name='chat_msg_uid_unique'),
+        ),
+        # Про всяк випадок: якщо SQLite перебудував chat_message, тригери FTS5 зникли
+        migrations.RunPython(recreate_sqlite_triggers, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,88 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:26
+
+from django.conf import settings
+from django.db import migrations, models
+
+# Тригери FTS5 з 0004_message_search_index. SQL скопійовано, а не імпортовано:
+# міграція має лишатися незмінною, хоч би як змінювався код застосунку
+SQLITE_TRIGGERS = [
+    "DROP TRIGGER IF EXISTS chat_message_fts_au",
+    "DROP TRIGGER IF EXISTS chat_message_fts_ad",
+    "DROP TRIGGER IF EXISTS chat_message_fts_ai",
+    """
+    CREATE TRIGGER chat_message_fts_ai AFTER INSERT ON chat_message BEGIN
+        INSERT INTO chat_message_fts(rowid, content) VALUES (new.id, new.content);
+    END
+    """,
+    """
+    CREATE TRIGGER chat_message_fts_ad AFTER DELETE ON chat_message BEGIN
+        INSERT INTO chat_message_fts(chat_message_fts, rowid, content) VALUES ('delete', old.id, old.content);
+    END
+    """,
+    """
+    CREATE TRIGGER chat_message_fts_au AFTER UPDATE OF content ON chat_message BEGIN
+        INSERT INTO chat_message_fts(chat_message_fts, rowid, content) VALUES ('delete', old.id, old.content);
+        INSERT INTO chat_message_fts(rowid, content) VALUES (new.id, new.content);
+    END
+    """,
+]
+
+
+def recreate_sqlite_triggers(apps, schema_editor):
+    """SQLite перебудовує chat_message при зміні схеми, і тригери зникають разом зі старою таблицею."""
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for statement in SQLITE_TRIGGERS:
+        schema_editor.execute(statement)
+
+
+def backfill_seq(apps, schema_editor):
+    """Нумерує наявні повідомлення кожного чату в порядку (timestamp, id)."""
+    Chat = apps.get_model('chat', 'Chat')
+    Message = apps.get_model('chat', 'Message')
+    db_alias = schema_editor.connection.alias
+
+    for chat_id in Chat.objects.using(db_alias).values_list('id', flat=True).iterator():
+        batch = []
+        seq = 0
+        messages = (Message.objects.using(db_alias).filter(chat_id=chat_id)
+                    .order_by('timestamp', 'id').only('id').iterator(chunk_size=2000))
+        for message in messages:
+            seq += 1
+            message.seq = seq
+            batch.append(message)
+            if len(batch) >= 1000:
+                Message.objects.using(db_alias).bulk_update(batch, ['seq'])
+                batch = []
+        if batch:
+            Message.objects.using(db_alias).bulk_update(batch, ['seq'])
+        if seq:
+            Chat.objects.using(db_alias).filter(pk=chat_id).update(last_seq=seq)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0005_message_uid'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chat',
+            name='last_seq',
+            field=models.PositiveBigIntegerField(default=0, editable=False, verbose_name='Последний номер сообщения'),
+        ),
+        migrations.AddField(
+            model_name='message',
+            name='seq',
+            field=models.PositiveBigIntegerField(blank=True, editable=False, null=True, verbose_name='Порядковый номер в чате'),
+        ),
+        migrations.AddConstraint(
+            model_name='message',
+            constraint=models.UniqueConstraint(condition=models.Q(('seq__isnull', False)), fields=('chat', 'seq'), name='chat_msg_chat_seq_unique'),
+        ),
+        migrations.RunPython(backfill_seq, migrations.RunPython.noop),
+        # Про всяк випадок: якщо SQLite перебудував chat_message, тригери FTS5 зникли
+        migrations.RunPython(recreate_sqlite_triggers, migrations.RunPython.noop),
+    ]
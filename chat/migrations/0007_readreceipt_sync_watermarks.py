@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:29
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0006_message_seq'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='readreceipt',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, null=True, verbose_name='Создана'),
+        ),
+        migrations.AddField(
+            model_name='readreceipt',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, null=True, verbose_name='Обновлена'),
+        ),
+        migrations.AddIndex(
+            model_name='readreceipt',
+            index=models.Index(fields=['chat', 'updated_at'], name='chat_receipt_chat_upd_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='readreceipt',
+            index=models.Index(fields=['user', 'created_at'], name='chat_receipt_user_crt_idx'),
+        ),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:31
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_pairs(apps, schema_editor):
+    """
+    Проставляє ключ пари наявним приватним чатам рівно з двома учасниками.
+    Якщо для пари вже є кілька чатів, ключ отримує найстаріший, решта
+    лишаються без ключа (нові запити відкриватимуть найстаріший).
+    """
+    Chat = apps.get_model('chat', 'Chat')
+    db_alias = schema_editor.connection.alias
+    Participant = Chat.participants.through
+    user_column = Chat.participants.field.m2m_reverse_field_name()
+
+    members = {}
+    rows = (Participant.objects.using(db_alias)
+            .filter(chat__is_group_chat=False)
+            .values_list('chat_id', user_column).order_by('chat_id'))
+    for chat_id, user_id in rows.iterator():
+        members.setdefault(chat_id, []).append(user_id)
+
+    seen = set()
+    for chat_id, user_ids in sorted(members.items()):
+        if len(user_ids) != 2:
+            continue
+        pair = tuple(sorted(user_ids))
+        if pair in seen:
+            continue
+        seen.add(pair)
+        Chat.objects.using(db_alias).filter(pk=chat_id).update(
+            pair_user_min_id=pair[0], pair_user_max_id=pair[1],
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0007_readreceipt_sync_watermarks'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chat',
+            name='pair_user_max',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Участник пары (больший ID)'),
+        ),
+        migrations.AddField(
+            model_name='chat',
+            name='pair_user_min',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Участник пары (меньший ID)'),
+        ),
+        migrations.AddConstraint(
+            model_name='chat',
+            constraint=models.UniqueConstraint(condition=models.Q(('pair_user_max__isnull', False), ('pair_user_min__isnull', False)), fields=('pair_user_min', 'pair_user_max'), name='chat_private_pair_unique'),
+        ),
+        migrations.RunPython(backfill_pairs, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:38
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0008_chat_private_pair'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chat',
+            name='archived_until',
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name='Архив сообщений до'),
+        ),
+        migrations.CreateModel(
+            name='ArchivedMessage',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('content', models.TextField(verbose_name='Содержание')),
+                ('timestamp', models.DateTimeField()),
+                ('uid', models.CharField(blank=True, max_length=26, null=True, verbose_name='Клиентский идентификатор')),
+                ('seq', models.PositiveBigIntegerField(blank=True, null=True, verbose_name='Порядковый номер в чате')),
+                ('archived_at', models.DateTimeField(auto_now_add=True, verbose_name='Перенесено в архив')),
+                ('chat', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_messages', to='chat.chat', verbose_name='Чат')),
+                ('sender', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Отправитель')),
+            ],
+            options={
+                'verbose_name': 'Архивное сообщение',
+                'verbose_name_plural': 'Архивные сообщения',
+                'indexes': [models.Index(fields=['chat', 'timestamp', 'id'], name='chat_arch_chat_ts_id_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:15
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0009_message_archive'),
+    ]
+
+    operations = [
+        # auto_now_add -> default=timezone.now меняет только поведение Python: колонка
+        # в БД та же, поэтому без перестройки chat_message (и её триггеров FTS5 на SQLite)
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AlterField(
+                    model_name='message',
+                    name='timestamp',
+                    field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+                ),
+            ],
+        ),
+    ]
@@ -1,11 +1,150 @@
 # chat/models.py
-from django.db import models
+from collections import defaultdict
+from functools import reduce
+from operator import or_
+
+from django.db import IntegrityError, models, transaction
 from django.conf import settings
+from django.db.models.functions import Coalesce
 from django.utils import timezone
 
 User = settings.AUTH_USER_MODEL
 
 
+class ChatQuerySet(models.QuerySet):
+    """QuerySet чатов с аннотациями для списка чатов."""
+
+    def for_user(self, user):
+        """Чаты, в которых участвует пользователь."""
+        return self.filter(participants=user).distinct()
+
+    def allocate_seq(self, chat_id, count=1):
+        """
+        Резервирует count последовательных номеров сообщений в чате и
+        возвращает первый из них. UPDATE блокирует строку чата до конца
+        транзакции, поэтому номера уникальны и монотонны внутри чата.
+        """
+        with transaction.atomic():
+            self.filter(pk=chat_id).update(last_seq=models.F('last_seq') + count)
+            last_seq = self.filter(pk=chat_id).values_list('last_seq', flat=True).get()
+        return last_seq - count + 1
+
+    def get_or_create_private(self, user_id, other_id, **defaults):
+        """
+        Личный чат пары пользователей: один поиск по уникальному индексу
+        (pair_user_min, pair_user_max). При гонке двух запросов второй INSERT
+        упирается в индекс, и возвращается чат, созданный первым.
+        """
+        low, high = sorted((int(user_id), int(other_id)))
+        lookup = {'is_group_chat': False, 'pair_user_min_id': low, 'pair_user_max_id': high}
+        chat = self.filter(**lookup).first()
+        if chat is not None:
+            return chat, False
+        try:
+            with transaction.atomic():
+                chat = self.create(**lookup, **defaults)
+                chat.participants.set([low, high])
+        except IntegrityError:
+            return self.get(**lookup), False
+        return chat, True
+
+    def with_summary(self, user):
+        """
+        Аннотирует каждый чат ID последнего сообщения и количеством непрочитанных
+        сообщений для пользователя. Все считается подзапросами в одном SELECT,
+        поэтому количество запросов не зависит от количества чатов.
+        """
+        last_message_id = Message.objects.filter(
+            chat=models.OuterRef('pk'),
+        ).order_by('-timestamp', '-id').values('id')[:1]
+
+        # Счётчик непрочитанных поддерживается инкрементально в ReadReceipt
+        unread = ReadReceipt.objects.filter(
+            chat=models.OuterRef('pk'),
+            user=user,
+        ).values('unread_count')[:1]
+
+        return self.annotate(
+            last_message_id=models.Subquery(last_message_id),
+            unread_total=Coalesce(models.Subquery(unread), 0),
+        )
+
+
+class ReadReceiptQuerySet(models.QuerySet):
+    """Операции над квитанциями, поддерживающие денормализованный unread_count."""
+
+    def register_message(self, message):
+        """
+        Учитывает новое сообщение: остальным участникам +1 к непрочитанным
+        (один UPDATE через F()), отправитель сразу "прочитал" своё сообщение.
+        """
+        self.filter(chat_id=message.chat_id).exclude(user_id=message.sender_id).update(
+            unread_count=models.F('unread_count') + 1,
+        )
+        return self.mark_read(message.chat_id, message.sender_id, message)
+
+    def register_messages(self, messages):
+        """
+        Пакетний варіант register_message для уже сохранённых сообщений — с тем
+        же результатом, что и поочерёдные вызовы. Участникам, которые ничего не
+        отправили в пачке, +N новых сообщений чата (один UPDATE на каждое
+        различное N). Отправитель "прочитал" чат до своего последнего сообщения
+        в пачке, непрочитанными у него остаются только чужие сообщения после
+        него — это один upsert квитанций отправителей.
+        """
+        by_chat = defaultdict(list)
+        for message in messages:
+            by_chat[message.chat_id].append(message)
+
+        increments = defaultdict(list)
+        senders = []
+        for chat_id, chat_messages in by_chat.items():
+            chat_messages.sort(key=lambda message: message.id)
+            last_sent = {message.sender_id: index for index, message in enumerate(chat_messages)}
+            increments[len(chat_messages)].append(
+                models.Q(chat_id=chat_id) & ~models.Q(user_id__in=list(last_sent))
+            )
+            for sender_id, index in last_sent.items():
+                unread = sum(message.sender_id != sender_id for message in chat_messages[index + 1:])
+                senders.append(ReadReceipt(
+                    user_id=sender_id, chat_id=chat_id,
+                    last_read_message_id=chat_messages[index].id, unread_count=unread,
+                ))
+
+        for count, conditions in increments.items():
+            self.filter(reduce(or_, conditions)).update(unread_count=models.F('unread_count') + count)
+        self.bulk_create(
+            senders,
+            update_conflicts=True,
+            unique_fields=['user', 'chat'],
+            update_fields=['last_read_message', 'unread_count', 'updated_at'],
+        )
+
+    def mark_read(self, chat_id, user_id, message):
+        """Отмечает чат прочитанным до message и обнуляет счётчик непрочитанных."""
+        receipt, _ = self.update_or_create(
+            chat_id=chat_id,
+            user_id=user_id,
+            defaults={'last_read_message': message, 'unread_count': 0},
+        )
+        return receipt
+
+    def recount(self):
+        """
+        Пересчитывает unread_count выбранных квитанций по таблице сообщений
+        одним UPDATE с коррелированным подзапросом. Используется для начального
+        заполнения и для исправления рассинхронизации.
+        """
+        unread = Message.objects.filter(
+            chat=models.OuterRef('chat'),
+            id__gt=Coalesce(models.OuterRef('last_read_message'), 0),
+        ).exclude(sender=models.OuterRef('user')).order_by().values('chat').annotate(
+            count=models.Count('id'),
+        ).values('count')
+
+        return self.update(unread_count=Coalesce(models.Subquery(unread), 0))
+
+
 # 1. Модель Чат-Кімнати
 class Chat(models.Model):
     """
@@ -15,11 +154,32 @@ class Chat(models.Model):
     is_group_chat = models.BooleanField(default=False, verbose_name="Групповой чат")
     title = models.CharField(max_length=100, blank=True, null=True, verbose_name="Название чата")
     created_at = models.DateTimeField(auto_now_add=True)
+    # Последний выданный порядковый номер сообщения (см. Message.seq)
+    last_seq = models.PositiveBigIntegerField(default=0, editable=False,
+                                              verbose_name="Последний номер сообщения")
+    # Самое новое сообщение, перенесённое в архив (ArchivedMessage); пусто — архива нет
+    archived_until = models.DateTimeField(null=True, blank=True, editable=False,
+                                          verbose_name="Архив сообщений до")
+    # Канонический ключ личного чата: (меньший ID, больший ID) участников.
+    # У групповых чатов пуст
+    pair_user_min = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True,
+                                      editable=False, related_name='+', verbose_name="Участник пары (меньший ID)")
+    pair_user_max = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True,
+                                      editable=False, related_name='+', verbose_name="Участник пары (больший ID)")
+
+    objects = ChatQuerySet.as_manager()
 
     class Meta:
         verbose_name = "Чат"
         verbose_name_plural = "Чаты"
-        # Гарантуємо унікальність приватної розмови між двома користувачами (потрібна буде додаткова логіка у View)
+        # Гарантуємо унікальність приватної розмови між двома користувачами
+        constraints = [
+            models.UniqueConstraint(
+                fields=['pair_user_min', 'pair_user_max'],
+                condition=models.Q(pair_user_min__isnull=False, pair_user_max__isnull=False),
+                name='chat_private_pair_unique',
+            ),
+        ]
 
     def __str__(self):
         if self.title:
@@ -36,17 +196,75 @@ class Message(models.Model):
     chat = models.ForeignKey(Chat, on_delete=models.CASCADE, related_name='messages', verbose_name="Чат")
     sender = models.ForeignKey(User, on_delete=models.CASCADE, related_name='sent_messages', verbose_name="Отправитель")
     content = models.TextField(verbose_name="Содержание")
-    timestamp = models.DateTimeField(auto_now_add=True)
+    # Не auto_now_add: конвейер (chat/pipeline.py) ставит время при приёме и рассылает его
+    # до записи, а bulk_create перезаписал бы его моментом INSERT
+    timestamp = models.DateTimeField(default=timezone.now, editable=False)
+    # ULID, назначаемый до записи в БД (конвейер chat/pipeline.py) или клиентом;
+    # позволяет сопоставить разосланное сообщение с сохранённым и отбросить повторы
+    uid = models.CharField(max_length=26, null=True, blank=True, editable=False,
+                           verbose_name="Клиентский идентификатор")
+    # Монотонный номер сообщения внутри чата: ключ упорядочивания для дозагрузки
+    # пропущенного после переподключения (команда 'resume' в ChatConsumer)
+    seq = models.PositiveBigIntegerField(null=True, blank=True, editable=False,
+                                         verbose_name="Порядковый номер в чате")
 
     class Meta:
         verbose_name = "Сообщение"
         verbose_name_plural = "Сообщения"
         ordering = ['timestamp']
+        indexes = [
+            # Keyset-пагинация истории: каждая страница — диапазон по индексу
+            models.Index(fields=['chat', 'timestamp', 'id'], name='chat_msg_chat_ts_id_idx'),
+        ]
+        constraints = [
+            # Частичный уникальный индекс: на SQLite создаётся без перестройки таблицы
+            models.UniqueConstraint(fields=['uid'], condition=models.Q(uid__isnull=False),
+                                    name='chat_msg_uid_unique'),
+            # Он же служит индексом для диапазонного чтения (chat, seq > N)
+            models.UniqueConstraint(fields=['chat', 'seq'], condition=models.Q(seq__isnull=False),
+                                    name='chat_msg_chat_seq_unique'),
+        ]
+
+    def save(self, *args, **kwargs):
+        # Номер выдаётся в той же транзакции, что и INSERT: при ошибке записи
+        # откатывается и резервирование, пропусков в нумерации не остаётся
+        if self._state.adding and self.seq is None:
+            with transaction.atomic():
+                self.seq = Chat.objects.allocate_seq(self.chat_id)
+                super().save(*args, **kwargs)
+            return
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return f"{self.sender.username} ({self.chat.id}): {self.content[:30]}..."
 
 
+class ArchivedMessage(models.Model):
+    """
+    "Холодная" копия сообщения, перенесённого из Message командой
+    archive_messages. ID сохраняется, поэтому курсоры и ссылки остаются
+    действительными; история чата читает обе таблицы (chat/pagination.py).
+    """
+    id = models.BigIntegerField(primary_key=True)
+    chat = models.ForeignKey(Chat, on_delete=models.CASCADE, related_name='archived_messages', verbose_name="Чат")
+    sender = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+', verbose_name="Отправитель")
+    content = models.TextField(verbose_name="Содержание")
+    timestamp = models.DateTimeField()
+    uid = models.CharField(max_length=26, null=True, blank=True, verbose_name="Клиентский идентификатор")
+    seq = models.PositiveBigIntegerField(null=True, blank=True, verbose_name="Порядковый номер в чате")
+    archived_at = models.DateTimeField(auto_now_add=True, verbose_name="Перенесено в архив")
+
+    class Meta:
+        verbose_name = "Архивное сообщение"
+        verbose_name_plural = "Архивные сообщения"
+        indexes = [
+            models.Index(fields=['chat', 'timestamp', 'id'], name='chat_arch_chat_ts_id_idx'),
+        ]
+
+    def __str__(self):
+        return f"[архив] {self.sender_id} ({self.chat_id}): {self.content[:30]}..."
+
+
 # 3. Модель Квитанції про Прочитання (для сповіщень)
 class ReadReceipt(models.Model):
     """
@@ -57,11 +275,24 @@ class ReadReceipt(models.Model):
     chat = models.ForeignKey(Chat, on_delete=models.CASCADE, related_name='read_receipts', verbose_name="Чат")
     last_read_message = models.ForeignKey(Message, on_delete=models.SET_NULL, null=True,
                                           verbose_name="Последнее прочитанное сообщение")
+    # Денормализованный счётчик: увеличивается при каждом новом сообщении, обнуляется при прочтении
+    unread_count = models.PositiveIntegerField(default=0, verbose_name="Непрочитанные сообщения")
+    # Квитанция создаётся при вступлении в чат (chat/signals.py), поэтому created_at —
+    # момент появления участника; updated_at меняется при сдвиге last_read_message.
+    # Оба поля — водяные знаки для дельта-синхронизации (chat/sync.py)
+    created_at = models.DateTimeField(auto_now_add=True, null=True, verbose_name="Создана")
+    updated_at = models.DateTimeField(auto_now=True, null=True, verbose_name="Обновлена")
+
+    objects = ReadReceiptQuerySet.as_manager()
 
     class Meta:
         verbose_name = "Квитанция о прочтении"
         verbose_name_plural = "Квитанции о прочтении"
         unique_together = ('user', 'chat')  # Один пользователь может иметь только один статус прочтения для одного чата
+        indexes = [
+            models.Index(fields=['chat', 'updated_at'], name='chat_receipt_chat_upd_idx'),
+            models.Index(fields=['user', 'created_at'], name='chat_receipt_user_crt_idx'),
+        ]
 
     def __str__(self):
         return f"Пользователь {self.user.username} прочитал до: {self.last_read_message or 'Нет'}"
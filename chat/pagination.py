@@ -0,0 +1,127 @@
+# chat/pagination.py
+import base64
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import ValidationError
+
+
+class MessageKeysetPaginator:
+    """
+    Пагинация истории сообщений "назад" по курсору (timestamp, id).
+
+    Каждая страница — это диапазон по индексу (chat, timestamp, id), поэтому
+    стоимость запроса не зависит от того, насколько глубоко листают историю.
+    Курсор непрозрачен для клиента: это base64 от "timestamp|id" самого старого
+    сообщения на странице.
+    """
+
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+
+    def __init__(self, request=None):
+        self.request = request
+
+    @property
+    def default_page_size(self):
+        return getattr(settings, 'CHAT_MESSAGES_PAGE_SIZE', 50)
+
+    @property
+    def max_page_size(self):
+        return getattr(settings, 'CHAT_MESSAGES_MAX_PAGE_SIZE', 200)
+
+    # --- Курсор ---
+
+    @staticmethod
+    def encode_cursor(message):
+        raw = f'{message.timestamp.isoformat()}|{message.id}'
+        return base64.urlsafe_b64encode(raw.encode()).decode()
+
+    @staticmethod
+    def decode_cursor(cursor):
+        try:
+            raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+            timestamp, message_id = raw.rsplit('|', 1)
+            timestamp = parse_datetime(timestamp)
+            message_id = int(message_id)
+        except (ValueError, UnicodeDecodeError):
+            raise ValidationError({'cursor': 'Некорректный курсор.'})
+        if timestamp is None:
+            raise ValidationError({'cursor': 'Некорректный курсор.'})
+        return timestamp, message_id
+
+    # --- Параметры запроса ---
+
+    def get_page_size(self):
+        if self.request is None:
+            return self.default_page_size
+        value = self.request.query_params.get(self.page_size_query_param)
+        if value is None:
+            return self.default_page_size
+        try:
+            page_size = int(value)
+        except ValueError:
+            raise ValidationError({'page_size': 'Ожидается целое число.'})
+        if page_size < 1:
+            raise ValidationError({'page_size': 'Должно быть больше нуля.'})
+        return min(page_size, self.max_page_size)
+
+    def get_cursor(self):
+        if self.request is None:
+            return None
+        cursor = self.request.query_params.get(self.cursor_query_param)
+        return self.decode_cursor(cursor) if cursor else None
+
+    # --- Страница ---
+
+    def paginate(self, queryset, cursor=None, page_size=None, archive=None, archived_until=None):
+        """
+        Возвращает (messages, next_cursor). Сообщения отсортированы от старых к
+        новым, next_cursor указывает на более старую страницу (или None).
+
+        archive — queryset архивной таблицы того же чата, archived_until — самое
+        новое сообщение в ней. Архив читается, только если страница дошла до
+        архивного диапазона; строки обеих таблиц сливаются по (timestamp, id).
+        """
+        if page_size is None:
+            page_size = self.get_page_size()
+        if cursor is None:
+            cursor = self.get_cursor()
+
+        rows = self.fetch_page(queryset, cursor, page_size)
+        if archive is not None and archived_until is not None and (
+            len(rows) <= page_size or rows[-1].timestamp <= archived_until
+        ):
+            rows = sorted(
+                rows + self.fetch_page(archive, cursor, page_size),
+                key=lambda message: (message.timestamp, message.id),
+                reverse=True,
+            )[:page_size + 1]
+
+        has_more = len(rows) > page_size
+        rows = rows[:page_size]
+
+        next_cursor = self.encode_cursor(rows[-1]) if has_more else None
+        rows.reverse()
+        return rows, next_cursor
+
+    @staticmethod
+    def fetch_page(queryset, cursor, page_size):
+        """page_size + 1 строк старше курсора по индексу (chat, timestamp, id), от новых к старым."""
+        if cursor is not None:
+            timestamp, message_id = cursor
+            queryset = queryset.filter(
+                Q(timestamp__lt=timestamp) | Q(timestamp=timestamp, id__lt=message_id)
+            )
+        return list(queryset.order_by('-timestamp', '-id')[:page_size + 1])
+
+    def paginate_chat(self, chat, cursor=None, page_size=None):
+        """История чата из оперативной и архивной таблиц."""
+        return self.paginate(
+            chat.messages.select_related('sender'),
+            cursor=cursor,
+            page_size=page_size,
+            archive=chat.archived_messages.select_related('sender'),
+            archived_until=chat.archived_until,
+        )
@@ -1,6 +1,8 @@
 # chat/permissions.py
 from rest_framework import permissions
 
+from .membership import is_member
+
 
 class IsParticipant(permissions.BasePermission):
     """
@@ -10,10 +12,10 @@ class IsParticipant(permissions.BasePermission):
     def has_object_permission(self, request, view, obj):
         # Разрешаем GET, POST, HEAD, OPTIONS
         if request.method in permissions.SAFE_METHODS:
-            return request.user.is_authenticated and request.user in obj.participants.all()
+            return request.user.is_authenticated and is_member(obj.pk, request.user.pk)
 
         # Для изменения (PUT/PATCH/DELETE) разрешаем, если пользователь - участник
-        return request.user.is_authenticated and request.user in obj.participants.all()
+        return request.user.is_authenticated and is_member(obj.pk, request.user.pk)
 
 # Разрешение, чтобы только авторизованные могли создавать/читать списки чатов/сообщений
 # (Вам достаточно использовать permissions.IsAuthenticated в views.py)
\ No newline at end of file
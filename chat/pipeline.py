@@ -0,0 +1,260 @@
+# chat/pipeline.py
+"""
+Конвеєр відкладеного збереження повідомлень WebSocket (CHAT_PERSISTENCE_MODE = 'pipeline').
+
+У синхронному режимі кожне повідомлення послідовно проходить перевірку
+участі, INSERT та оновлення ReadReceipt у thread-sensitive executor, тож увесь
+трафік воркера впирається в один потік. У режимі конвеєра:
+
+* участь перевіряється за кешем членства (chat/membership.py);
+* повідомленню одразу призначається ULID (або береться ULID клієнта);
+* кадр розсилається негайно, ще до запису в БД;
+* фонова задача записує повідомлення пачками через bulk_create — щойно
+  набирається CHAT_PIPELINE_BATCH_SIZE повідомлень або минає
+  CHAT_PIPELINE_FLUSH_INTERVAL секунд;
+* після запису учасникам розсилається кадр 'persisted' з id та seq
+  збережених повідомлень (seq видається лише при записі в БД).
+
+Якщо пачка не записалася (наприклад, конфлікт uid), її повідомлення пишуться
+поодинці, щоб помилка одного не зачепила інших. Повідомлення, що не
+записалося, повертається в чергу й пробується знову під час наступних
+скидань — до CHAT_PIPELINE_MAX_ATTEMPTS спроб; після цього учасники (і
+відправник) отримують кадр 'failed' з його uid, щоб прибрати вже показане
+повідомлення.
+
+Гарантії при завершенні задає CHAT_PIPELINE_DURABILITY:
+* 'flush' — буфер дописується при відключенні сокета та при виході процесу;
+* 'none'  — повідомлення в буфері можуть бути втрачені (найшвидше).
+"""
+import asyncio
+import atexit
+import logging
+import os
+import re
+import threading
+import time
+
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import transaction
+
+from .delivery import get_target_groups, group_send_many
+from .encoding import dumps
+from .models import Chat, Message, ReadReceipt
+
+logger = logging.getLogger(__name__)
+
+PERSISTENCE_SYNC = 'sync'
+PERSISTENCE_PIPELINE = 'pipeline'
+
+CROCKFORD_ALPHABET = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'
+ULID_RE = re.compile(r'^[0-9A-HJKMNP-TV-Z]{26}$')
+
+
+def get_persistence_mode():
+    return getattr(settings, 'CHAT_PERSISTENCE_MODE', PERSISTENCE_SYNC)
+
+
+def new_ulid():
+    """ULID: 48 біт часу в мс + 80 біт випадковості, Crockford base32."""
+    value = (int(time.time() * 1000) << 80) | int.from_bytes(os.urandom(10), 'big')
+    chars = []
+    for _ in range(26):
+        value, index = divmod(value, 32)
+        chars.append(CROCKFORD_ALPHABET[index])
+    return ''.join(reversed(chars))
+
+
+def normalize_ulid(value):
+    """ULID клієнта у канонічному вигляді або None, якщо формат невірний."""
+    if not isinstance(value, str):
+        return None
+    value = value.upper()
+    return value if ULID_RE.match(value) else None
+
+
+class MessagePipeline:
+
+    def __init__(self):
+        self._pending = []
+        self._lock = threading.Lock()
+        self._loop = None
+        self._task = None
+        self._has_items = None
+        self._batch_full = None
+
+    # --- Налаштування ---
+
+    @property
+    def batch_size(self):
+        return getattr(settings, 'CHAT_PIPELINE_BATCH_SIZE', 200)
+
+    @property
+    def flush_interval(self):
+        return getattr(settings, 'CHAT_PIPELINE_FLUSH_INTERVAL', 0.05)
+
+    @property
+    def max_attempts(self):
+        return getattr(settings, 'CHAT_PIPELINE_MAX_ATTEMPTS', 3)
+
+    @property
+    def durability(self):
+        return getattr(settings, 'CHAT_PIPELINE_DURABILITY', 'flush')
+
+    # --- Прийом повідомлень (у циклі подій) ---
+
+    def submit(self, message):
+        """Ставить незбережене повідомлення в чергу на запис."""
+        with self._lock:
+            self._pending.append(message)
+            pending = len(self._pending)
+
+        self._ensure_worker()
+        self._has_items.set()
+        if pending >= self.batch_size:
+            self._batch_full.set()
+
+    def _ensure_worker(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._task is None or self._task.done():
+            self._loop = loop
+            self._has_items = asyncio.Event()
+            self._batch_full = asyncio.Event()
+            self._task = loop.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            await self._has_items.wait()
+            if not self._batch_full.is_set():
+                try:
+                    await asyncio.wait_for(self._batch_full.wait(), self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+            self._has_items.clear()
+            self._batch_full.clear()
+            await self.flush_and_notify(get_channel_layer())
+            if self.pending_count():
+                # Повтори невдалих записів — наступним скиданням
+                self._has_items.set()
+
+    async def flush_and_notify(self, channel_layer):
+        """Записує буфер і розсилає кадри 'persisted' / 'failed' (фонова задача, відключення сокета)."""
+        notices = await database_sync_to_async(self.flush_with_notices)()
+        for group_names, frame in notices:
+            await group_send_many(channel_layer, group_names, {'type': 'chat.message', 'frame': frame})
+
+    # --- Запис (синхронно) ---
+
+    def flush(self):
+        """
+        Записує всі накопичені повідомлення пачками, з повторами невдалих
+        (до CHAT_PIPELINE_MAX_ATTEMPTS). Повертає кількість збережених.
+        """
+        saved = []
+        for _ in range(self.max_attempts):
+            saved.extend(self._drain()[0])
+            if not self.pending_count():
+                break
+        return len(saved)
+
+    def _drain(self):
+        """
+        Записує повідомлення, що були в черзі на момент виклику. Повертає
+        (збережені, остаточно не збережені); решта невдалих повертається в чергу.
+        """
+        saved, failed, retry = [], [], []
+        with self._lock:
+            queued, self._pending = self._pending, []
+        for offset in range(0, len(queued), self.batch_size):
+            batch = queued[offset:offset + self.batch_size]
+            try:
+                saved.extend(self._write(batch))
+                continue
+            except Exception:
+                logger.exception("Не вдалося зберегти пачку з %d повідомлень, пишемо поодинці", len(batch))
+            for message in batch:
+                try:
+                    saved.extend(self._write([message]))
+                except Exception:
+                    message.persist_attempts = getattr(message, 'persist_attempts', 0) + 1
+                    if message.persist_attempts >= self.max_attempts:
+                        logger.exception("Повідомлення %s не збережено після %d спроб", message.uid, self.max_attempts)
+                        failed.append(message)
+                    else:
+                        retry.append(message)
+        if retry:
+            with self._lock:
+                self._pending[:0] = retry
+        return saved, failed
+
+    def flush_with_notices(self):
+        """
+        Записує буфер і готує кадри 'persisted' — по одному на чат — щоб
+        клієнти дізналися id та seq повідомлень, розісланих до запису, і
+        кадри 'failed' для повідомлень, які так і не вдалося зберегти.
+        """
+        saved, failed = self._drain()
+        notices = []
+        for frame_type, messages, fields in (
+            ('persisted', saved, ('uid', 'id', 'seq')),
+            ('failed', failed, ('uid',)),
+        ):
+            by_chat = {}
+            for message in messages:
+                by_chat.setdefault(message.chat_id, []).append(message)
+            for chat_id, chat_messages in by_chat.items():
+                frame = dumps({
+                    'type': frame_type,
+                    'chat_id': chat_id,
+                    'messages': [{name: getattr(m, name) for name in fields} for m in chat_messages],
+                })
+                notices.append((get_target_groups(chat_id), frame))
+        return notices
+
+    def _write(self, batch):
+        # Повтори з тим самим ULID клієнта не створюють дублікатів
+        existing = set(
+            Message.objects.filter(uid__in=[m.uid for m in batch]).values_list('uid', flat=True)
+        )
+        unique = {}
+        for message in batch:
+            if message.uid not in existing:
+                unique.setdefault(message.uid, message)
+        messages = list(unique.values())
+        if not messages:
+            return []
+
+        by_chat = {}
+        for message in messages:
+            by_chat.setdefault(message.chat_id, []).append(message)
+
+        with transaction.atomic():
+            # bulk_create обходить Message.save(), тож номери резервуємо діапазоном на чат
+            for chat_id, chat_messages in by_chat.items():
+                first_seq = Chat.objects.allocate_seq(chat_id, len(chat_messages))
+                for offset, message in enumerate(chat_messages):
+                    message.seq = first_seq + offset
+            Message.objects.bulk_create(messages)
+            ReadReceipt.objects.register_messages(messages)
+        return messages
+
+    def discard(self):
+        """Відкидає незаписані повідомлення. Повертає їх кількість."""
+        with self._lock:
+            dropped = len(self._pending)
+            self._pending.clear()
+        return dropped
+
+    def pending_count(self):
+        with self._lock:
+            return len(self._pending)
+
+
+message_pipeline = MessagePipeline()
+
+
+@atexit.register
+def _flush_on_shutdown():
+    if message_pipeline.durability == 'flush':
+        message_pipeline.flush()
@@ -0,0 +1,291 @@
+# chat/presence.py
+"""
+Присутність ("онлайн") і індикатор набору тексту — без жодного запису в БД.
+Статус видно лише співрозмовникам — користувачам зі спільним чатом
+(contact_ids, один запит на підписку чи REST-запит).
+
+Стан тримається в пам'яті процесу: кількість сокетів користувача і час
+останнього heartbeat (підключення або команда 'presence'). Користувач
+вважається онлайн, доки heartbeat не старший за CHAT_PRESENCE_TTL секунд.
+Якщо задано CHAT_PRESENCE_CACHE_ALIAS, час heartbeat дублюється в спільний
+Django-кеш (не частіше ніж раз на третину TTL), щоб REST-запити й інші
+воркери бачили користувачів, підключених до сусідніх процесів. Там же
+лічильник процесів, у яких користувач має сокети: спільний запис
+видаляється, лише коли останній процес закрив останній сокет.
+
+Присутність розсилається в групу presence_{id}: на неї підписуються лише
+сокети, яким цей користувач зараз цікавий (команда 'presence' з 'subscribe';
+підписатися можна лише на співрозмовників зі спільних чатів), тож
+підключення не вимагає обходу всіх чатів і співрозмовників.
+
+Розсилки об'єднуються: не більше одного оновлення присутності на
+користувача за CHAT_PRESENCE_BROADCAST_INTERVAL секунд (оновлення, що
+прийшли в цьому вікні, зливаються в одне з актуальним станом) і не більше
+одного 'typing' на користувача й чат за CHAT_TYPING_INTERVAL, якщо стан не
+змінився. Клієнт гасить індикатор, якщо оновлень немає довше за 'ttl' кадру.
+"""
+import asyncio
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+
+from .encoding import dumps
+
+
+def presence_group_name(user_id):
+    return f'presence_{user_id}'
+
+
+def contact_ids(user, user_ids):
+    """Ті з user_ids, хто має з користувачем спільний чат (один запит)."""
+    if not user_ids:
+        return set()
+    return set(
+        get_user_model().objects.filter(id__in=user_ids, chats__participants=user)
+        .values_list('id', flat=True).distinct()
+    )
+
+
+class UserPresence:
+    __slots__ = ('sockets', 'elsewhere', 'last_seen', 'cache_written', 'last_broadcast', 'pending', 'typing')
+
+    def __init__(self):
+        self.sockets = 0
+        # Сокетів у процесі немає, але вони є в інших процесах (спільний лічильник)
+        self.elsewhere = False
+        self.last_seen = 0.0
+        self.cache_written = 0.0
+        self.last_broadcast = 0.0
+        self.pending = False
+        self.typing = {}
+
+
+class PresenceRegistry:
+    shared_key_prefix = 'chat:presence:'
+    shared_count_prefix = 'chat:presence:processes:'
+
+    def __init__(self):
+        self._users = {}
+        self._lock = threading.Lock()
+        self._tasks = set()
+
+    # --- Налаштування ---
+
+    @property
+    def ttl(self):
+        return getattr(settings, 'CHAT_PRESENCE_TTL', 60)
+
+    @property
+    def broadcast_interval(self):
+        return getattr(settings, 'CHAT_PRESENCE_BROADCAST_INTERVAL', 5)
+
+    @property
+    def typing_interval(self):
+        return getattr(settings, 'CHAT_TYPING_INTERVAL', 3)
+
+    @property
+    def shared_cache(self):
+        alias = getattr(settings, 'CHAT_PRESENCE_CACHE_ALIAS', None)
+        return caches[alias] if alias else None
+
+    # --- Стан сокетів ---
+
+    def connect(self, user_id):
+        with self._lock:
+            entry = self._users.get(user_id)
+            if entry is None:
+                entry = self._users[user_id] = UserPresence()
+            entry.sockets += 1
+            entry.elsewhere = False
+            first = entry.sockets == 1
+
+        cache = self.shared_cache
+        if cache is not None and first:
+            key = f'{self.shared_count_prefix}{user_id}'
+            cache.add(key, 0, timeout=self.ttl * 2)
+            try:
+                cache.incr(key)
+            except ValueError:
+                # Ключ устиг зникнути між add та incr
+                cache.set(key, 1, timeout=self.ttl * 2)
+        self.heartbeat(user_id)
+
+    def heartbeat(self, user_id):
+        now = time.time()
+        with self._lock:
+            entry = self._users.get(user_id)
+            if entry is None:
+                return
+            entry.last_seen = now
+            write_shared = now - entry.cache_written >= self.ttl / 3
+            if write_shared:
+                entry.cache_written = now
+
+        cache = self.shared_cache
+        if cache is not None and write_shared:
+            cache.set(f'{self.shared_key_prefix}{user_id}', now, timeout=self.ttl)
+            # Лічильник процесів живе, доки хоч один процес надсилає heartbeat
+            cache.touch(f'{self.shared_count_prefix}{user_id}', timeout=self.ttl * 2)
+
+    def disconnect(self, user_id):
+        """Повертає True, якщо закрито останній сокет користувача в процесі."""
+        with self._lock:
+            entry = self._users.get(user_id)
+            if entry is None:
+                return False
+            entry.sockets = max(entry.sockets - 1, 0)
+            offline = entry.sockets == 0
+            if offline:
+                # Запис видаляє take_broadcast після розсилки статусу 'offline'
+                entry.typing.clear()
+
+        cache = self.shared_cache
+        if cache is not None and offline:
+            key = f'{self.shared_count_prefix}{user_id}'
+            try:
+                remaining = cache.decr(key)
+            except ValueError:
+                remaining = 0
+            if remaining > 0:
+                # Користувач лишається онлайн через сокети інших процесів
+                with self._lock:
+                    entry = self._users.get(user_id)
+                    if entry is not None and not entry.sockets:
+                        entry.elsewhere = True
+            else:
+                cache.delete_many([f'{self.shared_key_prefix}{user_id}', key])
+        return offline
+
+    # --- Запити стану ---
+
+    def _local_last_seen(self, user_id, now):
+        entry = self._users.get(user_id)
+        if entry is not None and entry.sockets and now - entry.last_seen < self.ttl:
+            return entry.last_seen
+        return None
+
+    def statuses(self, user_ids):
+        """{user_id: {'online': bool, 'last_seen': unix-час heartbeat або None}} одним проходом."""
+        now = time.time()
+        with self._lock:
+            seen = {user_id: self._local_last_seen(user_id, now) for user_id in user_ids}
+
+        cache = self.shared_cache
+        missing = [user_id for user_id, last_seen in seen.items() if last_seen is None]
+        if cache is not None and missing:
+            keys = {f'{self.shared_key_prefix}{user_id}': user_id for user_id in missing}
+            for key, last_seen in cache.get_many(list(keys)).items():
+                if now - last_seen < self.ttl:
+                    seen[keys[key]] = last_seen
+
+        return {
+            user_id: {'online': last_seen is not None, 'last_seen': last_seen}
+            for user_id, last_seen in seen.items()
+        }
+
+    def is_online(self, user_id):
+        return self.statuses([user_id])[user_id]['online']
+
+    # --- Об'єднання розсилок ---
+
+    def claim_broadcast(self, user_id):
+        """
+        Резервує розсилку присутності. Повертає 0 — надіслати зараз, число —
+        надіслати через стільки секунд, None — розсилка вже запланована.
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._users.get(user_id)
+            if entry is None:
+                return None
+            if entry.pending:
+                return None
+            entry.pending = True
+            return max(0.0, entry.last_broadcast + self.broadcast_interval - now)
+
+    def take_broadcast(self, user_id):
+        """Знімає резерв і повертає кадр з актуальним станом користувача (або None)."""
+        now = time.time()
+        with self._lock:
+            entry = self._users.get(user_id)
+            if entry is None:
+                return None
+            entry.pending = False
+            entry.last_broadcast = time.monotonic()
+            online = bool(entry.sockets) or entry.elsewhere
+            if not entry.sockets:
+                del self._users[user_id]
+
+        frame = dumps({
+            'type': 'presence',
+            'user_id': user_id,
+            'online': online,
+            'last_seen': entry.last_seen,
+            'ttl': self.ttl if online else 0,
+            'server_time': now,
+        })
+        return frame
+
+    def claim_typing(self, user_id, chat_id, is_typing):
+        """True, якщо подію 'typing' треба розіслати (стан змінився або минув інтервал)."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._users.get(user_id)
+            if entry is None:
+                return False
+            previous = entry.typing.get(chat_id)
+            if previous is not None and previous[0] == is_typing and now - previous[1] < self.typing_interval:
+                return False
+            if is_typing:
+                entry.typing[chat_id] = (is_typing, now)
+            else:
+                entry.typing.pop(chat_id, None)
+                if previous is None:
+                    return False
+            return True
+
+    async def publish(self, channel_layer, user_id):
+        """
+        Розсилає присутність користувача в групу presence_{id} (її слухають
+        сокети, що підписалися командою 'presence') з урахуванням вікна об'єднання.
+        """
+        delay = self.claim_broadcast(user_id)
+        if delay is None:
+            return
+        if delay:
+            task = asyncio.ensure_future(self._publish_later(channel_layer, user_id, delay))
+            # Тримаємо посилання, щоб задачу не прибрав збирач сміття
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+            return
+        await self._send(channel_layer, user_id)
+
+    async def _publish_later(self, channel_layer, user_id, delay):
+        await asyncio.sleep(delay)
+        await self._send(channel_layer, user_id)
+
+    async def _send(self, channel_layer, user_id):
+        frame = self.take_broadcast(user_id)
+        if frame is not None:
+            await channel_layer.group_send(presence_group_name(user_id), {'type': 'chat.message', 'frame': frame})
+
+    def clear(self):
+        with self._lock:
+            self._users.clear()
+        for task in list(self._tasks):
+            task.cancel()
+        self._tasks.clear()
+
+
+presence = PresenceRegistry()
+
+
+async def call_async(func, *args):
+    """Виклик методу реєстру з циклу подій: у потоці, лише якщо задіяно спільний кеш."""
+    if presence.shared_cache is None:
+        return func(*args)
+    return await sync_to_async(func)(*args)
@@ -0,0 +1,132 @@
+# chat/receipts.py
+"""
+Буфер відміток "прочитано".
+
+Клієнт надсилає mark_as_read при кожному фокусі чату, тому записи ReadReceipt
+накопичуються по парі (user, chat) і скидаються в БД пачкою раз на
+CHAT_READ_RECEIPT_FLUSH_INTERVAL секунд. Для кожної пари зберігається лише
+найбільший ID повідомлення; "останнє повідомлення чату" (LATEST) визначається
+в момент відмітки, тож повідомлення, що прийшли до скидання, не вважаються
+прочитаними.
+
+Скидання — три запити на пачку: створення відсутніх квитанцій, один UPDATE,
+що лише зсуває last_read_message вперед (нижчий ID не перезаписує вищий), і
+перерахунок unread_count цих квитанцій (ReadReceiptQuerySet.recount) —
+нові повідомлення між відміткою та скиданням лишаються непрочитаними.
+
+Буфер гарантовано скидається при відключенні сокета (flush(user_id=...)) і при
+завершенні процесу (atexit). Інтервал 0 вимикає буферизацію — запис одразу.
+"""
+import atexit
+import threading
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import BigIntegerField, Case, Q, Value, When
+from django.utils import timezone
+
+from .models import Message, ReadReceipt
+
+LATEST = None
+# Пар (user, chat) в одному UPDATE ... CASE при скиданні
+FLUSH_CHUNK_SIZE = 200
+
+
+class ReadReceiptBuffer:
+
+    def __init__(self):
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._timer = None
+
+    @property
+    def flush_interval(self):
+        return getattr(settings, 'CHAT_READ_RECEIPT_FLUSH_INTERVAL', 1.0)
+
+    def mark(self, chat_id, user_id, message_id=LATEST):
+        """Відмічає чат прочитаним до message_id (за замовчуванням — до останнього на цей момент)."""
+        if message_id is LATEST:
+            # Одне читання за індексом (chat, seq)
+            message_id = Message.objects.filter(chat_id=chat_id, seq__isnull=False).order_by('-seq').values_list(
+                'id', flat=True,
+            ).first()
+            if message_id is None:
+                # У чаті ще немає повідомлень — нічого відмічати
+                return
+        key = (int(user_id), int(chat_id))
+        buffered = self.flush_interval > 0
+
+        with self._lock:
+            self._pending[key] = max(self._pending.get(key, 0), message_id)
+
+            if buffered and self._timer is None:
+                self._timer = threading.Timer(self.flush_interval, self._flush_from_timer)
+                self._timer.daemon = True
+                self._timer.start()
+
+        if not buffered:
+            self.flush()
+
+    def flush(self, user_id=None):
+        """Записує накопичені відмітки (усі або лише одного користувача). Повертає кількість."""
+        with self._lock:
+            if user_id is None:
+                batch, self._pending = self._pending, {}
+                if self._timer is not None:
+                    self._timer.cancel()
+                    self._timer = None
+            else:
+                batch = {key: value for key, value in self._pending.items() if key[0] == user_id}
+                for key in batch:
+                    del self._pending[key]
+
+        if not batch:
+            return 0
+
+        items = list(batch.items())
+        for offset in range(0, len(items), FLUSH_CHUNK_SIZE):
+            self._write(items[offset:offset + FLUSH_CHUNK_SIZE])
+        return len(items)
+
+    @staticmethod
+    def _write(items):
+        """Зсуває last_read_message лише вперед і перераховує unread_count квитанцій пачки."""
+        pairs = reduce(or_, [Q(user_id=user_id, chat_id=chat_id) for (user_id, chat_id), _ in items])
+        read_up_to = Case(
+            *[When(user_id=user_id, chat_id=chat_id, then=Value(message_id)) for (user_id, chat_id), message_id in items],
+            output_field=BigIntegerField(),
+        )
+        # Квитанції створюються при вступі в чат (chat/signals.py); тут — лише для старих даних.
+        # Явна транзакція не потрібна: recount() ідемпотентний і враховує повідомлення,
+        # що надійшли між запитами
+        ReadReceipt.objects.bulk_create(
+            [ReadReceipt(user_id=user_id, chat_id=chat_id) for (user_id, chat_id), _ in items],
+            ignore_conflicts=True,
+        )
+        ReadReceipt.objects.filter(pairs).filter(
+            Q(last_read_message__isnull=True) | Q(last_read_message__lt=read_up_to),
+        ).update(last_read_message=read_up_to, updated_at=timezone.now())
+        ReadReceipt.objects.filter(pairs).recount()
+
+    def pending_count(self):
+        with self._lock:
+            return len(self._pending)
+
+    def _flush_from_timer(self):
+        with self._lock:
+            self._timer = None
+        try:
+            self.flush()
+        finally:
+            # Таймер працює в окремому потоці зі своїм з'єднанням
+            connection.close()
+
+
+receipt_buffer = ReadReceiptBuffer()
+
+
+@atexit.register
+def _flush_on_shutdown():
+    receipt_buffer.flush()
@@ -0,0 +1,114 @@
+# chat/search.py
+"""
+Повнотекстовий пошук по повідомленнях чатів, доступних користувачу.
+
+Індекс створюється міграцією 0004_message_search_index: FTS5 на SQLite,
+tsvector + GIN на PostgreSQL. На інших БД використовується icontains
+(без індексу й без ранжування).
+
+Ранжування (bm25 / ts_rank) — найдорожча частина запиту, тому воно
+рахується лише для CHAT_SEARCH_RANK_WINDOW найновіших збігів у чатах
+користувача. Для рідкісних слів це повне ранжування, для дуже частих —
+ранжування в межах свіжої історії, зате час запиту обмежений.
+"""
+import re
+
+from django.conf import settings
+from django.db import connection
+
+from .models import Chat, Message
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def build_fts5_query(query):
+    """
+    Перетворює рядок користувача на безпечний запит FTS5: кожне слово береться
+    в лапки (усі слова обов'язкові), останнє шукається за префіксом.
+    """
+    tokens = TOKEN_RE.findall(query)
+    if not tokens:
+        return None
+    quoted = ['"%s"' % token.replace('"', '""') for token in tokens]
+    quoted[-1] += '*'
+    return ' '.join(quoted)
+
+
+def _participant_join():
+    through = Chat.participants.through._meta.db_table
+    user_column = Chat.participants.field.m2m_reverse_name()
+    return through, user_column
+
+
+def get_rank_window():
+    return getattr(settings, 'CHAT_SEARCH_RANK_WINDOW', 2000)
+
+
+def search_message_ids(user, query, limit, offset=0):
+    """ID знайдених повідомлень, впорядковані за релевантністю (найкращі першими)."""
+    through, user_column = _participant_join()
+    message_table = Message._meta.db_table
+    window = get_rank_window()
+    if offset >= window:
+        return []
+
+    if connection.vendor == 'sqlite':
+        fts_query = build_fts5_query(query)
+        if fts_query is None:
+            return []
+        sql = f"""
+            SELECT id FROM (
+                SELECT chat_message_fts.rowid AS id, chat_message_fts.rank AS rank
+                FROM chat_message_fts
+                JOIN {message_table} m ON m.id = chat_message_fts.rowid
+                JOIN {through} p ON p.chat_id = m.chat_id AND p.{user_column} = %s
+                WHERE chat_message_fts MATCH %s
+                ORDER BY chat_message_fts.rowid DESC
+                LIMIT %s
+            ) candidates
+            ORDER BY rank, id DESC
+            LIMIT %s OFFSET %s
+        """
+        params = [user.pk, fts_query, window, limit, offset]
+
+    elif connection.vendor == 'postgresql':
+        if not TOKEN_RE.search(query):
+            return []
+        sql = f"""
+            SELECT id FROM (
+                SELECT m.id, ts_rank(m.search_vector, q) AS rank
+                FROM {message_table} m
+                JOIN {through} p ON p.chat_id = m.chat_id AND p.{user_column} = %s,
+                     websearch_to_tsquery('simple', %s) q
+                WHERE m.search_vector @@ q
+                ORDER BY m.id DESC
+                LIMIT %s
+            ) candidates
+            ORDER BY rank DESC, id DESC
+            LIMIT %s OFFSET %s
+        """
+        params = [user.pk, query, window, limit, offset]
+
+    else:
+        return list(
+            Message.objects.filter(chat__participants=user, content__icontains=query)
+            .order_by('-id').values_list('id', flat=True)[offset:min(offset + limit, window)]
+        )
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [row[0] for row in cursor.fetchall()]
+
+
+def search_messages(user, query, page_size, page=1):
+    """
+    Сторінка результатів пошуку: (messages, has_next). Повідомлення
+    завантажуються одним запитом разом з відправником.
+    """
+    offset = (page - 1) * page_size
+    ids = search_message_ids(user, query, page_size + 1, offset)
+    has_next = len(ids) > page_size
+    ids = ids[:page_size]
+
+    messages = Message.objects.select_related('sender').in_bulk(ids)
+    return [messages[message_id] for message_id in ids if message_id in messages], has_next
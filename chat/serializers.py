@@ -2,6 +2,7 @@
 
 from rest_framework import serializers
 from .models import Chat, Message, ReadReceipt  # Додано імпорт ReadReceipt
+from .pagination import MessageKeysetPaginator
 from django.contrib.auth import get_user_model
 from tasks.serializers import UserAssignedSerializer
 
@@ -14,8 +15,8 @@ class MessageSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Message
-        fields = ['id', 'chat', 'sender', 'content', 'timestamp']
-        read_only_fields = ['sender']
+        fields = ['id', 'uid', 'seq', 'chat', 'sender', 'content', 'timestamp']
+        read_only_fields = ['sender', 'uid', 'seq']
 
 
 class ChatListSerializer(serializers.ModelSerializer):
@@ -30,6 +31,11 @@ class ChatListSerializer(serializers.ModelSerializer):
 
     def get_last_message(self, obj):
         """Получает последнее сообщение в чате."""
+        # Список чатов заранее подгружает последние сообщения (см. ChatViewSet.list)
+        if hasattr(obj, 'last_message_obj'):
+            message = obj.last_message_obj
+            return MessageSerializer(message).data if message else None
+
         try:
             # 🛠️ ИСПРАВЛЕНИЕ 1: Использование 'messages' вместо 'message_set'
             message = obj.messages.latest('timestamp')
@@ -39,28 +45,64 @@ class ChatListSerializer(serializers.ModelSerializer):
 
     def get_unread_count(self, chat):
         """Рассчитывает количество непрочитанных сообщений для текущего пользователя."""
+        # Значение уже посчитано подзапросом в ChatQuerySet.with_summary
+        if hasattr(chat, 'unread_total'):
+            return chat.unread_total
+
         user = self.context.get('request').user
         if not user or not user.is_authenticated:
             return 0
 
-        try:
-            receipt = ReadReceipt.objects.select_related('last_read_message').get(chat=chat, user=user)
-        except ReadReceipt.DoesNotExist:
-            receipt = None
+        # Счётчик поддерживается инкрементально (см. ReadReceiptQuerySet)
+        unread_count = ReadReceipt.objects.filter(
+            chat=chat, user=user,
+        ).values_list('unread_count', flat=True).first()
 
-        last_read_id = receipt.last_read_message.id if (receipt and receipt.last_read_message) else 0
+        return unread_count or 0
 
-        # 🛠️ ИСПРАВЛЕНИЕ 2: Использование 'messages' вместо 'message_set'
-        unread_count = chat.messages.filter(
-            id__gt=last_read_id,
-        ).exclude(sender=user).count()
 
-        return unread_count
+class ChatParticipantsSerializer(serializers.Serializer):
+    """
+    Участники нового чата: ID приводятся к int ("5" и 5 — один участник),
+    существование пользователей проверяется одним запросом.
+    """
+    participants = serializers.ListField(child=serializers.IntegerField(min_value=1), allow_empty=False)
 
+    def validate_participants(self, value):
+        user_ids = set(value)
+        missing = user_ids - set(User.objects.filter(id__in=user_ids).values_list('id', flat=True))
+        if missing:
+            raise serializers.ValidationError(f'Пользователи не найдены: {sorted(missing)}.')
+        return user_ids
 
-class ChatDetailSerializer(ChatListSerializer):
-    """Сериализатор для детального просмотра чата (включает историю сообщений)."""
-    messages = MessageSerializer(many=True, read_only=True)
 
-    class Meta(ChatListSerializer.Meta):
-        fields = ChatListSerializer.Meta.fields + ['messages']
\ No newline at end of file
+class ChatSyncSerializer(serializers.ModelSerializer):
+    """Чат, в который пользователя добавили (дельта-синхронизация)."""
+    participants = UserAssignedSerializer(many=True, read_only=True)
+
+    class Meta:
+        model = Chat
+        fields = ['id', 'title', 'is_group_chat', 'participants', 'created_at']
+
+
+class ReadReceiptSyncSerializer(serializers.ModelSerializer):
+    """Изменившаяся квитанция о прочтении (дельта-синхронизация)."""
+
+    class Meta:
+        model = ReadReceipt
+        fields = ['chat', 'user', 'last_read_message', 'updated_at']
+
+
+class ChatDetailSerializer(ChatListSerializer):
+    """
+    Сериализатор для детального просмотра чата: метаданные и только последняя
+    страница сообщений. Более старые сообщения отдаёт `chats/{id}/messages/`
+    по курсору `messages_cursor`.
+    """
+
+    def to_representation(self, chat):
+        data = super().to_representation(chat)
+        messages, next_cursor = MessageKeysetPaginator().paginate_chat(chat)
+        data['messages'] = MessageSerializer(messages, many=True).data
+        data['messages_cursor'] = next_cursor
+        return data
@@ -0,0 +1,51 @@
+# chat/signals.py
+from django.db.models.signals import m2m_changed, post_delete
+from django.dispatch import receiver
+
+from .membership import membership
+from .models import Chat, ReadReceipt
+
+
+@receiver(m2m_changed, sender=Chat.participants.through)
+def create_read_receipts(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Створює ReadReceipt для нових учасників чату, щоб лічильник непрочитаних
+    можна було збільшувати одним UPDATE при кожному новому повідомленні.
+    """
+    if action != 'post_add' or not pk_set:
+        return
+
+    if reverse:
+        # user.chats.add(...) — instance є користувачем
+        receipts = [ReadReceipt(chat_id=chat_id, user_id=instance.pk) for chat_id in pk_set]
+        affected = ReadReceipt.objects.filter(user_id=instance.pk, chat_id__in=pk_set)
+    else:
+        receipts = [ReadReceipt(chat_id=instance.pk, user_id=user_id) for user_id in pk_set]
+        affected = ReadReceipt.objects.filter(chat_id=instance.pk, user_id__in=pk_set)
+
+    ReadReceipt.objects.bulk_create(receipts, ignore_conflicts=True)
+
+    # Новий учасник бачить уже наявні повідомлення як непрочитані
+    affected.recount()
+
+
+@receiver(m2m_changed, sender=Chat.participants.through)
+def invalidate_membership(sender, instance, action, reverse, pk_set, **kwargs):
+    """Скидає кеш членства для чатів, склад яких змінився."""
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            membership.invalidate(instance.pk)
+        return
+
+    # user.chats.add/remove/clear(...) — instance є користувачем
+    if action == 'pre_clear':
+        instance._cleared_chat_ids = list(instance.chats.values_list('id', flat=True))
+    elif action == 'post_clear':
+        membership.invalidate(*getattr(instance, '_cleared_chat_ids', []))
+    elif action in ('post_add', 'post_remove') and pk_set:
+        membership.invalidate(*pk_set)
+
+
+@receiver(post_delete, sender=Chat)
+def invalidate_deleted_chat(sender, instance, **kwargs):
+    membership.invalidate(instance.pk)
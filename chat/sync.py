@@ -0,0 +1,221 @@
+# chat/sync.py
+"""
+Дельта-синхронізація для клієнтів, що опитують сервер (GET /api/chat/sync/).
+
+Замість списку чатів і деталей кожного чату клієнт одним запитом отримує
+все, що змінилося з моменту водяного знака:
+
+* нові повідомлення в його чатах — за номером seq у кожному чаті, сторінками
+  по page_size;
+* квитанції, у яких зсунувся last_read_message (індекс chat + updated_at);
+* чати, до яких користувача додано (індекс user + created_at квитанції).
+
+Кожен із трьох списків обмежено page_size; `has_more` істинне, доки
+хоч один із них не вичерпано.
+
+Водяний знак повідомлень — останній відомий seq кожного чату, а не ID
+повідомлення. ID видається при INSERT, і транзакція з меншим ID може
+закомітитися пізніше за більший — такий рядок опинився б позаду водяного
+знака й ніколи не повернувся б. Номер seq резервується UPDATE рядка чату
+(ChatQuerySet.allocate_seq), який тримає блокування до коміту, тож усередині
+чату seq комітяться строго по черзі: якщо Chat.last_seq = N, усі
+повідомлення з seq <= N уже видно.
+
+Квитанції й чати гортаються keyset-сторінками: за (updated_at, id) та
+(created_at квитанції, id), а під час повної синхронізації — за id. Після
+останньої сторінки водяним знаком стає час початку першої сторінки
+("раунду"), тож зміни, що сталися, поки клієнт гортав, прийдуть наступним
+опитуванням (можливо, повторно — клієнт застосовує їх ідемпотентно).
+
+`since` — ID повідомлення, ISO-час або непрозорий курсор `next_since` з
+попередньої відповіді. Курсор містить seq кожного чату та позиції списків
+квитанцій і чатів.
+"""
+import base64
+import binascii
+import zlib
+from functools import reduce
+from operator import or_
+
+from django.db.models import F, Max, Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import ValidationError
+
+from .models import Chat, Message, ReadReceipt
+
+# Позиція keyset-списку: (водяний знак часу або None — повна синхронізація,
+# id останнього відданого рядка, час початку раунду або None)
+FULL_SYNC = (None, 0, None)
+
+
+def _encode_time(value):
+    return value.isoformat() if value is not None else ''
+
+
+def _decode_time(value):
+    if not value:
+        return None
+    parsed = parse_datetime(value)
+    if parsed is None:
+        raise ValueError(value)
+    return parsed
+
+
+def encode_since(seqs, receipts_after, chats_after):
+    pairs = ','.join(f'{chat_id}.{seq}' for chat_id, seq in sorted(seqs.items()) if seq)
+    fields = []
+    for changed_at, after_id, round_start in (receipts_after, chats_after):
+        fields += [_encode_time(changed_at), str(after_id), _encode_time(round_start)]
+    raw = '|'.join(fields + [pairs])
+    return base64.urlsafe_b64encode(zlib.compress(raw.encode())).decode()
+
+
+def decode_since(value):
+    try:
+        raw = zlib.decompress(base64.urlsafe_b64decode(value.encode())).decode()
+    except (ValueError, binascii.Error, UnicodeDecodeError, zlib.error):
+        return None
+
+    try:
+        *fields, pairs = raw.split('|')
+        if len(fields) != 6:
+            return None
+        positions = [
+            (_decode_time(fields[index]), int(fields[index + 1]), _decode_time(fields[index + 2]))
+            for index in (0, 3)
+        ]
+        seqs = {}
+        for pair in filter(None, pairs.split(',')):
+            chat_id, seq = pair.split('.')
+            seqs[int(chat_id)] = int(seq)
+    except ValueError:
+        return None
+    return seqs, positions[0], positions[1]
+
+
+def seqs_up_to(user, **message_filter):
+    """{chat_id: найбільший seq} серед повідомлень чатів користувача, що відповідають фільтру."""
+    return dict(
+        Message.objects.filter(
+            chat__in=Chat.objects.filter(participants=user).values('id'), seq__isnull=False, **message_filter,
+        ).order_by().values('chat_id').annotate(last=Max('seq')).values_list('chat_id', 'last')
+    )
+
+
+def parse_since(user, value):
+    """
+    Повертає ({chat_id: останній відомий seq}, позиція квитанцій, позиція чатів).
+    Порожній `since` означає повну синхронізацію: ({}, FULL_SYNC, FULL_SYNC).
+    """
+    if not value:
+        return {}, FULL_SYNC, FULL_SYNC
+
+    if value.isdigit():
+        message_id = int(value)
+        changed_at = Message.objects.filter(id__lte=message_id).order_by('-id').values_list(
+            'timestamp', flat=True,
+        ).first()
+        position = (changed_at, 0, None)
+        return seqs_up_to(user, id__lte=message_id), position, position
+
+    try:
+        changed_at = parse_datetime(value)
+    except ValueError:
+        changed_at = None
+    if changed_at is not None:
+        if timezone.is_naive(changed_at):
+            changed_at = timezone.make_aware(changed_at)
+        position = (changed_at, 0, None)
+        return seqs_up_to(user, timestamp__lte=changed_at), position, position
+
+    cursor = decode_since(value)
+    if cursor is None:
+        raise ValidationError({'since': 'Ожидается ID сообщения, время ISO 8601 или next_since.'})
+    return cursor
+
+
+def page_after(queryset, time_field, position, started_at, page_size):
+    """
+    Сторінка рядків після позиції position (див. FULL_SYNC): без водяного знака
+    часу — за id, інакше — за (time_field, id). Повертає (rows, позиція, truncated).
+    """
+    changed_at, after_id, round_start = position
+    if changed_at is None:
+        queryset = queryset.filter(id__gt=after_id).order_by('id')
+    else:
+        queryset = queryset.filter(
+            Q(**{f'{time_field}__gt': changed_at}) | Q(**{time_field: changed_at, 'id__gt': after_id})
+        ).order_by(time_field, 'id')
+    rows = list(queryset[:page_size + 1])
+    truncated = len(rows) > page_size
+    rows = rows[:page_size]
+
+    round_start = round_start or started_at
+    if not truncated:
+        return rows, (round_start, 0, None), False
+    last = rows[-1]
+    if changed_at is None:
+        return rows, (None, last.id, round_start), True
+    return rows, (getattr(last, time_field), last.id, round_start), True
+
+
+def collect_changes(user, since, page_size):
+    """
+    Зміни для користувача після водяного знака since.
+    Повертає (messages, read_receipts, chats, next_since, has_more).
+    """
+    started_at = timezone.now()
+    seqs, receipts_after, chats_after = since
+    seqs = dict(seqs)
+    chat_ids = Chat.objects.filter(participants=user).values('id')
+
+    # Чати з новими seq — за Chat.last_seq, без читання повідомлень
+    changed = [
+        (chat_id, last_seq)
+        for chat_id, last_seq in Chat.objects.filter(participants=user).order_by('id').values_list('id', 'last_seq')
+        if last_seq > seqs.get(chat_id, 0)
+    ]
+    # У кожному зміненому чаті є хоча б одне нове повідомлення — на сторінку
+    # потрапляють не більше page_size + 1 чатів
+    window = changed[:page_size + 1]
+    messages = []
+    if window:
+        new_in_chat = reduce(or_, [Q(chat_id=chat_id, seq__gt=seqs.get(chat_id, 0)) for chat_id, _ in window])
+        messages = list(
+            Message.objects.filter(new_in_chat).select_related('sender').order_by('chat_id', 'seq')[:page_size + 1]
+        )
+    truncated = len(messages) > page_size
+    messages = messages[:page_size]
+
+    # Водяний знак: чати, прочитані повністю, — до last_seq; обрізаний чат — до
+    # останнього відданого повідомлення; чати після нього — без змін
+    last_chat_id = messages[-1].chat_id if truncated else None
+    for chat_id, last_seq in window:
+        if last_chat_id is not None and chat_id >= last_chat_id:
+            break
+        seqs[chat_id] = last_seq
+    if last_chat_id is not None:
+        seqs[last_chat_id] = messages[-1].seq
+
+    receipts, receipts_after, receipts_truncated = page_after(
+        ReadReceipt.objects.filter(chat_id__in=chat_ids, last_read_message__isnull=False),
+        'updated_at', receipts_after, started_at, page_size,
+    )
+
+    if chats_after[0] is None:
+        chats = Chat.objects.filter(participants=user)
+    else:
+        # Момент вступу — created_at квитанції користувача (та сама join, що й у фільтрі)
+        chats = Chat.objects.filter(read_receipts__user=user).annotate(joined_at=F('read_receipts__created_at'))
+    chats, chats_after, chats_truncated = page_after(
+        chats.prefetch_related('participants'), 'joined_at', chats_after, started_at, page_size,
+    )
+
+    return (
+        messages,
+        receipts,
+        chats,
+        encode_since(seqs, receipts_after, chats_after),
+        truncated or len(changed) > len(window) or receipts_truncated or chats_truncated,
+    )
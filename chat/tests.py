@@ -1,3 +1,1103 @@
-from django.test import TestCase
+import asyncio
+import json
+from datetime import timedelta
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from django.test import SimpleTestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from io import StringIO
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APITestCase
+
+from accounts.middleware import TokenAuthMiddlewareStack
+from .consumers import ChatConsumer
+from .membership import MembershipIndex, is_member, membership
+from .pipeline import message_pipeline, new_ulid
+from .presence import PresenceRegistry, presence
+from .receipts import receipt_buffer
+from .routing import websocket_urlpatterns
+from .throttling import TokenBucket, consumer_metrics, user_buckets
+
+from .models import ArchivedMessage, Chat, Message, ReadReceipt
+from .pagination import MessageKeysetPaginator
+
+User = get_user_model()
+
+
+class ChatListQueriesTests(APITestCase):
+    """Список чатов должен выполняться за фиксированное количество запросов."""
+
+    def setUp(self):
+        membership.clear()
+        self.user = User.objects.create_user(username='agent', password='pass')
+        self.other = User.objects.create_user(username='client', password='pass')
+        self.client.force_authenticate(self.user)
+
+    def make_chat(self, messages=3):
+        chat = Chat.objects.create()
+        chat.participants.set([self.user, self.other])
+        for i in range(messages):
+            message = Message.objects.create(chat=chat, sender=self.other, content=f'msg {i}')
+            ReadReceipt.objects.register_message(message)
+        return chat
+
+    def count_list_queries(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/api/chat/chats/')
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries), response.data
+
+    def test_query_count_does_not_grow_with_chats(self):
+        self.make_chat()
+        self.make_chat()
+        few, _ = self.count_list_queries()
+
+        for _ in range(5):
+            self.make_chat()
+        many, data = self.count_list_queries()
+
+        self.assertEqual(len(data), 7)
+        self.assertEqual(few, many)
+
+    def test_last_message_and_unread_count(self):
+        chat = self.make_chat(messages=1)
+        ReadReceipt.objects.mark_read(chat.id, self.user.id, chat.messages.get())
+        for i in range(2):
+            ReadReceipt.objects.register_message(
+                Message.objects.create(chat=chat, sender=self.other, content=f'new {i}')
+            )
+
+        _, data = self.count_list_queries()
+
+        self.assertEqual(data[0]['unread_count'], 2)
+        self.assertEqual(data[0]['last_message']['content'], 'new 1')
+        self.assertEqual(len(data[0]['participants']), 2)
+
+    def test_chat_without_messages(self):
+        self.make_chat(messages=0)
+
+        _, data = self.count_list_queries()
+
+        self.assertIsNone(data[0]['last_message'])
+        self.assertEqual(data[0]['unread_count'], 0)
+
+
+class MessageHistoryPaginationTests(APITestCase):
+    """История сообщений отдаётся страницами по курсору (timestamp, id)."""
+
+    def setUp(self):
+        membership.clear()
+        self.user = User.objects.create_user(username='agent', password='pass')
+        self.other = User.objects.create_user(username='client', password='pass')
+        self.client.force_authenticate(self.user)
+        self.chat = Chat.objects.create()
+        self.chat.participants.set([self.user, self.other])
+        self.messages = [
+            Message.objects.create(chat=self.chat, sender=self.other, content=f'msg {i}')
+            for i in range(7)
+        ]
+
+    def test_pages_backwards_without_gaps(self):
+        url = f'/api/chat/chats/{self.chat.id}/messages/'
+        seen = []
+        cursor = None
+        while True:
+            params = {'page_size': 3}
+            if cursor:
+                params['cursor'] = cursor
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, 200)
+            seen = [m['id'] for m in response.data['results']] + seen
+            cursor = response.data['next_cursor']
+            if not cursor:
+                break
+
+        self.assertEqual(seen, [m.id for m in self.messages])
+
+    def test_invalid_cursor(self):
+        response = self.client.get(f'/api/chat/chats/{self.chat.id}/messages/', {'cursor': 'garbage'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_detail_contains_only_newest_page(self):
+        with self.settings(CHAT_MESSAGES_PAGE_SIZE=5):
+            response = self.client.get(f'/api/chat/chats/{self.chat.id}/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([m['id'] for m in response.data['messages']], [m.id for m in self.messages[-5:]])
+        self.assertIsNotNone(response.data['messages_cursor'])
+
+
+@override_settings(CHAT_READ_RECEIPT_FLUSH_INTERVAL=0)
+class UnreadCounterTests(APITestCase):
+    """Денормализованный счётчик непрочитанных в ReadReceipt."""
+
+    def setUp(self):
+        membership.clear()
+        self.user = User.objects.create_user(username='agent', password='pass')
+        self.other = User.objects.create_user(username='client', password='pass')
+        self.chat = Chat.objects.create()
+        self.chat.participants.set([self.user, self.other])
+
+    def unread(self, user):
+        return ReadReceipt.objects.get(chat=self.chat, user=user).unread_count
+
+    def test_rest_send_and_mark_as_read(self):
+        self.client.force_authenticate(self.other)
+        for i in range(3):
+            response = self.client.post(f'/api/chat/chats/{self.chat.id}/send_message/', {'content': f'hi {i}'})
+            self.assertEqual(response.status_code, 201)
+
+        self.assertEqual(self.unread(self.user), 3)
+        self.assertEqual(self.unread(self.other), 0)
+
+        self.client.force_authenticate(self.user)
+        response = self.client.post(f'/api/chat/chats/{self.chat.id}/mark_as_read/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.unread(self.user), 0)
+
+    def test_new_participant_sees_existing_messages_as_unread(self):
+        for i in range(2):
+            ReadReceipt.objects.register_message(
+                Message.objects.create(chat=self.chat, sender=self.other, content=f'msg {i}')
+            )
+        newcomer = User.objects.create_user(username='newcomer', password='pass')
+
+        self.chat.participants.add(newcomer)
+
+        self.assertEqual(self.unread(newcomer), 2)
+
+    def test_reconcile_command_repairs_drift(self):
+        for i in range(4):
+            ReadReceipt.objects.register_message(
+                Message.objects.create(chat=self.chat, sender=self.other, content=f'msg {i}')
+            )
+        ReadReceipt.objects.filter(chat=self.chat, user=self.user).update(unread_count=42)
+        ReadReceipt.objects.filter(chat=self.chat, user=self.other).delete()
+
+        call_command('reconcile_unread_counts', batch_size=1, stdout=StringIO())
+
+        self.assertEqual(self.unread(self.user), 4)
+        self.assertEqual(self.unread(self.other), 0)
+
+    def test_batched_registration_matches_recount(self):
+        third = User.objects.create_user(username='third', password='pass')
+        self.chat.participants.add(third)
+        # В одной пачке конвейера пишут оба участника, третий молчит
+        messages = []
+        for sender, content in ((self.user, 'first'), (self.other, 'second'), (self.other, 'third')):
+            messages.append(Message.objects.create(chat=self.chat, sender=sender, content=content))
+        ReadReceipt.objects.register_messages(messages)
+
+        counters = {user.pk: self.unread(user) for user in (self.user, self.other, third)}
+        self.assertEqual(counters, {self.user.pk: 2, self.other.pk: 0, third.pk: 3})
+        self.assertEqual(
+            ReadReceipt.objects.get(chat=self.chat, user=self.user).last_read_message_id, messages[0].id,
+        )
+        ReadReceipt.objects.filter(chat=self.chat).recount()
+        self.assertEqual({user.pk: self.unread(user) for user in (self.user, self.other, third)}, counters)
+
+
+@override_settings(CHAT_PIPELINE_MAX_ATTEMPTS=2)
+class MessagePipelineWriteTests(APITestCase):
+    """Пакетний запис конвеєра: розісланий кадр збігається зі збереженим, помилки не губляться."""
+
+    def setUp(self):
+        membership.clear()
+        message_pipeline.discard()
+        self.user = User.objects.create_user(username='agent', password='pass')
+        self.chat = Chat.objects.create()
+        self.chat.participants.set([self.user])
+
+    def tearDown(self):
+        message_pipeline.discard()
+
+    def queue(self, *contents):
+        messages = [
+            Message(chat=self.chat, sender=self.user, content=content, uid=new_ulid(), timestamp=timezone.now())
+            for content in contents
+        ]
+        # submit() вимагає циклу подій — кладемо в чергу напряму
+        message_pipeline._pending.extend(messages)
+        return messages
+
+    def test_stored_timestamp_matches_broadcast(self):
+        message, = self.queue('hello')
+        message.timestamp -= timedelta(seconds=5)
+        self.assertEqual(message_pipeline.flush(), 1)
+        self.assertEqual(Message.objects.get().timestamp, message.timestamp)
+
+    def test_bad_message_is_retried_then_reported(self):
+        good, bad, other = self.queue('first', None, 'third')
+
+        with self.assertLogs('chat.pipeline', 'ERROR'):
+            notices = [json.loads(frame) for _, frame in message_pipeline.flush_with_notices()]
+        self.assertEqual([(n['type'], [m['uid'] for m in n['messages']]) for n in notices],
+                         [('persisted', [good.uid, other.uid])])
+        self.assertEqual(Message.objects.count(), 2)
+        self.assertEqual(message_pipeline.pending_count(), 1)
+
+        with self.assertLogs('chat.pipeline', 'ERROR') as logs:
+            notices = [json.loads(frame) for _, frame in message_pipeline.flush_with_notices()]
+        self.assertIn('після 2 спроб', logs.output[-1])
+        self.assertEqual([(n['type'], n['messages']) for n in notices], [('failed', [{'uid': bad.uid}])])
+        self.assertEqual(message_pipeline.pending_count(), 0)
+
+
+IN_MEMORY_CHANNEL_LAYERS = {'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}}
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS)
+class ChatConsumerDeliveryTests(TransactionTestCase):
+    """Підписки сокета на групи в обох режимах доставки."""
+
+    def setUp(self):
+        membership.clear()
+        self.user = User.objects.create_user(username='agent', password='pass')
+        self.other = User.objects.create_user(username='client', password='pass')
+        self.tokens = {
+            user.id: Token.objects.create(user=user).key for user in (self.user, self.other)
+        }
+        self.application = TokenAuthMiddlewareStack(URLRouter(websocket_urlpatterns))
+        async_to_sync(get_channel_layer().flush)()
+        message_pipeline.discard()
+        user_buckets.clear()
+        consumer_metrics.reset()
+        presence.clear()
+
+    async def connect(self, user):
+        communicator = WebsocketCommunicator(
+            self.application, f'/ws/chat/0/?token={self.tokens[user.id]}'
+        )
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        return communicator
+
+    @database_sync_to_async
+    def create_chat(self, *users):
+        chat = Chat.objects.create()
+        chat.participants.set(users)
+        return chat
+
+    async def test_user_mode_subscribes_once_and_sees_new_chats(self):
+        with self.settings(CHAT_DELIVERY_MODE='user'):
+            await self.create_chat(self.user, self.other)
+            await self.create_chat(self.user, self.other)
+            listener = await self.connect(self.user)
+            sender = await self.connect(self.other)
+
+            self.assertEqual(set(get_channel_layer().groups), {f'user_{self.user.id}', f'user_{self.other.id}'})
+
+            # Чат створено вже після підключення — повідомлення все одно доходить
+            chat = await self.create_chat(self.user, self.other)
+            await sender.send_json_to({'command': 'send_message', 'chat_id': chat.id, 'content': 'hello'})
+
+            raw = await listener.receive_from()
+            # Кадр закодований відправником один раз (orjson/json без пробілів)
+            self.assertNotIn('", "', raw)
+            frame = json.loads(raw)
+            self.assertEqual(frame['chat_id'], chat.id)
+            self.assertEqual(frame['message']['content'], 'hello')
+            self.assertEqual(frame['message']['seq'], 1)
+
+            await listener.disconnect()
+            await sender.disconnect()
+
+    @override_settings(CHAT_READ_RECEIPT_FLUSH_INTERVAL=60)
+    async def test_disconnect_flushes_pending_read_receipts(self):
+        chat = await self.create_chat(self.user, self.other)
+        sender = await self.connect(self.other)
+        reader = await self.connect(self.user)
+        await sender.send_json_to({'command': 'send_message', 'chat_id': chat.id, 'content': 'hello'})
+        await reader.receive_from()
+
+        await reader.send_json_to({'command': 'mark_as_read', 'chat_id': chat.id})
+        await reader.send_json_to({'command': 'mark_as_read', 'chat_id': chat.id})
+        await reader.disconnect()
+        await sender.disconnect()
+
+        receipt = await database_sync_to_async(ReadReceipt.objects.get)(chat=chat, user=self.user)
+        self.assertEqual(receipt.unread_count, 0)
+        self.assertIsNotNone(receipt.last_read_message_id)
+        self.assertEqual(receipt_buffer.pending_count(), 0)
+
+    @override_settings(CHAT_PERSISTENCE_MODE='pipeline', CHAT_PIPELINE_FLUSH_INTERVAL=60)
+    async def test_pipeline_broadcasts_before_persisting(self):
+        chat = await self.create_chat(self.user, self.other)
+        listener = await self.connect(self.user)
+        sender = await self.connect(self.other)
+        client_id = new_ulid()
+
+        for _ in range(2):
+            # Повтор з тим самим client_id не створює дубліката
+            await sender.send_json_to({
+                'command': 'send_message', 'chat_id': chat.id, 'content': 'hello', 'client_id': client_id,
+            })
+        frame = await listener.receive_json_from()
+        await listener.receive_json_from()
+
+        self.assertIsNone(frame['message']['id'])
+        self.assertEqual(frame['message']['uid'], client_id)
+        self.assertEqual(message_pipeline.pending_count(), 2)
+        self.assertFalse(await database_sync_to_async(Message.objects.exists)())
+
+        # Відключення відправника дописує буфер, а слухач дізнається id та seq
+        await sender.disconnect()
+        notice = await listener.receive_json_from()
+        self.assertEqual(notice['type'], 'persisted')
+        self.assertEqual([(m['uid'], m['seq']) for m in notice['messages']], [(client_id, 1)])
+        await listener.disconnect()
+
+        message = await database_sync_to_async(Message.objects.get)()
+        self.assertEqual(message.uid, client_id)
+        receipt = await database_sync_to_async(ReadReceipt.objects.get)(chat=chat, user=self.user)
+        self.assertEqual(receipt.unread_count, 1)
+
+    @override_settings(CHAT_PERSISTENCE_MODE='pipeline', CHAT_PIPELINE_BATCH_SIZE=3)
+    async def test_pipeline_flushes_full_batches_in_background(self):
+        chat = await self.create_chat(self.user, self.other)
+        sender = await self.connect(self.other)
+
+        for i in range(3):
+            await sender.send_json_to({'command': 'send_message', 'chat_id': chat.id, 'content': f'msg {i}'})
+        for _ in range(3):
+            await sender.receive_from()
+        for _ in range(50):
+            if not message_pipeline.pending_count():
+                break
+            await asyncio.sleep(0.02)
+
+        self.assertEqual(await database_sync_to_async(Message.objects.count)(), 3)
+        # Після запису учасники дізнаються id та seq розісланих повідомлень
+        notice = await sender.receive_json_from()
+        self.assertEqual(notice['type'], 'persisted')
+        self.assertEqual([m['seq'] for m in notice['messages']], [1, 2, 3])
+        await sender.disconnect()
+
+    @override_settings(CHAT_RESUME_BATCH_SIZE=2, CHAT_RESUME_MAX_MESSAGES=4)
+    async def test_resume_streams_missed_messages_in_batches(self):
+        chat = await self.create_chat(self.user, self.other)
+        foreign = await database_sync_to_async(Chat.objects.create)()
+
+        @database_sync_to_async
+        def post(count):
+            return [Message.objects.create(chat=chat, sender=self.other, content=f'msg {i}')
+                    for i in range(count)]
+
+        messages = await post(6)
+        self.assertEqual([m.seq for m in messages], [1, 2, 3, 4, 5, 6])
+
+        client = await self.connect(self.user)
+        # Чат без участі ігнорується; з seq 1 пропущено 5 повідомлень, ліміт — 4
+        await client.send_json_to({'command': 'resume', 'chats': {str(chat.id): 1, str(foreign.id): 0}})
+
+        first = await client.receive_json_from()
+        second = await client.receive_json_from()
+        self.assertEqual([m['seq'] for m in first['messages']], [2, 3])
+        self.assertTrue(first['has_more'])
+        self.assertEqual([m['seq'] for m in second['messages']], [4, 5])
+        self.assertFalse(second['has_more'])
+        self.assertTrue(second['truncated'])
+        self.assertTrue(await client.receive_nothing())
+
+        # Клієнт, що нічого не пропустив, отримує порожню відповідь
+        await client.send_json_to({'command': 'resume', 'chats': {str(chat.id): 6}})
+        frame = await client.receive_json_from()
+        self.assertEqual(frame['messages'], [])
+        self.assertFalse(frame['has_more'])
+        await client.disconnect()
+
+    @override_settings(CHAT_WS_SOCKET_RATE=0.001, CHAT_WS_SOCKET_BURST=2)
+    async def test_socket_rate_limit_rejects_flood(self):
+        chat = await self.create_chat(self.user, self.other)
+        sender = await self.connect(self.other)
+
+        for i in range(3):
+            await sender.send_json_to({'command': 'send_message', 'chat_id': chat.id, 'content': f'msg {i}'})
+        frames = [await sender.receive_json_from() for _ in range(3)]
+
+        self.assertEqual(frames[-1]['type'], 'throttled')
+        self.assertEqual(frames[-1]['command'], 'send_message')
+        self.assertGreater(frames[-1]['retry_after'], 0)
+        self.assertEqual(await database_sync_to_async(Message.objects.count)(), 2)
+        self.assertEqual(consumer_metrics.stats()['throttled_socket'], 1)
+        await sender.disconnect()
+
+    @override_settings(CHAT_WS_USER_RATE=0.001, CHAT_WS_USER_BURST=1)
+    async def test_user_rate_limit_is_shared_between_sockets(self):
+        chat = await self.create_chat(self.user, self.other)
+        first = await self.connect(self.other)
+        second = await self.connect(self.other)
+
+        await first.send_json_to({'command': 'mark_as_read', 'chat_id': chat.id})
+        self.assertTrue(await first.receive_nothing())
+        await second.send_json_to({'command': 'mark_as_read', 'chat_id': chat.id})
+
+        self.assertEqual((await second.receive_json_from())['type'], 'throttled')
+        self.assertEqual(consumer_metrics.stats()['throttled_user'], 1)
+        await first.disconnect()
+        await second.disconnect()
+
+    @override_settings(CHAT_PRESENCE_BROADCAST_INTERVAL=0.2)
+    async def test_presence_updates_are_coalesced(self):
+        await self.create_chat(self.user, self.other)
+        stranger = await database_sync_to_async(User.objects.create_user)(username='stranger', password='pass')
+        watcher = await self.connect(self.user)
+        # Подписка только на собеседников из общих чатов
+        await watcher.send_json_to({'command': 'presence', 'subscribe': [self.other.id, stranger.id]})
+        snapshot = await watcher.receive_json_from()
+        self.assertEqual(snapshot['type'], 'presence_snapshot')
+        self.assertEqual(list(snapshot['users']), [str(self.other.id)])
+        self.assertFalse(snapshot['users'][str(self.other.id)]['online'])
+
+        other = await self.connect(self.other)
+        self.assertTrue((await watcher.receive_json_from())['online'])
+
+        # Три heartbeat в одном окне — одно обновление в конце окна
+        for _ in range(3):
+            await other.send_json_to({'command': 'presence'})
+        update = await watcher.receive_json_from(timeout=1)
+        self.assertEqual((update['user_id'], update['online']), (self.other.id, True))
+        self.assertTrue(await watcher.receive_nothing(timeout=0.3))
+
+        await other.disconnect()
+        offline = await watcher.receive_json_from(timeout=1)
+        self.assertFalse(offline['online'])
+        self.assertFalse(presence.is_online(self.other.id))
+        await watcher.disconnect()
+
+    async def test_typing_is_sent_to_other_members_once_per_interval(self):
+        with self.settings(CHAT_DELIVERY_MODE='user'):
+            chat = await self.create_chat(self.user, self.other)
+            listener = await self.connect(self.user)
+            typist = await self.connect(self.other)
+
+            for _ in range(3):
+                await typist.send_json_to({'command': 'typing', 'chat_id': chat.id})
+            frame = await listener.receive_json_from()
+            self.assertEqual((frame['type'], frame['user_id'], frame['is_typing']), ('typing', self.other.id, True))
+            self.assertTrue(await listener.receive_nothing())
+            self.assertTrue(await typist.receive_nothing())
+
+            await typist.send_json_to({'command': 'typing', 'chat_id': chat.id, 'is_typing': False})
+            self.assertFalse((await listener.receive_json_from())['is_typing'])
+
+            await listener.disconnect()
+            await typist.disconnect()
+
+    async def test_chat_mode_subscribes_per_chat(self):
+        with self.settings(CHAT_DELIVERY_MODE='chat'):
+            first = await self.create_chat(self.user, self.other)
+            second = await self.create_chat(self.user, self.other)
+            listener = await self.connect(self.user)
+
+            self.assertEqual(set(get_channel_layer().groups), {f'chat_{first.id}', f'chat_{second.id}'})
+
+            await listener.disconnect()
+
+
+class ConsumerBackpressureTests(SimpleTestCase):
+    """Обмежена черга вихідних кадрів і політика для повільного клієнта."""
+
+    def setUp(self):
+        consumer_metrics.reset()
+
+    def test_token_bucket_refills_over_time(self):
+        bucket = TokenBucket(rate=2, burst=2)
+        now = bucket.updated
+        self.assertTrue(bucket.consume(now))
+        self.assertTrue(bucket.consume(now))
+        self.assertFalse(bucket.consume(now))
+        self.assertAlmostEqual(bucket.retry_after(), 0.5)
+        self.assertTrue(bucket.consume(now + 0.5))
+
+    async def make_consumer(self):
+        """Консьюмер, чей сокет "завис": первый кадр пишется бесконечно долго."""
+        consumer = ChatConsumer()
+        consumer.user = await database_sync_to_async(User)(id=1)
+        consumer.sent = []
+        consumer.release = asyncio.Event()
+
+        async def base_send(message):
+            consumer.sent.append(message)
+            if message['type'] == 'websocket.send':
+                await consumer.release.wait()
+
+        consumer.base_send = base_send
+        consumer.start_outbound()
+        return consumer
+
+    @override_settings(CHAT_WS_OUTBOUND_QUEUE_SIZE=2, CHAT_WS_SLOW_CONSUMER_POLICY='drop')
+    async def test_drop_policy_discards_and_reports_overflow(self):
+        consumer = await self.make_consumer()
+        for i in range(4):
+            await consumer.send(text_data=f'frame {i}')
+            await asyncio.sleep(0)
+
+        # frame 0 пишется, frame 1-2 в очереди, frame 3 отброшен
+        self.assertEqual(consumer_metrics.stats()['dropped_frames'], 1)
+
+        consumer.release.set()
+        await asyncio.sleep(0.01)
+        await consumer.send(text_data='frame 4')
+        await asyncio.sleep(0.01)
+        texts = [m['text'] for m in consumer.sent]
+        self.assertEqual(texts[:3], ['frame 0', 'frame 1', 'frame 2'])
+        self.assertEqual(json.loads(texts[3]), {'type': 'overflow', 'dropped': 1})
+        self.assertEqual(texts[4], 'frame 4')
+        consumer.stop_outbound()
+
+    @override_settings(CHAT_WS_OUTBOUND_QUEUE_SIZE=1, CHAT_WS_SLOW_CONSUMER_POLICY='disconnect')
+    async def test_disconnect_policy_closes_slow_socket(self):
+        consumer = await self.make_consumer()
+        with self.assertLogs('chat.consumers', 'WARNING') as logs:
+            for i in range(3):
+                await consumer.send(text_data=f'frame {i}')
+                await asyncio.sleep(0)
+        self.assertIn('Закриваємо повільний сокет користувача 1', logs.output[-1])
+
+        self.assertEqual(consumer.sent[-1], {'type': 'websocket.close', 'code': 4008})
+        self.assertEqual(consumer_metrics.stats()['slow_disconnects'], 1)
+        await consumer.send(text_data='ignored')
+        self.assertEqual(len(consumer.sent), 2)
+
+
+class MembershipIndexTests(APITestCase):
+    """Кешований індекс членства в чатах."""
+
+    def setUp(self):
+        membership.clear()
+        self.user = User.objects.create_user(username='agent', password='pass')
+        self.other = User.objects.create_user(username='client', password='pass')
+        self.chat = Chat.objects.create(is_group_chat=True)
+        self.chat.participants.set([self.user, self.other])
+
+    def test_cache_hit_does_not_touch_db(self):
+        self.assertTrue(is_member(self.chat.id, self.user.id))
+        with self.assertNumQueries(0):
+            self.assertTrue(is_member(self.chat.id, self.other.id))
+            self.assertFalse(is_member(self.chat.id, 999))
+
+    def test_participant_changes_invalidate(self):
+        newcomer = User.objects.create_user(username='newcomer', password='pass')
+        self.assertFalse(is_member(self.chat.id, newcomer.id))
+
+        self.chat.participants.add(newcomer)
+        self.assertTrue(is_member(self.chat.id, newcomer.id))
+
+        newcomer.chats.remove(self.chat)
+        self.assertFalse(is_member(self.chat.id, newcomer.id))
+
+        self.user.chats.clear()
+        self.assertFalse(is_member(self.chat.id, self.user.id))
+
+    def test_send_message_does_not_scan_participants(self):
+        members = User.objects.bulk_create([User(username=f'member_{i}') for i in range(50)])
+        self.chat.participants.add(*members)
+        self.client.force_authenticate(self.user)
+        url = f'/api/chat/chats/{self.chat.id}/send_message/'
+        self.client.post(url, {'content': 'warm up'})
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post(url, {'content': 'hello'})
+
+        self.assertEqual(response.status_code, 201)
+        # participants.all() загружал бы строки пользователей через таблицу участников
+        participant_table = Chat.participants.through._meta.db_table
+        user_table = User._meta.db_table
+        self.assertFalse([
+            q['sql'] for q in ctx.captured_queries
+            if f'FROM "{user_table}" INNER JOIN "{participant_table}"' in q['sql']
+        ])
+
+    @override_settings(
+        CACHES={
+            'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+            'membership': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'membership'},
+        },
+        CHAT_MEMBERSHIP_CACHE_ALIAS='membership',
+    )
+    def test_shared_cache_invalidates_other_processes(self):
+        # Індекс іншого воркера: власний об'єкт, спільний лише кеш
+        other_process = MembershipIndex()
+        self.assertTrue(other_process.is_member(self.chat.id, self.other.id))
+        self.assertIsNone(other_process.peek(self.chat.id))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.chat.participants.remove(self.other)
+        self.assertFalse(other_process.is_member(self.chat.id, self.other.id))
+
+
+@override_settings(CHAT_READ_RECEIPT_FLUSH_INTERVAL=60)
+class ReadReceiptBufferTests(APITestCase):
+    """Відмітки "прочитано" накопичуються й записуються пачкою."""
+
+    def setUp(self):
+        membership.clear()
+        receipt_buffer.flush()
+        self.user = User.objects.create_user(username='agent', password='pass')
+        self.other = User.objects.create_user(username='client', password='pass')
+        self.chats = []
+        for _ in range(3):
+            chat = Chat.objects.create()
+            chat.participants.set([self.user, self.other])
+            for i in range(2):
+                ReadReceipt.objects.register_message(
+                    Message.objects.create(chat=chat, sender=self.other, content=f'msg {i}')
+                )
+            self.chats.append(chat)
+
+    def tearDown(self):
+        receipt_buffer.flush()
+
+    def test_repeated_marks_are_coalesced(self):
+        self.client.force_authenticate(self.user)
+        chat = self.chats[0]
+        for _ in range(5):
+            response = self.client.post(f'/api/chat/chats/{chat.id}/mark_as_read/')
+            self.assertEqual(response.status_code, 200)
+
+        self.assertEqual(receipt_buffer.pending_count(), 1)
+        self.assertEqual(ReadReceipt.objects.get(chat=chat, user=self.user).unread_count, 2)
+
+        receipt_buffer.flush()
+
+        receipt = ReadReceipt.objects.get(chat=chat, user=self.user)
+        self.assertEqual(receipt.unread_count, 0)
+        self.assertEqual(receipt.last_read_message_id, chat.messages.order_by('-id').first().id)
+
+    def test_flush_is_three_queries(self):
+        first = self.chats[0].messages.order_by('id').first()
+        receipt_buffer.mark(self.chats[0].id, self.user.id, first.id + 1)
+        receipt_buffer.mark(self.chats[0].id, self.user.id, first.id)
+        for chat in self.chats[1:]:
+            receipt_buffer.mark(chat.id, self.user.id)
+
+        # Створення відсутніх квитанцій, UPDATE з CASE і перерахунок лічильників
+        with self.assertNumQueries(3):
+            self.assertEqual(receipt_buffer.flush(), 3)
+
+        self.assertEqual(
+            ReadReceipt.objects.get(chat=self.chats[0], user=self.user).last_read_message_id, first.id + 1,
+        )
+        self.assertFalse(ReadReceipt.objects.filter(user=self.user, unread_count__gt=0).exists())
+
+    def test_messages_after_mark_stay_unread(self):
+        chat = self.chats[0]
+        read_up_to = chat.messages.order_by('-id').first()
+        receipt_buffer.mark(chat.id, self.user.id)
+        # Повідомлення прийшло між відміткою та скиданням
+        late = Message.objects.create(chat=chat, sender=self.other, content='late')
+        ReadReceipt.objects.register_message(late)
+        receipt_buffer.flush()
+
+        receipt = ReadReceipt.objects.get(chat=chat, user=self.user)
+        self.assertEqual(receipt.last_read_message_id, read_up_to.id)
+        self.assertEqual(receipt.unread_count, 1)
+
+        # Нижчий ID не відкочує вже записану відмітку
+        receipt_buffer.mark(chat.id, self.user.id, late.id)
+        receipt_buffer.flush()
+        receipt_buffer.mark(chat.id, self.user.id, read_up_to.id)
+        receipt_buffer.flush()
+        receipt = ReadReceipt.objects.get(chat=chat, user=self.user)
+        self.assertEqual((receipt.last_read_message_id, receipt.unread_count), (late.id, 0))
+
+
+class MessageSearchTests(APITestCase):
+    """Полнотекстовый поиск ограничен чатами пользователя и ранжирован."""
+
+    def setUp(self):
+        membership.clear()
+        self.user = User.objects.create_user(username='agent', password='pass')
+        self.other = User.objects.create_user(username='client', password='pass')
+        self.stranger = User.objects.create_user(username='stranger', password='pass')
+        self.client.force_authenticate(self.user)
+
+        self.chat = Chat.objects.create()
+        self.chat.participants.set([self.user, self.other])
+        self.foreign_chat = Chat.objects.create()
+        self.foreign_chat.participants.set([self.other, self.stranger])
+
+        self.hit = Message.objects.create(chat=self.chat, sender=self.other, content='Счёт за доставку отправлен')
+        self.weak_hit = Message.objects.create(
+            chat=self.chat, sender=self.other,
+            content='Вопрос про доставку и ещё очень длинный текст о совсем других вещах и делах',
+        )
+        Message.objects.create(chat=self.chat, sender=self.other, content='Привет')
+        Message.objects.create(chat=self.foreign_chat, sender=self.stranger, content='Счёт за доставку')
+
+    def search(self, **params):
+        response = self.client.get('/api/chat/chats/search/', params)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_results_limited_to_own_chats_and_ranked(self):
+        data = self.search(q='доставку')
+        self.assertEqual([m['id'] for m in data['results']], [self.hit.id, self.weak_hit.id])
+
+    def test_prefix_and_all_terms_required(self):
+        self.assertEqual([m['id'] for m in self.search(q='счёт дост')['results']], [self.hit.id])
+
+    def test_updates_and_deletes_are_indexed(self):
+        self.hit.content = 'Накладная'
+        self.hit.save()
+        self.weak_hit.delete()
+
+        self.assertEqual(self.search(q='доставку')['results'], [])
+        self.assertEqual(len(self.search(q='накладная')['results']), 1)
+
+    def test_pagination(self):
+        data = self.search(q='доставку', page_size=1)
+        self.assertEqual(data['next_page'], 2)
+        data = self.search(q='доставку', page_size=1, page=2)
+        self.assertIsNone(data['next_page'])
+        self.assertEqual(data['results'][0]['id'], self.weak_hit.id)
+
+    def test_query_required(self):
+        self.assertEqual(self.client.get('/api/chat/chats/search/').status_code, 400)
+        self.assertEqual(self.search(q='"*')['results'], [])
+
+
+@override_settings(CHAT_READ_RECEIPT_FLUSH_INTERVAL=0)
+class DeltaSyncTests(APITestCase):
+    """GET /api/chat/sync/: всё изменившееся после водяного знака одним запросом."""
+
+    def setUp(self):
+        membership.clear()
+        self.user = User.objects.create_user(username='agent', password='pass')
+        self.other = User.objects.create_user(username='client', password='pass')
+        self.stranger = User.objects.create_user(username='stranger', password='pass')
+        self.client.force_authenticate(self.user)
+
+        self.chat = Chat.objects.create()
+        self.chat.participants.set([self.user, self.other])
+        self.foreign_chat = Chat.objects.create()
+        self.foreign_chat.participants.set([self.other, self.stranger])
+
+        self.messages = [
+            Message.objects.create(chat=self.chat, sender=self.other, content=f'msg {i}')
+            for i in range(5)
+        ]
+        Message.objects.create(chat=self.foreign_chat, sender=self.stranger, content='secret')
+
+    def sync(self, **params):
+        response = self.client.get('/api/chat/sync/', params)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_full_sync_pages_through_own_messages(self):
+        seen = []
+        params = {'page_size': 2}
+        while True:
+            # Номера seq чатов, сообщения, квитанции, чаты и их участники —
+            # независимо от числа чатов
+            with CaptureQueriesContext(connection) as queries:
+                data = self.sync(**params)
+            self.assertLessEqual(len(queries), 5)
+            seen += [m['id'] for m in data['messages']]
+            params['since'] = data['next_since']
+            if not data['has_more']:
+                break
+
+        self.assertEqual(seen, [m.id for m in self.messages])
+        # Повторный опрос с последним водяным знаком — изменений нет
+        data = self.sync(since=params['since'])
+        self.assertEqual((data['messages'], data['read_receipts'], data['chats']), ([], [], []))
+
+    def test_returns_only_changes_after_watermark(self):
+        since = self.sync()['next_since']
+
+        new_message = Message.objects.create(chat=self.chat, sender=self.other, content='new')
+        ReadReceipt.objects.register_message(new_message)
+        new_chat = Chat.objects.create()
+        new_chat.participants.set([self.user, self.stranger])
+        Message.objects.create(chat=self.foreign_chat, sender=self.stranger, content='still secret')
+
+        data = self.sync(since=since)
+        self.assertEqual([m['id'] for m in data['messages']], [new_message.id])
+        self.assertEqual(
+            [(r['user'], r['last_read_message']) for r in data['read_receipts']],
+            [(self.other.id, new_message.id)],
+        )
+        self.assertEqual([c['id'] for c in data['chats']], [new_chat.id])
+
+    def test_since_message_id_and_timestamp(self):
+        data = self.sync(since=self.messages[2].id)
+        self.assertEqual([m['id'] for m in data['messages']], [m.id for m in self.messages[3:]])
+
+        data = self.sync(since=self.messages[2].timestamp.isoformat())
+        self.assertEqual([m['id'] for m in data['messages']], [m.id for m in self.messages[3:]])
+
+        self.assertEqual(self.client.get('/api/chat/sync/', {'since': 'garbage'}).status_code, 400)
+
+    def test_receipts_and_chats_are_paged(self):
+        extra = []
+        for i in range(3):
+            chat = Chat.objects.create()
+            chat.participants.set([self.user, self.other])
+            ReadReceipt.objects.register_message(
+                Message.objects.create(chat=chat, sender=self.other, content=f'extra {i}'),
+            )
+            extra.append(chat)
+
+        def collect(since=None):
+            chats, receipts = [], []
+            params = {'page_size': 2}
+            if since:
+                params['since'] = since
+            while True:
+                data = self.sync(**params)
+                self.assertLessEqual(len(data['chats']), 2)
+                self.assertLessEqual(len(data['read_receipts']), 2)
+                chats += [c['id'] for c in data['chats']]
+                receipts += [r['chat'] for r in data['read_receipts']]
+                params['since'] = data['next_since']
+                if not data['has_more']:
+                    return chats, receipts, params['since']
+
+        chats, receipts, since = collect()
+        self.assertEqual(chats, [self.chat.id] + [chat.id for chat in extra])
+        self.assertEqual(receipts, [chat.id for chat in extra])
+
+        # Дельта после полной синхронизации — тоже страницами, без пропусков
+        new_chats = []
+        for i in range(3):
+            chat = Chat.objects.create()
+            chat.participants.set([self.user, self.stranger])
+            new_chats.append(chat.id)
+        chats, receipts, _ = collect(since)
+        self.assertEqual(sorted(set(chats)), new_chats)
+
+    def test_late_commit_with_lower_id_is_not_skipped(self):
+        # ID выдаётся при INSERT: транзакция с меньшим ID может закоммититься
+        # после того, как клиент уже получил сообщение с большим ID
+        reserved = Message.objects.create(chat=self.foreign_chat, sender=self.stranger, content='reserved')
+        reserved_id = reserved.id
+        reserved.delete()
+        other_chat = Chat.objects.create()
+        other_chat.participants.set([self.user, self.stranger])
+        later = Message.objects.create(chat=other_chat, sender=self.stranger, content='committed first')
+
+        data = self.sync(since=self.sync()['next_since'])
+        self.assertEqual(data['messages'], [])
+        since = data['next_since']
+
+        late = Message.objects.create(id=reserved_id, chat=self.chat, sender=self.other, content='committed late')
+        self.assertLess(late.id, later.id)
+        data = self.sync(since=since)
+        self.assertEqual([m['id'] for m in data['messages']], [late.id])
+
+    def test_page_cut_inside_chat_resumes_from_last_seq(self):
+        other_chat = Chat.objects.create()
+        other_chat.participants.set([self.user, self.stranger])
+        extra = [Message.objects.create(chat=other_chat, sender=self.stranger, content=f'x {i}') for i in range(3)]
+
+        data = self.sync(page_size=6)
+        self.assertTrue(data['has_more'])
+        self.assertEqual([m['id'] for m in data['messages']], [m.id for m in self.messages + extra[:1]])
+        data = self.sync(since=data['next_since'], page_size=6)
+        self.assertFalse(data['has_more'])
+        self.assertEqual([m['id'] for m in data['messages']], [m.id for m in extra[1:]])
+
+
+class PrivateChatPairTests(APITestCase):
+    """Личный чат пары пользователей ищется по каноническому ключу (min, max)."""
+
+    def setUp(self):
+        membership.clear()
+        self.user = User.objects.create_user(username='agent', password='pass')
+        self.other = User.objects.create_user(username='client', password='pass')
+        self.third = User.objects.create_user(username='stranger', password='pass')
+
+    def open_dm(self, user, other):
+        self.client.force_authenticate(user)
+        return self.client.post('/api/chat/chats/', {'participants': [other.id]}, format='json')
+
+    def test_open_dm_is_idempotent_in_both_directions(self):
+        first = self.open_dm(self.user, self.other)
+        self.assertEqual(first.status_code, 201)
+
+        again = self.open_dm(self.user, self.other)
+        reverse = self.open_dm(self.other, self.user)
+        self.assertEqual(again.status_code, 200)
+        self.assertEqual({again.data['id'], reverse.data['id']}, {first.data['id']})
+
+        chat = Chat.objects.get(pk=first.data['id'])
+        self.assertEqual(set(chat.participants.values_list('id', flat=True)), {self.user.id, self.other.id})
+        self.assertEqual(
+            (chat.pair_user_min_id, chat.pair_user_max_id),
+            (min(self.user.id, self.other.id), max(self.user.id, self.other.id)),
+        )
+
+    def test_group_chats_do_not_share_the_key(self):
+        dm = self.open_dm(self.user, self.other)
+        group = self.client.post(
+            '/api/chat/chats/', {'participants': [self.other.id], 'is_group_chat': True}, format='json',
+        )
+        self.assertEqual(group.status_code, 201)
+        self.assertNotEqual(group.data['id'], dm.data['id'])
+        self.assertNotEqual(self.open_dm(self.user, self.third).data['id'], dm.data['id'])
+
+    def test_participant_ids_are_normalised_and_checked(self):
+        self.client.force_authenticate(self.user)
+        # "5" и 5 — один участник: это личный чат, а не группа из трёх
+        response = self.client.post(
+            '/api/chat/chats/', {'participants': [str(self.other.id), self.other.id]}, format='json',
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertFalse(response.data['is_group_chat'])
+        self.assertEqual(self.open_dm(self.user, self.other).data['id'], response.data['id'])
+
+        for participants in ([12345], [], ['x'], None):
+            response = self.client.post('/api/chat/chats/', {'participants': participants}, format='json')
+            self.assertEqual(response.status_code, 400, participants)
+        self.assertEqual(Chat.objects.count(), 1)
+
+    def test_duplicate_insert_returns_existing_chat(self):
+        chat, created = Chat.objects.get_or_create_private(self.user.id, self.other.id)
+        self.assertTrue(created)
+        # Повторный INSERT той же пары отклоняет уникальный индекс
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Chat.objects.create(pair_user_min=chat.pair_user_min, pair_user_max=chat.pair_user_max)
+        self.assertEqual(Chat.objects.get_or_create_private(self.other.id, self.user.id), (chat, False))
+
+
+class ConsumerMetricsEndpointTests(APITestCase):
+    """Счётчики WebSocket доступны по роли, а не по is_staff."""
+
+    def test_access_by_role(self):
+        editor = User.objects.create_user(username='editor', password='pass', role='editor')
+        staff = User.objects.create_user(username='staff', password='pass', is_staff=True)
+
+        self.client.force_authenticate(editor)
+        self.assertEqual(self.client.get('/api/chat/metrics/').status_code, 200)
+        self.client.force_authenticate(staff)
+        self.assertEqual(self.client.get('/api/chat/metrics/').status_code, 403)
+
+
+class PresenceEndpointTests(APITestCase):
+    """Онлайн-статус пачки пользователей через REST."""
+
+    def setUp(self):
+        presence.clear()
+        self.user = User.objects.create_user(username='agent', password='pass')
+        self.other = User.objects.create_user(username='client', password='pass')
+        self.client.force_authenticate(self.user)
+
+    def test_batch_statuses_of_contacts_in_one_query(self):
+        stranger = User.objects.create_user(username='stranger', password='pass')
+        chat = Chat.objects.create()
+        chat.participants.set([self.user, self.other])
+        presence.connect(self.other.id)
+        presence.connect(stranger.id)
+
+        # Только собеседники из общих чатов
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/chat/presence/', {'ids': f'{self.other.id},{self.user.id},{stranger.id}'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(response.data), {self.other.id, self.user.id})
+        self.assertTrue(response.data[self.other.id]['online'])
+        self.assertFalse(response.data[self.user.id]['online'])
+
+    @override_settings(CHAT_PRESENCE_TTL=0)
+    def test_status_expires_without_heartbeat(self):
+        presence.connect(self.other.id)
+        self.assertFalse(presence.is_online(self.other.id))
+
+    def test_invalid_ids(self):
+        self.assertEqual(self.client.get('/api/chat/presence/', {'ids': '1,x'}).status_code, 400)
+
+    @override_settings(CHAT_PRESENCE_CACHE_ALIAS='default')
+    def test_shared_status_survives_other_process_disconnect(self):
+        caches['default'].clear()
+        first, second, rest = PresenceRegistry(), PresenceRegistry(), PresenceRegistry()
+        first.connect(self.other.id)
+        second.connect(self.other.id)
+
+        # Последний сокет одного процесса — пользователь онлайн через другой
+        self.assertTrue(first.disconnect(self.other.id))
+        self.assertTrue(rest.is_online(self.other.id))
+        self.assertTrue(json.loads(first.take_broadcast(self.other.id))['online'])
+
+        self.assertTrue(second.disconnect(self.other.id))
+        self.assertFalse(rest.is_online(self.other.id))
+        self.assertFalse(json.loads(second.take_broadcast(self.other.id))['online'])
+
+
+class MessageArchiveTests(APITestCase):
+    """Перенос старых сообщений в архив и история чата поверх обеих таблиц."""
+
+    def setUp(self):
+        membership.clear()
+        self.user = User.objects.create_user(username='agent', password='pass')
+        self.other = User.objects.create_user(username='client', password='pass')
+        self.client.force_authenticate(self.user)
+        self.chat = Chat.objects.create()
+        self.chat.participants.set([self.user, self.other])
+
+        self.messages = [
+            Message.objects.create(chat=self.chat, sender=self.other, content=f'msg {i}')
+            for i in range(6)
+        ]
+        old = timezone.now() - timedelta(days=365)
+        for offset, message in enumerate(self.messages[:4]):
+            Message.objects.filter(pk=message.pk).update(timestamp=old + timedelta(minutes=offset))
+        # На это сообщение ссылается квитанция — оно остаётся в оперативной таблице
+        ReadReceipt.objects.filter(chat=self.chat, user=self.user).update(last_read_message=self.messages[1])
+
+    def archive(self, *args):
+        out = StringIO()
+        call_command('archive_messages', '--batch-size=2', *args, stdout=out)
+        return out.getvalue()
+
+    def test_archives_in_resumable_batches(self):
+        self.archive('--max-batches=1')
+        self.assertEqual(ArchivedMessage.objects.count(), 2)
+
+        self.archive()
+        archived_ids = set(ArchivedMessage.objects.values_list('id', flat=True))
+        self.assertEqual(archived_ids, {self.messages[0].id, self.messages[2].id, self.messages[3].id})
+        self.assertFalse(Message.objects.filter(id__in=archived_ids).exists())
+        self.chat.refresh_from_db()
+        self.assertEqual(self.chat.archived_until, ArchivedMessage.objects.get(pk=self.messages[3].id).timestamp)
+
+    def test_history_reads_both_tables(self):
+        self.archive()
+
+        seen = []
+        cursor = None
+        while True:
+            params = {'page_size': 2}
+            if cursor:
+                params['cursor'] = cursor
+            response = self.client.get(f'/api/chat/chats/{self.chat.id}/messages/', params)
+            self.assertEqual(response.status_code, 200)
+            seen = [m['id'] for m in response.data['results']] + seen
+            cursor = response.data['next_cursor']
+            if not cursor:
+                break
+
+        self.assertEqual(seen, [m.id for m in self.messages])
+
+    def test_newest_page_does_not_touch_archive(self):
+        self.archive()
+        self.chat.refresh_from_db()
+        with CaptureQueriesContext(connection) as queries:
+            MessageKeysetPaginator().paginate_chat(self.chat, page_size=1)
+        self.assertFalse(any('chat_archivedmessage' in q['sql'] for q in queries))
+
+    def test_report(self):
+        output = self.archive('--report')
+        self.assertIn('Оперативная таблица: 6', output)
+        self.assertIn('Готовы к переносу', output)
+        self.assertEqual(ArchivedMessage.objects.count(), 0)
@@ -0,0 +1,116 @@
+# chat/throttling.py
+"""
+Обмеження вхідних команд WebSocket і лічильники для підбору лімітів.
+
+* TokenBucket — класичне "відро токенів": швидкість поповнення rate
+  (команд/с) і запас burst. rate = 0 вимикає обмеження.
+* user_buckets — відра на користувача, спільні для всіх його сокетів у
+  межах процесу (LRU, щоб пам'ять не росла з кількістю користувачів).
+* consumer_metrics — лічильники відхилених команд і відкинутих кадрів,
+  доступні адміністратору через GET /api/chat/metrics/.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+
+class TokenBucket:
+    __slots__ = ('rate', 'burst', 'tokens', 'updated')
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+
+    def consume(self, now=None):
+        """Забирає один токен. False — ліміт вичерпано."""
+        if not self.rate:
+            return True
+        now = time.monotonic() if now is None else now
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    def retry_after(self):
+        """Через скільки секунд з'явиться наступний токен."""
+        if not self.rate:
+            return 0.0
+        return max(0.0, (1 - self.tokens) / self.rate)
+
+
+def socket_bucket():
+    """Відро для одного сокета за налаштуваннями CHAT_WS_SOCKET_*."""
+    return TokenBucket(
+        getattr(settings, 'CHAT_WS_SOCKET_RATE', 10),
+        getattr(settings, 'CHAT_WS_SOCKET_BURST', 20),
+    )
+
+
+class UserBuckets:
+
+    def __init__(self):
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def max_entries(self):
+        return getattr(settings, 'CHAT_WS_USER_BUCKETS_MAX_ENTRIES', 10000)
+
+    def get(self, user_id):
+        with self._lock:
+            bucket = self._buckets.get(user_id)
+            if bucket is None:
+                bucket = TokenBucket(
+                    getattr(settings, 'CHAT_WS_USER_RATE', 20),
+                    getattr(settings, 'CHAT_WS_USER_BURST', 40),
+                )
+                self._buckets[user_id] = bucket
+                while len(self._buckets) > self.max_entries:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(user_id)
+            return bucket
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+user_buckets = UserBuckets()
+
+
+class ConsumerMetrics:
+    FIELDS = ('throttled_socket', 'throttled_user', 'dropped_frames', 'slow_disconnects')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = dict.fromkeys(self.FIELDS, 0)
+        self._queue_high_watermark = 0
+
+    def incr(self, name, amount=1):
+        with self._lock:
+            self._counters[name] += amount
+
+    def observe_queue_depth(self, depth):
+        # Найбільша глибина черги вихідних кадрів — орієнтир для CHAT_WS_OUTBOUND_QUEUE_SIZE
+        if depth > self._queue_high_watermark:
+            with self._lock:
+                self._queue_high_watermark = max(self._queue_high_watermark, depth)
+
+    def stats(self):
+        with self._lock:
+            return {**self._counters, 'outbound_queue_high_watermark': self._queue_high_watermark}
+
+    def reset(self):
+        with self._lock:
+            self._counters = dict.fromkeys(self.FIELDS, 0)
+            self._queue_high_watermark = 0
+
+
+consumer_metrics = ConsumerMetrics()
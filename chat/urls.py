@@ -8,5 +8,8 @@ router.register(r'chats', views.ChatViewSet, basename='chat')
 # router.register(r'messages', views.MessageViewSet, basename='message') # Используем 'chats/pk/send_message' вместо этого
 
 urlpatterns = [
+    path('sync/', views.SyncView.as_view(), name='chat-sync'),
+    path('presence/', views.PresenceView.as_view(), name='chat-presence'),
+    path('metrics/', views.ConsumerMetricsView.as_view(), name='chat-metrics'),
     path('', include(router.urls)),
 ]
\ No newline at end of file
@@ -4,12 +4,24 @@ from rest_framework import viewsets, permissions, status
 from rest_framework.decorators import action
 from rest_framework.exceptions import PermissionDenied
 from rest_framework.response import Response
-from django.db import models
+from rest_framework.views import APIView
+from django.conf import settings
 from django.db.models import Q
 from django.http import Http404
 from .models import Chat, Message, ReadReceipt  # Додано імпорт ReadReceipt
-from .serializers import ChatListSerializer, ChatDetailSerializer, MessageSerializer
+from .serializers import (
+    ChatListSerializer, ChatDetailSerializer, ChatParticipantsSerializer, ChatSyncSerializer, MessageSerializer,
+    ReadReceiptSyncSerializer,
+)
+from .pagination import MessageKeysetPaginator
 from .permissions import IsParticipant
+from .membership import is_member
+from .receipts import receipt_buffer
+from .search import search_messages
+from .sync import collect_changes, parse_since
+from .presence import contact_ids, presence
+from .throttling import consumer_metrics
+from tasks.permissions import IsAdminOrEditor
 from django.contrib.auth import get_user_model
 
 User = get_user_model()
@@ -24,31 +36,63 @@ class ChatViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         """Пользователь видит только те чаты, в которых он участвует."""
         user = self.request.user
-        return Chat.objects.filter(participants=user).order_by('-created_at').distinct()
+        queryset = Chat.objects.for_user(user).order_by('-created_at')
+        if self.action == 'list':
+            queryset = queryset.with_summary(user).prefetch_related('participants')
+        return queryset
 
     def get_serializer_class(self):
         if self.action == 'list':
             return ChatListSerializer
         return ChatDetailSerializer
 
-    def perform_create(self, serializer):
-        participants_data = self.request.data.get('participants')
-        if not participants_data or len(participants_data) == 0:
-            raise Exception("Участники не указаны.")
+    def list(self, request, *args, **kwargs):
+        """
+        Список чатов за фиксированное количество запросов: чаты с аннотациями,
+        участники (prefetch) и последние сообщения одним запросом.
+        """
+        queryset = self.filter_queryset(self.get_queryset())
 
-        participants_ids = set(participants_data)
-        participants_ids.add(self.request.user.id)
+        page = self.paginate_queryset(queryset)
+        chats = list(page if page is not None else queryset)
+        self.attach_last_messages(chats)
 
-        if len(participants_ids) == 2 and not self.request.data.get('is_group_chat'):
-            existing_chats = Chat.objects.filter(
-                is_group_chat=False,
-                participants__id__in=participants_ids
-            ).annotate(p_count=models.Count('participants')).filter(p_count=2)
+        serializer = self.get_serializer(chats, many=True)
+        if page is not None:
+            return self.get_paginated_response(serializer.data)
+        return Response(serializer.data)
 
-            if existing_chats.exists():
-                return existing_chats.first()
+    @staticmethod
+    def attach_last_messages(chats):
+        """Подгружает последние сообщения для списка чатов одним запросом."""
+        message_ids = [chat.last_message_id for chat in chats if chat.last_message_id]
+        messages = Message.objects.select_related('sender').in_bulk(message_ids)
+        for chat in chats:
+            chat.last_message_obj = messages.get(chat.last_message_id)
+
+    def create(self, request, *args, **kwargs):
+        self.chat_created = True
+        response = super().create(request, *args, **kwargs)
+        if not self.chat_created:
+            response.status_code = status.HTTP_200_OK
+        return response
+
+    def perform_create(self, serializer):
+        participants = ChatParticipantsSerializer(data=self.request.data)
+        participants.is_valid(raise_exception=True)
+        participants_ids = participants.validated_data['participants'] | {self.request.user.id}
+
+        if len(participants_ids) == 2 and not self.request.data.get('is_group_chat'):
+            # Личный чат ищется по уникальному ключу пары; повторный запрос
+            # (в т.ч. параллельный) возвращает уже существующий чат
+            chat, self.chat_created = Chat.objects.get_or_create_private(
+                *participants_ids, title=serializer.validated_data.get('title'),
+            )
+            serializer.instance = chat
+            return chat
 
         chat = serializer.save(is_group_chat=len(participants_ids) > 2 or self.request.data.get('is_group_chat', False))
+        # У режимі доставки 'user' новий чат одразу "живий" для підключених сокетів
         chat.participants.set(participants_ids)
         return chat
 
@@ -63,29 +107,67 @@ class ChatViewSet(viewsets.ModelViewSet):
         user = request.user
 
         # 🛠️ ИСПРАВЛЕНИЕ 3: Использование 'messages' вместо 'message_set'
-        last_message = chat.messages.filter(sender__isnull=False).order_by('-timestamp').first()
+        last_message_id = chat.messages.filter(
+            sender__isnull=False,
+        ).order_by('-timestamp', '-id').values_list('id', flat=True).first()
 
-        if not last_message:
+        if not last_message_id:
             return Response({'detail': 'У цьому чаті немає повідомлень.'}, status=status.HTTP_204_NO_CONTENT)
 
-        # Створюємо або оновлюємо ReadReceipt
-        receipt, created = ReadReceipt.objects.update_or_create(
-            chat=chat,
-            user=user,
-            defaults={'last_read_message': last_message}
-        )
+        # Відмітка буферизується й записується пачкою разом з WS-відмітками
+        receipt_buffer.mark(chat.id, user.id, last_message_id)
 
         return Response({
             'detail': f'Чат {pk} позначено як прочитаний.',
-            'last_read_message_id': last_message.id
+            'last_read_message_id': last_message_id
         }, status=status.HTTP_200_OK)
 
+    @action(detail=False, methods=['get'])
+    def search(self, request):
+        """
+        Полнотекстовый поиск по сообщениям чатов пользователя (chats/search/?q=).
+        Результаты ранжированы по релевантности, параметры страницы: `page`, `page_size`.
+        """
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return Response({'detail': 'Параметр q обязателен.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        paginator = MessageKeysetPaginator(request)
+        page_size = paginator.get_page_size()
+        try:
+            page = max(int(request.query_params.get('page', 1)), 1)
+        except ValueError:
+            return Response({'page': 'Ожидается целое число.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        messages, has_next = search_messages(request.user, query, page_size, page)
+
+        return Response({
+            'results': MessageSerializer(messages, many=True).data,
+            'next_page': page + 1 if has_next else None,
+        })
+
+    @action(detail=True, methods=['get'])
+    def messages(self, request, pk=None):
+        """
+        История сообщений чата страницами "назад" по курсору (timestamp, id),
+        включая перенесённые в архив. Параметры: `cursor` (из `next_cursor` предыдущей страницы) и `page_size`.
+        """
+        chat = self.get_object()
+
+        paginator = MessageKeysetPaginator(request)
+        messages, next_cursor = paginator.paginate_chat(chat)
+
+        return Response({
+            'results': MessageSerializer(messages, many=True).data,
+            'next_cursor': next_cursor,
+        })
+
     @action(detail=True, methods=['post'])
     def send_message(self, request, pk=None):
         """REST-эндпоинт для отправки сообщения (используется как резерв или для проверки)."""
         chat = self.get_object()
 
-        if request.user not in chat.participants.all():
+        if not is_member(chat.pk, request.user.pk):
             return Response({"detail": "Вы не являетесь участником этого чата."},
                             status=status.HTTP_403_FORBIDDEN)
 
@@ -96,12 +178,8 @@ class ChatViewSet(viewsets.ModelViewSet):
         if serializer.is_valid():
             serializer.save(chat=chat, sender=request.user)
 
-            # ОНОВЛЮЄМО ВЛАСНУ КВИТАНЦІЮ ПРО ПРОЧИТАННЯ
-            ReadReceipt.objects.update_or_create(
-                chat=chat,
-                user=request.user,
-                defaults={'last_read_message': serializer.instance}
-            )
+            # ОНОВЛЮЄМО КВИТАНЦІЇ: власна прочитана, іншим учасникам +1 до непрочитаних
+            ReadReceipt.objects.register_message(serializer.instance)
 
             # channel_layer.send(group_name, ...)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
@@ -117,7 +195,71 @@ class MessageViewSet(viewsets.ModelViewSet):
 
     def perform_create(self, serializer):
         chat = serializer.validated_data['chat']
-        if self.request.user not in chat.participants.all():
+        if not is_member(chat.pk, self.request.user.pk):
             raise PermissionDenied("Вы не можете отправлять сообщения в этот чат.")
 
-        serializer.save(sender=self.request.user)
\ No newline at end of file
+        message = serializer.save(sender=self.request.user)
+        ReadReceipt.objects.register_message(message)
+
+
+class SyncView(APIView):
+    """
+    Дельта-синхронизация (GET /api/chat/sync/?since=): новые сообщения,
+    изменившиеся квитанции и новые чаты пользователя одним ответом.
+    `since` — ID сообщения, время ISO 8601 или `next_since` прошлого ответа;
+    пока `has_more` истинно, следующую страницу запрашивают с `next_since`.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        page_size = MessageKeysetPaginator(request).get_page_size()
+        since = parse_since(request.user, request.query_params.get('since', '').strip())
+
+        messages, receipts, chats, next_since, has_more = collect_changes(request.user, since, page_size)
+
+        return Response({
+            'messages': MessageSerializer(messages, many=True).data,
+            'read_receipts': ReadReceiptSyncSerializer(receipts, many=True).data,
+            'chats': ChatSyncSerializer(chats, many=True).data,
+            'next_since': next_since,
+            'has_more': has_more,
+        })
+
+
+class ConsumerMetricsView(APIView):
+    """
+    Счётчики WebSocket текущего процесса (GET /api/chat/metrics/): отклонённые
+    лимитами команды и отброшенные кадры — для подбора CHAT_WS_* по реальной нагрузке.
+    Доступ — по роли пользователя (admin/editor), а не по is_staff.
+    """
+    permission_classes = [IsAdminOrEditor]
+
+    def get(self, request):
+        return Response(consumer_metrics.stats())
+
+
+class PresenceView(APIView):
+    """
+    Онлайн-статус пачки пользователей одним запросом (GET /api/chat/presence/?ids=1,2,3).
+    Как и подписка по WebSocket — только для собеседников из общих чатов
+    (один запрос), остальные ID в ответ не попадают. Сами статусы берутся
+    из памяти процесса / общего кеша.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        raw_ids = [value for value in request.query_params.get('ids', '').split(',') if value.strip()]
+        try:
+            user_ids = list(dict.fromkeys(int(value) for value in raw_ids))
+        except ValueError:
+            return Response({'ids': 'Ожидается список целых чисел через запятую.'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        limit = getattr(settings, 'CHAT_PRESENCE_MAX_SUBSCRIPTIONS', 500)
+        if len(user_ids) > limit:
+            return Response({'ids': f'Не более {limit} пользователей за запрос.'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        contacts = contact_ids(request.user, user_ids)
+        user_ids = [user_id for user_id in user_ids if user_id in contacts]
+        return Response(presence.statuses(user_ids))
@@ -14,6 +14,7 @@ django_asgi_app = get_asgi_application()
 # 3. Тепер ми можемо безпечно імпортувати код, що залежить від налаштувань (Token, models, etc.).
 from channels.routing import ProtocolTypeRouter, URLRouter
 from chat import routing
+from tasks import routing as tasks_routing
 from accounts.middleware import TokenAuthMiddlewareStack  # Тепер цей імпорт безпечний!
 
 application = ProtocolTypeRouter({
@@ -23,7 +24,7 @@ application = ProtocolTypeRouter({
     # Обробляє WebSocket-запити
     "websocket": TokenAuthMiddlewareStack(
         URLRouter(
-            routing.websocket_urlpatterns
+            routing.websocket_urlpatterns + tasks_routing.websocket_urlpatterns
         )
     ),
 })
\ No newline at end of file
@@ -103,7 +103,7 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # ---------------------- REST FRAMEWORK ----------------------
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": [
-        "rest_framework.authentication.TokenAuthentication",
+        "accounts.authentication.CachedTokenAuthentication",
         "rest_framework.authentication.SessionAuthentication",
     ],
     "DEFAULT_PERMISSION_CLASSES": [
@@ -111,6 +111,13 @@ REST_FRAMEWORK = {
     ],
 }
 
+# Кэш "токен → пользователь" (accounts/authentication.py) для REST и WebSocket.
+# При нескольких воркерах задайте alias общего кэша из CACHES: иначе логаут и
+# изменения пользователя другие процессы увидят только через TTL
+AUTH_TOKEN_CACHE_TTL = 60
+AUTH_TOKEN_CACHE_MAX_ENTRIES = 10000
+AUTH_TOKEN_CACHE_ALIAS = None
+
 # ---------------------- CORS ----------------------
 CORS_ALLOWED_ORIGINS = [
     "http://localhost:5173",
@@ -133,3 +140,88 @@ CSRF_TRUSTED_ORIGINS = [
 ]
 
 AUTH_USER_MODEL = "accounts.CustomUser"
+
+# ---------------------- CHAT ----------------------
+# Размер страницы истории сообщений (chats/{id}/messages/ и детальный просмотр чата)
+CHAT_MESSAGES_PAGE_SIZE = 50
+CHAT_MESSAGES_MAX_PAGE_SIZE = 200
+
+# Режим доставки подій чату через channel layer (див. chat/delivery.py):
+# 'user' — одна група user_{id} на сокет, 'chat' — група chat_{id} на кожен чат
+CHAT_DELIVERY_MODE = 'user'
+
+# Кеш членства в чатах (chat/membership.py): TTL локальної копії в секундах,
+# максимум чатів у кеші та alias спільного кешу з CACHES. Для кількох воркерів
+# alias обов'язковий: інакше зміни складу чату інші процеси побачать лише через TTL
+CHAT_MEMBERSHIP_TTL = 30
+CHAT_MEMBERSHIP_MAX_ENTRIES = 10000
+CHAT_MEMBERSHIP_CACHE_ALIAS = None
+
+# Вікно буферизації відміток "прочитано" в секундах (chat/receipts.py); 0 — писати одразу
+CHAT_READ_RECEIPT_FLUSH_INTERVAL = 1.0
+
+# Полнотекстовый поиск (chat/search.py): сколько самых свежих совпадений ранжировать
+CHAT_SEARCH_RANK_WINDOW = 2000
+
+# Збереження повідомлень WebSocket (chat/pipeline.py): 'sync' — INSERT на кожне
+# повідомлення, 'pipeline' — розсилка одразу і пакетний запис у фоні
+CHAT_PERSISTENCE_MODE = 'sync'
+CHAT_PIPELINE_BATCH_SIZE = 200
+CHAT_PIPELINE_FLUSH_INTERVAL = 0.05
+# Спроб записати повідомлення, перш ніж учасники отримають кадр 'failed'
+CHAT_PIPELINE_MAX_ATTEMPTS = 3
+# 'flush' — дописувати буфер при відключенні сокета та виході процесу, 'none' — ні
+CHAT_PIPELINE_DURABILITY = 'flush'
+
+# Команда 'resume' (ChatConsumer): розмір пачки та максимум повідомлень на чат,
+# після якого клієнт отримує 'truncated' і перезавантажує чат через REST
+CHAT_RESUME_BATCH_SIZE = 100
+CHAT_RESUME_MAX_MESSAGES = 1000
+
+# Ліміти вхідних команд WebSocket (chat/throttling.py): відро токенів на сокет і на
+# користувача — швидкість поповнення (команд/с, 0 — без ліміту) і запас
+CHAT_WS_SOCKET_RATE = 10
+CHAT_WS_SOCKET_BURST = 20
+CHAT_WS_USER_RATE = 20
+CHAT_WS_USER_BURST = 40
+# Черга вихідних кадрів сокета та реакція на повільного клієнта: 'drop' або 'disconnect'
+CHAT_WS_OUTBOUND_QUEUE_SIZE = 256
+CHAT_WS_SLOW_CONSUMER_POLICY = 'drop'
+
+# Присутність і набір тексту (chat/presence.py), лише в пам'яті: статус живе
+# CHAT_PRESENCE_TTL секунд після heartbeat; не більше одного оновлення на
+# користувача за інтервал; необов'язковий alias спільного кешу з CACHES
+CHAT_PRESENCE_TTL = 60
+CHAT_PRESENCE_BROADCAST_INTERVAL = 5
+CHAT_PRESENCE_MAX_SUBSCRIPTIONS = 500
+CHAT_PRESENCE_CACHE_ALIAS = None
+CHAT_TYPING_INTERVAL = 3
+
+# Архив сообщений (python manage.py archive_messages): возраст переноса в днях и размер пачки
+CHAT_ARCHIVE_AFTER_DAYS = 180
+CHAT_ARCHIVE_BATCH_SIZE = 1000
+
+# Доска задач (GET /api/tasks/board/): задач в колонке по умолчанию и максимум
+TASKS_BOARD_COLUMN_LIMIT = 50
+TASKS_BOARD_MAX_COLUMN_LIMIT = 200
+
+# Список задач (GET /api/tasks/tasks/): размер страницы по умолчанию и максимум
+TASKS_LIST_PAGE_SIZE = 50
+TASKS_LIST_MAX_PAGE_SIZE = 200
+
+# Пакетные операции над задачами (tasks/bulk.py): максимум элементов в запросе
+TASKS_BULK_MAX_ITEMS = 500
+
+# Живые обновления доски (tasks/realtime.py): окно объединения изменений в секундах
+TASKS_BOARD_EVENTS_WINDOW = 0.25
+
+# Ранги карточек (tasks/ranking.py): длина, после которой колонка перенумеровывается,
+# и задержка фоновой перенумерации в секундах
+TASKS_RANK_REBALANCE_LENGTH = 16
+TASKS_RANK_REBALANCE_DELAY = 1.0
+
+# Реестр статусов задач в памяти (tasks/statuses.py): срок жизни копии в секундах
+TASKS_STATUS_REGISTRY_TTL = 300
+
+# Отчёт по времени (GET /api/tasks/reports/time/): максимальный диапазон в днях
+TASKS_TIME_REPORT_MAX_DAYS = 366
@@ -0,0 +1,253 @@
+# tasks/bulk.py
+"""
+Пакетные операции над задачами (POST/PATCH /api/tasks/tasks/bulk/,
+POST .../bulk/move/, POST .../bulk/assign/).
+
+Пакет проверяется целиком до записи: элементы — сериализатором без запросов
+(статус по реестру), исполнители — одним запросом, права — одним запросом
+по задачам пакета (для обычных пользователей — с EXISTS по назначению).
+Если хоть один элемент не прошёл проверку, ничего не записывается, а в
+ответе перечислены ошибки по индексам. Иначе изменения применяются в одной
+транзакции через bulk_create / bulk_update / UPDATE ... WHERE id IN и
+пакетную вставку в связующую таблицу исполнителей; ответ — только ID задач.
+
+Сигналы моделей при этом не отправляются; доски получают изменения через
+tasks/realtime.py.
+"""
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Max
+from rest_framework.exceptions import ValidationError
+
+from .models import Status, Task
+from .ranking import needs_rebalance, rank_after, rank_rebalancer
+from .realtime import board_events
+from .serializers import BulkTaskSerializer
+from .statuses import status_registry
+
+User = get_user_model()
+
+UPDATE_FIELDS = ('title', 'description', 'status', 'due_date')
+
+
+class BulkItemsError(Exception):
+    """Ошибки элементов пакета: [{'index': i, 'errors': {...}}]."""
+
+    def __init__(self, errors):
+        super().__init__(errors)
+        self.errors = errors
+
+
+def max_items():
+    return getattr(settings, 'TASKS_BULK_MAX_ITEMS', 500)
+
+
+def parse_list(data, name):
+    items = data.get(name) if isinstance(data, dict) else None
+    if not isinstance(items, list) or not items:
+        raise ValidationError({name: 'Ожидается непустой список.'})
+    if len(items) > max_items():
+        raise ValidationError({name: f'Не больше {max_items()} элементов за запрос.'})
+    return items
+
+
+def parse_ids(data, name, required=True):
+    if not required and not (isinstance(data, dict) and data.get(name)):
+        return []
+    ids = parse_list(data, name)
+    if not all(isinstance(value, int) and not isinstance(value, bool) for value in ids):
+        raise ValidationError({name: 'Ожидается список целых чисел.'})
+    return list(dict.fromkeys(ids))
+
+
+def is_manager(user):
+    return getattr(user, 'role', None) in ['admin', 'editor']
+
+
+def editable_tasks(user, ids):
+    """Задачи из ids, которые пользователь может изменять, — одним запросом."""
+    queryset = Task.objects.filter(id__in=ids)
+    if not is_manager(user):
+        queryset = queryset.assigned_to_user(user.pk)
+    return queryset
+
+
+def unknown_users(user_ids):
+    user_ids = set(user_ids)
+    if not user_ids:
+        return set()
+    return user_ids - set(User.objects.filter(id__in=user_ids).values_list('id', flat=True))
+
+
+def validate_items(items, partial=False):
+    serializer = BulkTaskSerializer(data=items, many=True, partial=partial)
+    if not serializer.is_valid():
+        errors = serializer.errors
+        # В зависимости от версии DRF ошибки элементов — список или {индекс: ошибки}
+        pairs = errors.items() if isinstance(errors, dict) else enumerate(errors)
+        raise BulkItemsError([{'index': index, 'errors': item} for index, item in pairs if item])
+    return serializer.validated_data
+
+
+def assignment_rows(task_ids, user_ids):
+    through = Task.assigned_to.through
+    user_field = Task.assigned_to.field.m2m_reverse_field_name()
+    return [through(task_id=task_id, **{f'{user_field}_id': user_id}) for task_id in task_ids for user_id in user_ids]
+
+
+def append_to_columns(tasks):
+    """
+    Ставит карточки tasks в конец колонок task.status_id в порядке списка:
+    последние ранги всех затронутых колонок — одним запросом. Ранг из старой
+    колонки при смене статуса не годится — он совпал бы с рангами новой.
+
+    Вызывается внутри транзакции: строки статусов колонок блокируются до её
+    конца, поэтому параллельные пакеты в ту же колонку читают последний ранг
+    по очереди и не выдают одинаковых рангов.
+    """
+    if not tasks:
+        return
+    status_ids = {task.status_id for task in tasks}
+    list(Status.objects.select_for_update().filter(id__in=status_ids).order_by('id').values_list('id', flat=True))
+    last_ranks = dict(
+        Task.objects.filter(status_id__in=status_ids)
+        .order_by().values('status_id').annotate(last=Max('rank')).values_list('status_id', 'last')
+    )
+    for task in tasks:
+        task.rank = last_ranks[task.status_id] = rank_after(last_ranks.get(task.status_id))
+    for status_id, rank in last_ranks.items():
+        if rank and needs_rebalance(rank):
+            rank_rebalancer.request(status_id)
+
+
+def bulk_create_tasks(user, data):
+    validated = validate_items(parse_list(data, 'tasks'))
+
+    missing = unknown_users(user_id for item in validated for user_id in item.get('assigned_to_ids', []))
+    errors = [
+        {'index': index, 'errors': {'assigned_to_ids': f'Пользователи не найдены: {sorted(bad)}.'}}
+        for index, item in enumerate(validated)
+        for bad in [missing.intersection(item.get('assigned_to_ids', []))] if bad
+    ]
+    if errors:
+        raise BulkItemsError(errors)
+
+    tasks = []
+    for item in validated:
+        fields = {name: item[name] for name in UPDATE_FIELDS if name in item}
+        tasks.append(Task(creator=user, **fields))
+
+    with transaction.atomic():
+        # Новые карточки встают в конец своих колонок
+        append_to_columns(tasks)
+        Task.objects.bulk_create(tasks)
+        rows = []
+        for task, item in zip(tasks, validated):
+            rows += assignment_rows([task.id], dict.fromkeys(item.get('assigned_to_ids', [])))
+        Task.assigned_to.through.objects.bulk_create(rows, batch_size=1000)
+        board_events.changed(task.id for task in tasks)
+    return tasks
+
+
+def bulk_update_tasks(user, data):
+    validated = validate_items(parse_list(data, 'tasks'), partial=True)
+
+    errors = []
+    seen = set()
+    for index, item in enumerate(validated):
+        if 'id' not in item:
+            errors.append({'index': index, 'errors': {'id': 'Обязательное поле.'}})
+        elif item['id'] in seen:
+            errors.append({'index': index, 'errors': {'id': 'Задача повторяется в пакете.'}})
+        elif 'assigned_to_ids' in item:
+            errors.append({'index': index, 'errors': {'assigned_to_ids': 'Исполнители меняются через bulk/assign/.'}})
+        seen.add(item.get('id'))
+    if errors:
+        raise BulkItemsError(errors)
+
+    tasks = {task.id: task for task in editable_tasks(user, [item['id'] for item in validated])}
+    errors = [
+        {'index': index, 'errors': {'id': 'Задача не найдена или недоступна.'}}
+        for index, item in enumerate(validated) if item['id'] not in tasks
+    ]
+    if errors:
+        raise BulkItemsError(errors)
+
+    changed = set()
+    moved = []
+    for item in validated:
+        task = tasks[item['id']]
+        if 'status' in item and item['status'].id != task.status_id:
+            moved.append(task)
+        for name in UPDATE_FIELDS:
+            if name in item:
+                setattr(task, name, item[name])
+                changed.add(name)
+
+    updated = [tasks[item['id']] for item in validated]
+    if moved:
+        changed.add('rank')
+    if changed:
+        with transaction.atomic():
+            # Перенесённые карточки — в конец новых колонок
+            append_to_columns(moved)
+            Task.objects.bulk_update(updated, sorted(changed), batch_size=500)
+            board_events.changed(task.id for task in updated)
+    return updated
+
+
+def bulk_move_tasks(user, data):
+    ids = parse_ids(data, 'ids')
+    status = status_registry.get(data.get('status_id'))
+    if status is None:
+        raise ValidationError({'status_id': 'Неизвестный статус.'})
+
+    current = dict(editable_tasks(user, ids).order_by().values_list('id', 'status_id'))
+    errors = [
+        {'index': index, 'errors': {'id': 'Задача не найдена или недоступна.'}}
+        for index, task_id in enumerate(ids) if task_id not in current
+    ]
+    if errors:
+        raise BulkItemsError(errors)
+
+    # Карточки, уже стоящие в колонке, сохраняют ранг; остальные — в её конец
+    # в порядке ids. Блокировка колонки, её последний ранг и UPDATE с CASE по id
+    moved = [Task(id=task_id, status=status) for task_id in ids if current[task_id] != status.id]
+    with transaction.atomic():
+        append_to_columns(moved)
+        Task.objects.bulk_update(moved, ['status', 'rank'], batch_size=500)
+        board_events.changed(ids)
+    return ids
+
+
+def bulk_assign_tasks(user, data):
+    """Добавляет исполнителей `add` и снимает `remove` у задач `ids` (только для Admin/Editor)."""
+    ids = parse_ids(data, 'ids')
+    add = parse_ids(data, 'add', required=False)
+    remove = parse_ids(data, 'remove', required=False)
+    if not add and not remove:
+        raise ValidationError({'add': 'Укажите add и/или remove.'})
+    if set(add) & set(remove):
+        raise ValidationError({'remove': 'Пользователь не может быть одновременно в add и remove.'})
+
+    missing = unknown_users(add)
+    if missing:
+        raise ValidationError({'add': f'Пользователи не найдены: {sorted(missing)}.'})
+    existing = set(Task.objects.filter(id__in=ids).order_by().values_list('id', flat=True))
+    errors = [
+        {'index': index, 'errors': {'id': 'Задача не найдена.'}}
+        for index, task_id in enumerate(ids) if task_id not in existing
+    ]
+    if errors:
+        raise BulkItemsError(errors)
+
+    through = Task.assigned_to.through
+    user_field = Task.assigned_to.field.m2m_reverse_field_name()
+    with transaction.atomic():
+        if remove:
+            through.objects.filter(task_id__in=ids, **{f'{user_field}_id__in': remove}).delete()
+        if add:
+            through.objects.bulk_create(assignment_rows(ids, add), ignore_conflicts=True, batch_size=1000)
+        board_events.changed(ids, previous_assignees=remove)
+    return ids
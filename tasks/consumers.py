@@ -0,0 +1,31 @@
+# tasks/consumers.py
+from channels.generic.websocket import AsyncWebsocketConsumer
+
+from .realtime import board_groups_for
+
+
+class BoardConsumer(AsyncWebsocketConsumer):
+    """
+    Живые обновления доски (ws/board/?token=...). Клиент ничего не отправляет:
+    сокет подписывается на группы доски пользователя (tasks/realtime.py) и
+    пересылает готовые кадры с изменениями задач.
+    """
+
+    async def connect(self):
+        self.user = self.scope["user"]
+        if not self.user.is_authenticated:
+            await self.close()
+            return
+
+        self.board_group_names = board_groups_for(self.user)
+        for group_name in self.board_group_names:
+            await self.channel_layer.group_add(group_name, self.channel_name)
+        await self.accept()
+
+    async def disconnect(self, close_code):
+        for group_name in getattr(self, 'board_group_names', []):
+            await self.channel_layer.group_discard(group_name, self.channel_name)
+
+    async def board_update(self, event):
+        # Кадр закодирован один раз при рассылке и пересылается без изменений
+        await self.send(text_data=event['frame'])
@@ -0,0 +1,85 @@
+# tasks/filters.py
+"""
+Серверные фильтры списка задач (GET /api/tasks/tasks/).
+
+* status=<id>[,<id>...] — задачи в перечисленных колонках;
+* assigned_to=<id>|me — задачи исполнителя (EXISTS по связующей таблице);
+* creator=<id>|me — задачи автора;
+* due_after / due_before — срок в диапазоне (ISO 8601, границы включительно);
+* overdue=true — срок прошёл, а задача ещё не в DONE.
+"""
+from datetime import datetime, time
+
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework.exceptions import ValidationError
+
+from .statuses import status_registry
+
+
+def parse_user_id(request, name):
+    value = request.query_params.get(name, '').strip()
+    if not value:
+        return None
+    if value == 'me':
+        return request.user.pk
+    if not value.isdigit():
+        raise ValidationError({name: 'Ожидается ID пользователя или "me".'})
+    return int(value)
+
+
+def parse_due(request, name, end_of_day=False):
+    value = request.query_params.get(name, '').strip()
+    if not value:
+        return None
+    try:
+        day = parse_date(value)
+        if day is not None:
+            # Дата без времени: весь день включительно
+            moment = datetime.combine(day, time.max if end_of_day else time.min)
+        else:
+            moment = parse_datetime(value)
+            if moment is None:
+                raise ValueError(value)
+    except ValueError:
+        raise ValidationError({name: 'Ожидается дата или время в формате ISO 8601.'})
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+def filter_tasks(request, queryset):
+    params = request.query_params
+
+    raw_statuses = [value.strip() for value in params.get('status', '').split(',') if value.strip()]
+    if raw_statuses:
+        statuses = [status_registry.get(value) for value in raw_statuses]
+        if None in statuses:
+            raise ValidationError({'status': 'Неизвестный статус.'})
+        queryset = queryset.filter(status_id__in=[item.id for item in statuses])
+
+    assignee_id = parse_user_id(request, 'assigned_to')
+    if assignee_id is not None:
+        queryset = queryset.assigned_to_user(assignee_id)
+
+    creator_id = parse_user_id(request, 'creator')
+    if creator_id is not None:
+        queryset = queryset.filter(creator_id=creator_id)
+
+    due_after = parse_due(request, 'due_after')
+    if due_after is not None:
+        queryset = queryset.filter(due_date__gte=due_after)
+    due_before = parse_due(request, 'due_before', end_of_day=True)
+    if due_before is not None:
+        queryset = queryset.filter(due_date__lte=due_before)
+
+    overdue = params.get('overdue', '').strip().lower()
+    if overdue in ('1', 'true', 'yes'):
+        queryset = queryset.filter(due_date__lt=timezone.now())
+        done = status_registry.by_title('DONE')
+        if done is not None:
+            queryset = queryset.exclude(status_id=done.id)
+    elif overdue not in ('', '0', 'false', 'no'):
+        raise ValidationError({'overdue': 'Ожидается true или false.'})
+
+    return queryset
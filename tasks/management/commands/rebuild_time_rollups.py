@@ -0,0 +1,34 @@
+# tasks/management/commands/rebuild_time_rollups.py
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from tasks.models import TimeEntry, TimeRollup
+from tasks.rollups import rebuild
+
+
+class Command(BaseCommand):
+    help = (
+        "Пересобирает сводную таблицу учета времени (TimeRollup) из записей TimeEntry "
+        "одним агрегирующим запросом и пачками bulk_create. Нужна после первого "
+        "развёртывания и после массовых изменений в обход сигналов (QuerySet.update/delete)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', default=None,
+                            help="Пересобрать только дни начиная с указанной даты (ГГГГ-ММ-ДД).")
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help="Количество строк сводки в одном bulk_create.")
+
+    def handle(self, *args, since, batch_size, **options):
+        if since is not None:
+            try:
+                since = date.fromisoformat(since)
+            except ValueError:
+                raise CommandError("--since: ожидается дата в формате ГГГГ-ММ-ДД.")
+
+        created = rebuild(since=since, batch_size=batch_size)
+        self.stdout.write(self.style.SUCCESS(
+            f"Строк сводки: {created} (записей времени: {TimeEntry.objects.count()}, "
+            f"всего строк в сводке: {TimeRollup.objects.count()})."
+        ))
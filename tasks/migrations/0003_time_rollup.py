@@ -0,0 +1,60 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:48
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+
+
+def backfill_rollups(apps, schema_editor):
+    """Заполняет сводку из уже существующих завершённых записей времени."""
+    TimeEntry = apps.get_model('tasks', 'TimeEntry')
+    TimeRollup = apps.get_model('tasks', 'TimeRollup')
+    db_alias = schema_editor.connection.alias
+
+    grouped = (
+        TimeEntry.objects.using(db_alias).filter(duration__isnull=False)
+        .annotate(day=TruncDate('start_time')).values('day', 'user_id', 'task_id')
+        .annotate(total=Sum('duration'), count=Count('id')).order_by()
+    )
+    batch = []
+    for row in grouped.iterator(chunk_size=2000):
+        batch.append(TimeRollup(
+            day=row['day'], user_id=row['user_id'], task_id=row['task_id'],
+            seconds=int(row['total'].total_seconds()), entries=row['count'],
+        ))
+        if len(batch) >= 1000:
+            TimeRollup.objects.using(db_alias).bulk_create(batch)
+            batch = []
+    if batch:
+        TimeRollup.objects.using(db_alias).bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tasks', '0002_task_list_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TimeRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='День')),
+                ('seconds', models.BigIntegerField(default=0, verbose_name='Секунд')),
+                ('entries', models.IntegerField(default=0, verbose_name='Записей')),
+                ('task', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='time_rollups', to='tasks.task', verbose_name='Задача')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='time_rollups', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Сводка времени',
+                'verbose_name_plural': 'Сводки времени',
+                'indexes': [models.Index(fields=['user', 'day'], name='tasks_rollup_user_day_idx'), models.Index(fields=['task', 'day'], name='tasks_rollup_task_day_idx')],
+                'constraints': [models.UniqueConstraint(fields=('day', 'user', 'task'), name='tasks_rollup_day_user_task_uniq')],
+            },
+        ),
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
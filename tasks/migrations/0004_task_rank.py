@@ -0,0 +1,65 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:56
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F
+
+# Копия tasks.ranking.spread_ranks на момент миграции: миграция не должна
+# зависеть от того, как модуль ранжирования изменится позже
+ALPHABET = '0123456789abcdefghijklmnopqrstuvwxyz'
+BASE = len(ALPHABET)
+RANK_WIDTH = 6
+RANK_STEP = BASE ** 3
+
+
+def _from_int(value, width=RANK_WIDTH):
+    chars = []
+    for _ in range(width):
+        value, digit = divmod(value, BASE)
+        chars.append(ALPHABET[digit])
+    return ''.join(reversed(chars)).rstrip('0')
+
+
+def spread_ranks(count):
+    width = RANK_WIDTH
+    while BASE ** width // (count + 1) < RANK_STEP:
+        width += 1
+    step = BASE ** width // (count + 1)
+    return [_from_int((index + 1) * step, width) for index in range(count)]
+
+
+def backfill_ranks(apps, schema_editor):
+    """Ранги колонок в прежнем порядке доски: по сроку (без срока — в конце), затем по созданию."""
+    Task = apps.get_model('tasks', 'Task')
+    db_alias = schema_editor.connection.alias
+
+    status_ids = Task.objects.using(db_alias).order_by().values_list('status_id', flat=True).distinct()
+    for status_id in list(status_ids):
+        tasks = list(
+            Task.objects.using(db_alias).filter(status_id=status_id)
+            .order_by(F('due_date').asc(nulls_last=True), 'created_at', 'id').only('id')
+        )
+        for task, rank in zip(tasks, spread_ranks(len(tasks))):
+            task.rank = rank
+        Task.objects.using(db_alias).bulk_update(tasks, ['rank'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tasks', '0003_time_rollup'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='task',
+            name='rank',
+            field=models.CharField(blank=True, default='', max_length=64, verbose_name='Позиция в колонке'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['status', 'rank'], name='tasks_status_rank_idx'),
+        ),
+        migrations.RunPython(backfill_ranks, migrations.RunPython.noop),
+    ]
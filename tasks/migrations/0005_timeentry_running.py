@@ -0,0 +1,50 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:00
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, F
+from django.utils import timezone
+
+
+def close_extra_timers(apps, schema_editor):
+    """
+    Перед уникальным индексом у каждого пользователя остаётся один запущенный
+    таймер — самый поздний. Более ранние завершаются в момент запуска следующего,
+    их время добавляется в сводку TimeRollup.
+    """
+    TimeEntry = apps.get_model('tasks', 'TimeEntry')
+    TimeRollup = apps.get_model('tasks', 'TimeRollup')
+    db_alias = schema_editor.connection.alias
+
+    running = TimeEntry.objects.using(db_alias).filter(end_time__isnull=True)
+    user_ids = running.order_by().values('user_id').annotate(count=Count('id')).filter(count__gt=1).values_list('user_id', flat=True)
+    for user_id in list(user_ids):
+        entries = list(running.filter(user_id=user_id).order_by('start_time', 'id'))
+        for entry, following in zip(entries, entries[1:]):
+            entry.end_time = max(following.start_time, entry.start_time)
+            entry.duration = entry.end_time - entry.start_time
+            entry.save(update_fields=['end_time', 'duration'])
+
+            day = timezone.localdate(entry.start_time) if timezone.is_aware(entry.start_time) else entry.start_time.date()
+            seconds = int(entry.duration.total_seconds())
+            rows = TimeRollup.objects.using(db_alias).filter(day=day, user_id=user_id, task_id=entry.task_id)
+            if not rows.update(seconds=F('seconds') + seconds, entries=F('entries') + 1):
+                TimeRollup.objects.using(db_alias).create(
+                    day=day, user_id=user_id, task_id=entry.task_id, seconds=seconds, entries=1,
+                )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tasks', '0004_task_rank'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(close_extra_timers, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='timeentry',
+            constraint=models.UniqueConstraint(condition=models.Q(('end_time__isnull', True)), fields=('user',), name='tasks_timeentry_running_uniq'),
+        ),
+    ]
@@ -1,9 +1,12 @@
 # tasks/models.py
 
 from django.db import models
+from django.db.models import Exists, OuterRef
 from django.conf import settings
 from django.utils import timezone
-from django.core.exceptions import ObjectDoesNotExist
+
+from .ranking import RANK_MAX_LENGTH, needs_rebalance, rank_after, rank_rebalancer
+from .statuses import status_registry
 
 # Получаем модель пользователя
 User = settings.AUTH_USER_MODEL
@@ -13,17 +16,9 @@ User = settings.AUTH_USER_MODEL
 # ⚠️ ФУНКЦІЯ ДЛЯ СЕРІАЛІЗАЦІЇ СТАТУСУ ЗА ЗАМОВЧУВАННЯМ
 def get_default_status():
     """Возвращает объект статуса 'К выполнению' для использования в default."""
-    try:
-        # Пытаемся получить объект Status с title='TODO'
-        return Status.objects.get(title='TODO')
-    except ObjectDoesNotExist:
-        # Если статус не найден (например, при первой миграции),
-        # возвращаем None или первый созданный, чтобы избежать сбоя.
-        # В реальной ситуации, если миграция 0001_initial еще не прошла,
-        # этот код будет вызван на следующем шаге.
-        # Для корректной работы в production Status.objects.get() должен быть уверен, что статус существует.
-        # Для начальной миграции Django справится с чистым вызовом.
-        pass
+    # Статус берётся из реестра в памяти (tasks/statuses.py), а не запросом на каждую задачу.
+    # Если статус ещё не создан (например, до начальных данных), возвращаем None.
+    return status_registry.by_title('TODO')
 
 
 # -------------------------------------------------------------
@@ -47,6 +42,27 @@ class Status(models.Model):
         return self.get_title_display()
 
 
+class TaskQuerySet(models.QuerySet):
+    """QuerySet задач с учётом ролей пользователя."""
+
+    def visible_to(self, user):
+        """Администраторы и редакторы видят все задачи, остальные — только назначенные им."""
+        if getattr(user, 'role', None) in ['admin', 'editor']:
+            return self.all()
+        return self.assigned_to_user(user.pk)
+
+    def assigned_to_user(self, user_id):
+        """Задачи исполнителя: EXISTS по уникальному индексу (task, user) связующей таблицы вместо JOIN + DISTINCT."""
+        through = Task.assigned_to.through
+        user_field = Task.assigned_to.field.m2m_reverse_field_name()
+        assignments = through.objects.filter(task_id=OuterRef('pk'), **{user_field: user_id})
+        return self.filter(Exists(assignments))
+
+    def for_board(self):
+        """Связи, которые использует TaskSerializer, — без запросов на каждую задачу."""
+        return self.select_related('status', 'creator').prefetch_related('assigned_to')
+
+
 # 2. Модель задачи
 class Task(models.Model):
     """Основная модель задачи."""
@@ -64,17 +80,49 @@ class Task(models.Model):
                                related_name='tasks', default=get_default_status)
     due_date = models.DateTimeField(null=True, blank=True, verbose_name="Срок выполнения")
     created_at = models.DateTimeField(auto_now_add=True)
+    # Ручной порядок карточки в колонке (см. tasks/ranking.py)
+    rank = models.CharField(max_length=RANK_MAX_LENGTH, blank=True, default='', verbose_name="Позиция в колонке")
+
+    objects = TaskQuerySet.as_manager()
 
     class Meta:
         verbose_name = "Задача"
         verbose_name_plural = "Задачи"
         ordering = ['due_date', 'created_at']
+        indexes = [
+            # Колонка доски и фильтр по статусу с сортировкой по сроку
+            models.Index(fields=['status', 'due_date', 'created_at'], name='tasks_status_due_idx'),
+            # Общий список задач по сроку, фильтры по диапазону сроков и просроченные
+            models.Index(fields=['due_date', 'created_at'], name='tasks_due_created_idx'),
+            # Порядок карточек в колонке доски и поиск соседей при переносе
+            models.Index(fields=['status', 'rank'], name='tasks_status_rank_idx'),
+        ]
 
     def __str__(self):
         return self.title
 
+    def save(self, *args, **kwargs):
+        # Новая карточка встаёт в конец своей колонки
+        if self._state.adding and not self.rank:
+            last = Task.objects.filter(status_id=self.status_id).order_by('-rank').values_list('rank', flat=True).first()
+            self.rank = rank_after(last)
+            if needs_rebalance(self.rank):
+                rank_rebalancer.request(self.status_id)
+        super().save(*args, **kwargs)
+
 
 # 3. Модель отслеживания времени (Time Tracking)
+class TimeEntryQuerySet(models.QuerySet):
+
+    def running(self):
+        """Незавершённые записи (запущенные таймеры)."""
+        return self.filter(end_time__isnull=True)
+
+    def running_for(self, user_id):
+        """Запущенный таймер пользователя: поиск по частичному индексу tasks_timeentry_running_uniq."""
+        return self.running().filter(user_id=user_id)
+
+
 class TimeEntry(models.Model):
     """Модель для фиксации затраченного времени на задачу."""
     task = models.ForeignKey(Task, on_delete=models.CASCADE, related_name='time_entries',
@@ -87,15 +135,62 @@ class TimeEntry(models.Model):
 
     duration = models.DurationField(null=True, blank=True, verbose_name="Длительность")
 
+    objects = TimeEntryQuerySet.as_manager()
+
     class Meta:
         verbose_name = "Учет времени"
         verbose_name_plural = "Учет времени"
+        constraints = [
+            # Не больше одного запущенного таймера на пользователя; индекс содержит только
+            # незавершённые записи и обслуживает поиск активного таймера (tasks/timers.py)
+            models.UniqueConstraint(fields=['user'], condition=models.Q(end_time__isnull=True),
+                                    name='tasks_timeentry_running_uniq'),
+        ]
 
     def __str__(self):
         return f"{self.user.username} - {self.task.title}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Запоминаем вклад записи в сводные таблицы, чтобы при сохранении вычесть старый
+        from .rollups import remember
+        remember(instance)
+        return instance
+
     # Переопределяем метод save для расчета длительности
     def save(self, *args, **kwargs):
         if self.start_time and self.end_time and not self.duration:
             self.duration = self.end_time - self.start_time
-        super().save(*args, **kwargs)
\ No newline at end of file
+        super().save(*args, **kwargs)
+
+
+# 4. Сводная таблица учета времени
+class TimeRollup(models.Model):
+    """
+    Затраченное время за день по пользователю и задаче. Обновляется
+    инкрементально при сохранении/удалении TimeEntry (tasks/rollups.py),
+    пересобирается командой rebuild_time_rollups.
+    """
+    day = models.DateField(verbose_name="День")
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='time_rollups',
+                             verbose_name="Пользователь")
+    task = models.ForeignKey(Task, on_delete=models.CASCADE, related_name='time_rollups',
+                             verbose_name="Задача")
+    seconds = models.BigIntegerField(default=0, verbose_name="Секунд")
+    entries = models.IntegerField(default=0, verbose_name="Записей")
+
+    class Meta:
+        verbose_name = "Сводка времени"
+        verbose_name_plural = "Сводки времени"
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'user', 'task'], name='tasks_rollup_day_user_task_uniq'),
+        ]
+        indexes = [
+            # Отчёты по пользователю и по задаче за диапазон дат
+            models.Index(fields=['user', 'day'], name='tasks_rollup_user_day_idx'),
+            models.Index(fields=['task', 'day'], name='tasks_rollup_task_day_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.day} {self.user_id}/{self.task_id}: {self.seconds} с"
\ No newline at end of file
@@ -0,0 +1,112 @@
+# tasks/pagination.py
+import base64
+import json
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db.models import F, Q
+from rest_framework.exceptions import ValidationError
+
+from .models import Task
+
+
+class TaskKeyset:
+    """
+    Keyset-пагинация задач по упорядочиванию из нескольких полей.
+
+    fields — список (имя поля, по убыванию?, может быть NULL?). Последним
+    всегда добавляется id, поэтому порядок строгий. NULL сортируются в конце
+    независимо от направления, как на доске. Курсор — base64 от JSON со
+    значениями полей последней строки страницы.
+    """
+
+    def __init__(self, model, fields):
+        self.model = model
+        self.fields = list(fields) + [('id', False, False)]
+
+    # --- Сортировка ---
+
+    def order_by(self):
+        expressions = []
+        for name, descending, _ in self.fields:
+            expression = F(name)
+            expressions.append(expression.desc(nulls_last=True) if descending else expression.asc(nulls_last=True))
+        return expressions
+
+    # --- Курсор ---
+
+    def encode(self, obj):
+        values = []
+        for name, _, _ in self.fields:
+            value = getattr(obj, name)
+            values.append(value.isoformat() if hasattr(value, 'isoformat') else value)
+        return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+    def decode(self, cursor):
+        try:
+            values = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+        except (ValueError, UnicodeDecodeError):
+            raise ValidationError({'cursor': 'Некорректный курсор.'})
+        if not isinstance(values, list) or len(values) != len(self.fields):
+            raise ValidationError({'cursor': 'Некорректный курсор.'})
+
+        decoded = []
+        for (name, _, _), value in zip(self.fields, values):
+            if value is not None:
+                try:
+                    value = self.model._meta.get_field(name).to_python(value)
+                except DjangoValidationError:
+                    raise ValidationError({'cursor': 'Некорректный курсор.'})
+            decoded.append(value)
+        return decoded
+
+    def after(self, values):
+        """Условие "строго после курсора" в порядке order_by()."""
+        condition = Q(pk__in=[])
+        equal = Q()
+        for (name, descending, nullable), value in zip(self.fields, values):
+            if value is None:
+                # После NULL (конец порядка) по этому полю идти некуда — только равенство
+                equal &= Q(**{f'{name}__isnull': True})
+                continue
+            beyond = Q(**{f'{name}__lt' if descending else f'{name}__gt': value})
+            if nullable:
+                beyond |= Q(**{f'{name}__isnull': True})
+            condition |= equal & beyond
+            equal &= Q(**{name: value})
+        return condition
+
+    def paginate(self, queryset, cursor=None, limit=50):
+        """Возвращает (rows, next_cursor)."""
+        if cursor:
+            queryset = queryset.filter(self.after(self.decode(cursor)))
+        rows = list(queryset.order_by(*self.order_by())[:limit + 1])
+        next_cursor = self.encode(rows[limit - 1]) if len(rows) > limit else None
+        return rows[:limit], next_cursor
+
+
+def parse_limit(params, default, maximum):
+    """Размер страницы из параметра `limit`: по умолчанию default, не больше maximum."""
+    value = params.get('limit')
+    if value is None:
+        return default
+    try:
+        limit = int(value)
+    except ValueError:
+        raise ValidationError({'limit': 'Ожидается целое число.'})
+    if limit < 1:
+        raise ValidationError({'limit': 'Должно быть больше нуля.'})
+    return min(limit, maximum)
+
+
+# Порядок карточек в колонке доски — ручной, по рангу (индекс status + rank)
+BOARD_ORDERING = TaskKeyset(Task, [('rank', False, False)])
+
+# Допустимые значения `ordering` списка задач; каждому соответствует составной индекс
+TASK_ORDERINGS = {
+    # Сначала ближайший срок, без срока — в конце
+    'due_date': TaskKeyset(Task, [('due_date', False, True), ('created_at', False, False)]),
+    'rank': BOARD_ORDERING,
+    '-due_date': TaskKeyset(Task, [('due_date', True, True), ('created_at', True, False)]),
+    'created_at': TaskKeyset(Task, [('created_at', False, False)]),
+    '-created_at': TaskKeyset(Task, [('created_at', True, False)]),
+}
@@ -0,0 +1,202 @@
+# tasks/ranking.py
+"""
+Ручной порядок карточек в колонке: лексикографический ранг Task.rank.
+
+Ранг — строка из цифр и строчных латинских букв (основание 36), которая
+читается как дробная часть числа: "i" = 18/36, "0i" = 18/36². Сравнение
+строк совпадает с числовым, потому что ранг никогда не заканчивается на "0".
+Между любыми двумя рангами есть третий (rank_between), поэтому перенос
+карточки — это UPDATE одной строки, без перенумерации колонки.
+
+Новые карточки и пересборка колонки используют ранги с шагом RANK_STEP в
+первых RANK_WIDTH разрядах — между соседями остаётся много места. Ранг
+удлиняется, только если карточки раз за разом вставляют в одно и то же
+место; когда длина превышает TASKS_RANK_REBALANCE_LENGTH, колонка
+перенумеровывается в фоне (RankRebalancer).
+"""
+import logging
+import threading
+
+from django.conf import settings
+from django.db import connections, transaction
+
+logger = logging.getLogger(__name__)
+
+ALPHABET = '0123456789abcdefghijklmnopqrstuvwxyz'
+BASE = len(ALPHABET)
+DIGITS = {char: index for index, char in enumerate(ALPHABET)}
+
+RANK_WIDTH = 6
+RANK_STEP = BASE ** 3
+# Максимальная длина ранга в БД (Task.rank); до неё колонка успевает перенумероваться
+RANK_MAX_LENGTH = 64
+
+
+def is_valid_rank(rank):
+    return bool(rank) and rank[-1] != '0' and all(char in DIGITS for char in rank)
+
+
+def _to_int(rank, width=RANK_WIDTH):
+    """Первые width разрядов ранга как целое (недостающие разряды — нули)."""
+    value = 0
+    for index in range(width):
+        value = value * BASE + (DIGITS[rank[index]] if index < len(rank) else 0)
+    return value
+
+
+def _from_int(value, width=RANK_WIDTH):
+    chars = []
+    for _ in range(width):
+        value, digit = divmod(value, BASE)
+        chars.append(ALPHABET[digit])
+    return ''.join(reversed(chars)).rstrip('0')
+
+
+def rank_between(before, after):
+    """
+    Ранг строго между before и after; None — открытая граница (начало или
+    конец колонки). Длина результата — не больше max(len) + 1.
+    """
+    before = before or ''
+    if after is not None and not before < after:
+        raise ValueError(f'Ранги не упорядочены: {before!r} >= {after!r}')
+
+    result = []
+    index = 0
+    while True:
+        if after is not None and index >= len(after):
+            # Общий префикс закончился вместе с after — значит, before >= after
+            raise ValueError(f'Ранги не упорядочены: {before!r} >= {after!r}')
+        low = DIGITS[before[index]] if index < len(before) else 0
+        high = DIGITS[after[index]] if after is not None else BASE
+        if low == high:
+            result.append(ALPHABET[low])
+        else:
+            middle = (low + high) // 2
+            if middle > low:
+                result.append(ALPHABET[middle])
+                return ''.join(result)
+            # Соседние разряды: берём разряд before, дальше верхней границы нет
+            result.append(ALPHABET[low])
+            after = None
+        index += 1
+
+
+def rank_after(rank):
+    """Ранг для карточки в конце колонки после rank (или первой в пустой колонке)."""
+    if not rank:
+        return _from_int(RANK_STEP)
+    value = _to_int(rank) + RANK_STEP
+    if value < BASE ** RANK_WIDTH:
+        return _from_int(value)
+    return rank_between(rank, None)
+
+
+def rank_before(rank):
+    """Ранг для карточки в начале колонки перед rank."""
+    if not rank:
+        return _from_int(RANK_STEP)
+    value = _to_int(rank) - RANK_STEP
+    if value > 0:
+        return _from_int(value)
+    return rank_between(None, rank)
+
+
+def spread_ranks(count):
+    """
+    count возрастающих рангов, равномерно распределённых по пространству
+    ключей, — с зазором не меньше RANK_STEP до соседей и краёв колонки.
+    """
+    width = RANK_WIDTH
+    while BASE ** width // (count + 1) < RANK_STEP:
+        width += 1
+    step = BASE ** width // (count + 1)
+    return [_from_int((index + 1) * step, width) for index in range(count)]
+
+
+def rank_in_column(column, after=None, before=None):
+    """
+    Ранг для карточки в колонке column (QuerySet остальных карточек) между
+    соседями с рангами after (выше) и before (ниже). Если задан только один
+    сосед, второй ищется одним запросом по индексу (status, rank).
+    """
+    if after is None and before is None:
+        return rank_after(column.order_by('-rank').values_list('rank', flat=True).first())
+    if before is None:
+        before = column.filter(rank__gt=after).order_by('rank').values_list('rank', flat=True).first()
+        return rank_between(after, before) if before is not None else rank_after(after)
+    if after is None:
+        after = column.filter(rank__lt=before).order_by('-rank').values_list('rank', flat=True).first()
+        return rank_between(after, before) if after is not None else rank_before(before)
+    return rank_between(after, before)
+
+
+def needs_rebalance(rank):
+    return len(rank) > getattr(settings, 'TASKS_RANK_REBALANCE_LENGTH', 16)
+
+
+class RankRebalancer:
+    """
+    Перенумерация колонок, в которых ранги стали слишком длинными. Запрос
+    обрабатывается после коммита в фоновом потоке через
+    TASKS_RANK_REBALANCE_DELAY секунд (0 — сразу, в том же потоке).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._scheduled = set()
+
+    @property
+    def delay(self):
+        return getattr(settings, 'TASKS_RANK_REBALANCE_DELAY', 1.0)
+
+    def request(self, status_id):
+        transaction.on_commit(lambda: self._schedule(status_id))
+
+    def _schedule(self, status_id):
+        with self._lock:
+            if status_id in self._scheduled:
+                return
+            self._scheduled.add(status_id)
+        if self.delay <= 0:
+            self._run(status_id)
+            return
+        timer = threading.Timer(self.delay, self._run_in_thread, args=(status_id,))
+        timer.daemon = True
+        timer.start()
+
+    def _run_in_thread(self, status_id):
+        try:
+            self._run(status_id)
+        except Exception:
+            logger.exception("Не удалось перенумеровать колонку %s", status_id)
+        finally:
+            connections.close_all()
+
+    def _run(self, status_id):
+        with self._lock:
+            self._scheduled.discard(status_id)
+        self.rebalance(status_id)
+
+    def rebalance(self, status_id):
+        """Равномерно перенумеровывает колонку в текущем порядке. Возвращает число задач."""
+        from .models import Task
+        from .realtime import board_events
+
+        with transaction.atomic():
+            tasks = list(
+                Task.objects.select_for_update().filter(status_id=status_id)
+                .order_by('rank', 'id').only('id', 'rank')
+            )
+            for task, rank in zip(tasks, spread_ranks(len(tasks))):
+                task.rank = rank
+            Task.objects.bulk_update(tasks, ['rank'], batch_size=1000)
+            board_events.changed(task.id for task in tasks)
+        return len(tasks)
+
+    def clear(self):
+        with self._lock:
+            self._scheduled.clear()
+
+
+rank_rebalancer = RankRebalancer()
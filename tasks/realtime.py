@@ -0,0 +1,164 @@
+# tasks/realtime.py
+"""
+Живые обновления доски задач через channel layer (ws/board/).
+
+Изменения задач (создание, правка, смена статуса, назначения, удаление)
+регистрируются после коммита транзакции и накапливаются в буфере процесса.
+Раз в TASKS_BOARD_EVENTS_WINDOW секунд буфер сбрасывается: состояние всех
+изменённых задач читается двумя запросами, и в каждую группу уходит один
+кадр со всеми её изменениями — несколько правок одной задачи в окне
+сливаются в одну запись с актуальным состоянием.
+
+Группы повторяют правила видимости TaskQuerySet.visible_to:
+
+* board_managers — администраторы и редакторы, видят все задачи;
+* board_user_{id} — остальные пользователи, только назначенные им задачи.
+  Пользователь, которого сняли с задачи, получает её ID в 'removed'.
+
+Кадр: {'type': 'board', 'tasks': [{id, title, status_id, due_date,
+creator_id, rank, assigned_to}], 'removed': [id, ...]}.
+"""
+import logging
+import threading
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import connections, transaction
+
+from chat.encoding import dumps
+
+from .models import Task
+
+logger = logging.getLogger(__name__)
+
+MANAGERS_GROUP = 'board_managers'
+
+
+def board_user_group(user_id):
+    return f'board_user_{user_id}'
+
+
+def board_groups_for(user):
+    """Группы, на которые подписывается сокет доски пользователя."""
+    if getattr(user, 'role', None) in ['admin', 'editor']:
+        return [MANAGERS_GROUP]
+    return [board_user_group(user.id)]
+
+
+def task_assignee_ids(task_ids):
+    """{task_id: set(user_id)} одним запросом к связующей таблице."""
+    through = Task.assigned_to.through
+    user_field = f'{Task.assigned_to.field.m2m_reverse_field_name()}_id'
+    assignees = {task_id: set() for task_id in task_ids}
+    for task_id, user_id in through.objects.filter(task_id__in=task_ids).values_list('task_id', user_field):
+        assignees[task_id].add(user_id)
+    return assignees
+
+
+class BoardEventBuffer:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # task_id -> ID исполнителей до изменения (им нужно сообщить о снятии)
+        self._pending = {}
+        self._timer = None
+
+    @property
+    def window(self):
+        return getattr(settings, 'TASKS_BOARD_EVENTS_WINDOW', 0.25)
+
+    # --- Регистрация изменений ---
+
+    def changed(self, task_ids, previous_assignees=()):
+        """
+        Отмечает задачи изменёнными (или удалёнными) после коммита текущей
+        транзакции. previous_assignees — исполнители до изменения.
+        """
+        task_ids = list(task_ids)
+        previous_assignees = set(previous_assignees)
+        if task_ids:
+            transaction.on_commit(lambda: self._add(task_ids, previous_assignees))
+
+    def _add(self, task_ids, previous_assignees):
+        with self._lock:
+            for task_id in task_ids:
+                self._pending.setdefault(task_id, set()).update(previous_assignees)
+            window = self.window
+            if window > 0 and self._timer is None:
+                self._timer = threading.Timer(window, self._flush_in_thread)
+                self._timer.daemon = True
+                self._timer.start()
+        if window <= 0:
+            self.flush()
+
+    # --- Рассылка ---
+
+    def _flush_in_thread(self):
+        try:
+            self.flush()
+        except Exception:
+            logger.exception("Не удалось разослать изменения доски")
+        finally:
+            # Поток таймера открывает собственные соединения с БД
+            connections.close_all()
+
+    def flush(self):
+        """Рассылает накопленные изменения. Возвращает количество задач."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            timer, self._timer = self._timer, None
+        if timer is not None:
+            # Сброс вызван раньше таймера — таймер больше не нужен
+            timer.cancel()
+        if not pending:
+            return 0
+
+        frames = self.build_frames(pending)
+        channel_layer = get_channel_layer()
+        for group_name, frame in frames.items():
+            async_to_sync(channel_layer.group_send)(group_name, {'type': 'board.update', 'frame': frame})
+        return len(pending)
+
+    def build_frames(self, pending):
+        """{группа: кадр} для изменений {task_id: прежние исполнители}."""
+        task_ids = list(pending)
+        tasks = {
+            row['id']: row for row in Task.objects.filter(id__in=task_ids).order_by().values(
+                'id', 'title', 'status_id', 'due_date', 'creator_id', 'rank',
+            )
+        }
+        assignees = task_assignee_ids(list(tasks))
+
+        changes = {}
+        for task_id, previous in pending.items():
+            task = tasks.get(task_id)
+            current = assignees.get(task_id, set())
+            if task is None:
+                changes.setdefault(MANAGERS_GROUP, ([], []))[1].append(task_id)
+            else:
+                row = {
+                    **task,
+                    'due_date': task['due_date'].isoformat() if task['due_date'] else None,
+                    'assigned_to': sorted(current),
+                }
+                changes.setdefault(MANAGERS_GROUP, ([], []))[0].append(row)
+                for user_id in current:
+                    changes.setdefault(board_user_group(user_id), ([], []))[0].append(row)
+            for user_id in previous - current:
+                changes.setdefault(board_user_group(user_id), ([], []))[1].append(task_id)
+
+        return {
+            group_name: dumps({'type': 'board', 'tasks': rows, 'removed': removed})
+            for group_name, (rows, removed) in changes.items()
+        }
+
+    def clear(self):
+        with self._lock:
+            self._pending.clear()
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+
+board_events = BoardEventBuffer()
@@ -0,0 +1,148 @@
+# tasks/rollups.py
+"""
+Сводные таблицы учета времени (TimeRollup): секунды и количество записей
+за день по паре (пользователь, задача).
+
+Каждая завершённая запись TimeEntry (с duration) относится ко дню своего
+start_time в часовом поясе проекта. Сигналы (tasks/signals.py) вычитают
+прежний вклад записи — он запоминается при загрузке из БД (TimeEntry.from_db)
+— и добавляют новый одним UPDATE ... SET seconds = seconds + N. Массовые
+QuerySet.update()/delete() сигналов не отправляют: после них сводку нужно
+пересобрать командой rebuild_time_rollups.
+
+Отчёт (GET /api/tasks/reports/time/) читает только сводку, поэтому его
+время зависит от числа дней в диапазоне, а не от числа исходных записей.
+"""
+from datetime import datetime, time
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate, TruncMonth, TruncWeek
+from django.utils import timezone
+
+from .models import TimeEntry, TimeRollup
+
+
+def contribution(entry):
+    """((день, user_id, task_id), секунды) для завершённой записи или None."""
+    if not entry.duration or not entry.start_time:
+        return None
+    day = timezone.localdate(entry.start_time) if timezone.is_aware(entry.start_time) else entry.start_time.date()
+    return (day, entry.user_id, entry.task_id), int(entry.duration.total_seconds())
+
+
+def remember(entry):
+    entry._rollup = contribution(entry)
+
+
+def apply(key, seconds, entries):
+    """Добавляет к строке сводки seconds и entries (отрицательные — вычитают)."""
+    day, user_id, task_id = key
+    rows = TimeRollup.objects.filter(day=day, user_id=user_id, task_id=task_id)
+    if rows.update(seconds=F('seconds') + seconds, entries=F('entries') + entries):
+        if entries < 0:
+            rows.filter(entries__lte=0).delete()
+        return
+    if entries < 0:
+        # Строки нет (например, задача удаляется каскадом) — вычитать нечего
+        return
+    try:
+        with transaction.atomic():
+            TimeRollup.objects.create(day=day, user_id=user_id, task_id=task_id, seconds=seconds, entries=entries)
+    except IntegrityError:
+        # Строку за этот день параллельно создал другой запрос
+        rows.update(seconds=F('seconds') + seconds, entries=F('entries') + entries)
+
+
+def entry_saved(entry):
+    previous = getattr(entry, '_rollup', None)
+    current = contribution(entry)
+    if previous == current:
+        return
+    if previous is not None and current is not None and previous[0] == current[0]:
+        apply(current[0], current[1] - previous[1], 0)
+    else:
+        if previous is not None:
+            apply(previous[0], -previous[1], -1)
+        if current is not None:
+            apply(current[0], current[1], 1)
+    entry._rollup = current
+
+
+def entry_deleted(entry):
+    previous = getattr(entry, '_rollup', None)
+    if previous is not None:
+        apply(previous[0], -previous[1], -1)
+        entry._rollup = None
+
+
+def rebuild(since=None, batch_size=1000):
+    """
+    Пересобирает сводку из TimeEntry (с дня since включительно или целиком)
+    агрегирующим запросом и bulk_create. Возвращает количество строк сводки.
+    """
+    entries = TimeEntry.objects.filter(duration__isnull=False)
+    rollups = TimeRollup.objects.all()
+    if since is not None:
+        entries = entries.filter(start_time__gte=timezone.make_aware(datetime.combine(since, time.min)))
+        rollups = rollups.filter(day__gte=since)
+
+    grouped = (
+        entries.annotate(day=TruncDate('start_time'))
+        .values('day', 'user_id', 'task_id')
+        .annotate(total=Sum('duration'), count=Count('id'))
+        .order_by()
+    )
+
+    created = 0
+    with transaction.atomic():
+        rollups.delete()
+        batch = []
+        for row in grouped.iterator(chunk_size=batch_size):
+            batch.append(TimeRollup(
+                day=row['day'], user_id=row['user_id'], task_id=row['task_id'],
+                seconds=int(row['total'].total_seconds()), entries=row['count'],
+            ))
+            if len(batch) >= batch_size:
+                TimeRollup.objects.bulk_create(batch)
+                created += len(batch)
+                batch = []
+        if batch:
+            TimeRollup.objects.bulk_create(batch)
+            created += len(batch)
+    return created
+
+
+# Допустимые измерения группировки отчёта: поле ключа и подпись
+GROUP_FIELDS = {
+    'user': ('user_id', 'username', 'user__username'),
+    'task': ('task_id', 'task_title', 'task__title'),
+}
+PERIODS = {
+    'day': None,
+    'week': TruncWeek,
+    'month': TruncMonth,
+}
+
+
+def time_report(rollups, group_by):
+    """
+    Сумма секунд и записей по измерениям group_by (user, task и не больше
+    одного периода: day, week или month) одним GROUP BY по сводке.
+    """
+    keys = []
+    labels = {}
+    for name in group_by:
+        if name in GROUP_FIELDS:
+            key, label, source = GROUP_FIELDS[name]
+            keys.append(key)
+            labels[label] = F(source)
+        else:
+            trunc = PERIODS[name]
+            labels['period'] = trunc('day') if trunc else F('day')
+            keys.append('period')
+    return list(
+        rollups.annotate(**labels).values(*dict.fromkeys(keys + list(labels)))
+        .annotate(total_seconds=Sum('seconds'), total_entries=Sum('entries'))
+        .order_by(*keys)
+    )
@@ -0,0 +1,9 @@
+# tasks/routing.py
+from django.urls import re_path
+
+from . import consumers
+
+websocket_urlpatterns = [
+    # Живые обновления доски задач
+    re_path(r'ws/board/$', consumers.BoardConsumer.as_asgi()),
+]
@@ -1,5 +1,7 @@
 from rest_framework import serializers
 from .models import Task, Status, TimeEntry
+from .realtime import board_events
+from .statuses import status_registry
 from django.contrib.auth import get_user_model
 
 # Получаем модель пользователя
@@ -24,6 +26,29 @@ class UserAssignedSerializer(serializers.ModelSerializer):
         fields = ['id', 'username']
 
 
+class StatusRegistryField(serializers.RelatedField):
+    """ID статуса (для записи), проверяемый по реестру статусов без запроса к БД."""
+    default_error_messages = {
+        'does_not_exist': 'Недопустимый первичный ключ "{pk_value}" - объект не существует.',
+        'incorrect_type': 'Некорректный тип. Ожидалось значение первичного ключа, получено {data_type}.',
+    }
+
+    def __init__(self, **kwargs):
+        kwargs.setdefault('queryset', Status.objects.all())
+        super().__init__(**kwargs)
+
+    def to_internal_value(self, data):
+        if isinstance(data, bool) or not isinstance(data, (int, str)):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        status = status_registry.get(data)
+        if status is None:
+            self.fail('does_not_exist', pk_value=data)
+        return status
+
+    def to_representation(self, value):
+        return value.pk
+
+
 # --- Основные сериализаторы ---
 
 class TaskSerializer(serializers.ModelSerializer):
@@ -31,9 +56,7 @@ class TaskSerializer(serializers.ModelSerializer):
     status = StatusSerializer(read_only=True)
 
     # 2. Поле для ЗАПИСИ статуса (только ID, для PATCH/PUT)
-    status_id = serializers.PrimaryKeyRelatedField(
-        queryset=Status.objects.all(), source='status', write_only=True, required=False
-    )
+    status_id = StatusRegistryField(source='status', write_only=True, required=False)
 
     # 3. Поле для ЧТЕНИЯ назначенных пользователей (список объектов)
     assigned_to = UserAssignedSerializer(many=True, read_only=True)
@@ -50,11 +73,12 @@ class TaskSerializer(serializers.ModelSerializer):
         model = Task
         fields = [
             'id', 'title', 'description', 'creator', 'status',
-            'status_id', 'due_date', 'created_at',
+            'status_id', 'due_date', 'created_at', 'rank',
             'assigned_to', 'assigned_to_ids'  # 'assigned_to_ids' используется при POST
         ]
         # Указываем, какие поля не могут быть изменены пользователем (кроме создателя, который устанавливается автоматически)
-        read_only_fields = ['created_at']
+        # Позиция в колонке меняется только действием move
+        read_only_fields = ['created_at', 'rank']
 
     def create(self, validated_data):
         """Переопределяем создание для обработки ManyToManyField (assigned_to_ids)."""
@@ -72,9 +96,25 @@ class TaskSerializer(serializers.ModelSerializer):
         if assigned_to_ids is not None:
             task.assigned_to.set(assigned_to_ids)
 
+        # 5. Сообщаем доскам о новой задаче (после коммита)
+        board_events.changed([task.id])
+
         return task
 
 
+class BulkTaskSerializer(serializers.Serializer):
+    """
+    Элемент пакетной операции над задачами (tasks/bulk.py). Проверяется без
+    запросов к БД: статус — по реестру, исполнители — одним запросом на весь пакет.
+    """
+    id = serializers.IntegerField(required=False)
+    title = serializers.CharField(max_length=255)
+    description = serializers.CharField(required=False, allow_blank=True)
+    status_id = StatusRegistryField(source='status', required=False)
+    due_date = serializers.DateTimeField(required=False, allow_null=True)
+    assigned_to_ids = serializers.ListField(child=serializers.IntegerField(), required=False)
+
+
 # -------------------- 3. Модель отслеживания времени --------------------
 
 class TimeEntrySerializer(serializers.ModelSerializer):
@@ -84,4 +124,24 @@ class TimeEntrySerializer(serializers.ModelSerializer):
         model = TimeEntry
         # 'task' - ID задачи, на которую трекается время
         fields = ['id', 'task', 'user', 'start_time', 'end_time', 'duration']
-        read_only_fields = ['user', 'duration']
\ No newline at end of file
+        read_only_fields = ['user', 'duration']
+
+
+class TimerStartSerializer(serializers.Serializer):
+    """
+    Запуск таймера (POST /api/tasks/time_entries/start/): задача `task` и
+    `replace` — остановить уже запущенный таймер (иначе запуск отклоняется).
+    """
+    task = serializers.PrimaryKeyRelatedField(queryset=Task.objects.all())
+    replace = serializers.BooleanField(default=False)
+
+
+class TaskMoveSerializer(serializers.Serializer):
+    """
+    Перенос карточки (POST /api/tasks/tasks/{id}/move/): колонка `status_id`
+    (по умолчанию текущая) и соседи в ней — `after_id` (карточка выше) и/или
+    `before_id` (карточка ниже). Без соседей карточка уходит в конец колонки.
+    """
+    status_id = StatusRegistryField(source='status', required=False)
+    after_id = serializers.IntegerField(required=False, allow_null=True)
+    before_id = serializers.IntegerField(required=False, allow_null=True)
@@ -0,0 +1,28 @@
+# tasks/signals.py
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import rollups
+from .models import Status, TimeEntry
+from .statuses import status_registry
+
+
+@receiver(post_save, sender=Status)
+@receiver(post_delete, sender=Status)
+def invalidate_status_registry(sender, **kwargs):
+    """Сбрасывает реестр статусов сразу и ещё раз после коммита транзакции."""
+    status_registry.invalidate()
+    transaction.on_commit(status_registry.invalidate)
+
+
+@receiver(post_save, sender=TimeEntry)
+def update_time_rollup(sender, instance, raw=False, **kwargs):
+    """Переносит изменение записи времени в сводную таблицу."""
+    if not raw:
+        rollups.entry_saved(instance)
+
+
+@receiver(post_delete, sender=TimeEntry)
+def remove_time_rollup(sender, instance, **kwargs):
+    rollups.entry_deleted(instance)
@@ -0,0 +1,78 @@
+# tasks/statuses.py
+"""
+Реестр статусов задач в памяти процесса.
+
+Статусов единицы, и меняются они крайне редко, а нужны почти везде: статус
+по умолчанию для каждой новой задачи, проверка status_id в сериализаторе,
+список колонок доски. Реестр загружает таблицу одним запросом и держит её
+до изменения Status (сигналы в tasks/signals.py) или не дольше
+TASKS_STATUS_REGISTRY_TTL секунд — так другие процессы тоже увидят изменения.
+
+version — хеш содержимого таблицы, одинаковый во всех процессах; из него
+строится ETag списка статусов.
+"""
+import hashlib
+import threading
+import time
+
+from django.conf import settings
+
+
+class StatusRegistry:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshot = None
+
+    @property
+    def ttl(self):
+        return getattr(settings, 'TASKS_STATUS_REGISTRY_TTL', 300)
+
+    def _load(self):
+        from .models import Status
+
+        statuses = list(Status.objects.order_by('order', 'id'))
+        digest = hashlib.sha1(
+            repr([(status.id, status.title, status.order) for status in statuses]).encode()
+        ).hexdigest()[:16]
+        return {
+            'expires': time.monotonic() + self.ttl,
+            'ordered': statuses,
+            'by_id': {status.id: status for status in statuses},
+            'by_title': {status.title: status for status in statuses},
+            'version': digest,
+        }
+
+    def _get(self):
+        snapshot = self._snapshot
+        if snapshot is None or snapshot['expires'] <= time.monotonic():
+            snapshot = self._load()
+            with self._lock:
+                self._snapshot = snapshot
+        return snapshot
+
+    # --- Публичный API ---
+
+    def all(self):
+        """Статусы в порядке колонок доски."""
+        return list(self._get()['ordered'])
+
+    def get(self, pk):
+        try:
+            return self._get()['by_id'].get(int(pk))
+        except (TypeError, ValueError):
+            return None
+
+    def by_title(self, title):
+        return self._get()['by_title'].get(title)
+
+    @property
+    def version(self):
+        return self._get()['version']
+
+    def invalidate(self):
+        with self._lock:
+            self._snapshot = None
+
+
+status_registry = StatusRegistry()
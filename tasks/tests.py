@@ -1,3 +1,676 @@
-from django.test import TestCase
+from datetime import timedelta
+from io import StringIO
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+from django.test import TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient, APITestCase
+
+from accounts.middleware import TokenAuthMiddlewareStack
+
+from .models import Status, Task, TimeEntry, TimeRollup
+from .ranking import rank_between, spread_ranks
+from .realtime import board_events
+from .routing import websocket_urlpatterns
+from .statuses import status_registry
+
+User = get_user_model()
+
+
+class BoardTests(APITestCase):
+    """Доска задач: колонки по статусам за постоянное количество запросов."""
+
+    def setUp(self):
+        status_registry.invalidate()
+        self.admin = User.objects.create_user(username='admin', password='pass', role='admin')
+        self.member = User.objects.create_user(username='member', password='pass')
+        self.todo = Status.objects.create(title='TODO', order=0)
+        self.done = Status.objects.create(title='DONE', order=2)
+        self.progress = Status.objects.create(title='IN_PROGRESS', order=1)
+
+        now = timezone.now()
+        self.todo_tasks = []
+        for i in range(5):
+            # Задачи без срока идут в конце колонки
+            due_date = now + timedelta(days=i) if i % 2 == 0 else None
+            task = Task.objects.create(title=f'todo {i}', status=self.todo, creator=self.admin, due_date=due_date)
+            task.assigned_to.set([self.admin, self.member] if i < 2 else [self.admin])
+            self.todo_tasks.append(task)
+        Task.objects.create(title='done', status=self.done, creator=self.admin)
+
+    def board(self, user, **params):
+        self.client.force_authenticate(user)
+        response = self.client.get('/api/tasks/board/', params)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_columns_in_order_with_constant_queries(self):
+        status_registry.all()
+        # Задачи всех колонок и исполнители; статусы — из реестра
+        with self.assertNumQueries(2):
+            data = self.board(self.admin)
+
+        self.assertEqual([c['status']['title'] for c in data['columns']], ['TODO', 'IN_PROGRESS', 'DONE'])
+        todo = data['columns'][0]
+        self.assertEqual(len(todo['tasks']), 5)
+        # Ручной порядок: новые карточки встают в конец колонки
+        self.assertEqual(
+            [t['title'] for t in todo['tasks']],
+            ['todo 0', 'todo 1', 'todo 2', 'todo 3', 'todo 4'],
+        )
+        self.assertEqual(data['columns'][1]['tasks'], [])
+        self.assertEqual(len(todo['tasks'][0]['assigned_to']), 2)
+
+    def test_column_limit_and_load_more(self):
+        data = self.board(self.admin, limit=2)
+        todo = data['columns'][0]
+        seen = [t['id'] for t in todo['tasks']]
+        cursor = todo['next_cursor']
+        self.assertIsNotNone(cursor)
+        self.assertIsNone(data['columns'][2]['next_cursor'])
+
+        while cursor:
+            column = self.board(self.admin, limit=2, status=self.todo.id, cursor=cursor)['columns'][0]
+            seen += [t['id'] for t in column['tasks']]
+            cursor = column['next_cursor']
+
+        expected = Task.objects.filter(status=self.todo).order_by('rank', 'id')
+        self.assertEqual(seen, list(expected.values_list('id', flat=True)))
+
+    def test_status_added_by_other_process_reloads_registry(self):
+        status_registry.all()
+        # bulk_create не шлёт сигналов — как статус, созданный в другом процессе
+        review, = Status.objects.bulk_create([Status(title='REVIEW', order=3)])
+        task = Task.objects.create(title='review', status=review, creator=self.admin)
+
+        data = self.board(self.admin)
+        self.assertEqual(data['columns'][-1]['status']['title'], 'REVIEW')
+        self.assertEqual([t['id'] for t in data['columns'][-1]['tasks']], [task.id])
+
+        status_registry.invalidate()
+        status_registry.all()
+        Status.objects.bulk_create([Status(title='ARCHIVE', order=4)])
+        archive = Status.objects.get(title='ARCHIVE')
+        self.assertEqual(self.board(self.admin, status=archive.id)['columns'][0]['tasks'], [])
+
+    def test_member_sees_only_assigned_tasks(self):
+        data = self.board(self.member)
+        self.assertEqual(
+            [t['id'] for t in data['columns'][0]['tasks']],
+            [self.todo_tasks[0].id, self.todo_tasks[1].id],
+        )
+        self.assertEqual(data['columns'][2]['tasks'], [])
+
+    def test_invalid_parameters(self):
+        self.client.force_authenticate(self.admin)
+        self.assertEqual(self.client.get('/api/tasks/board/', {'limit': 0}).status_code, 400)
+        self.assertEqual(self.client.get('/api/tasks/board/', {'status': 999}).status_code, 400)
+        self.assertEqual(
+            self.client.get('/api/tasks/board/', {'status': self.todo.id, 'cursor': 'garbage'}).status_code, 400,
+        )
+
+
+class StatusRegistryTests(APITestCase):
+    """Статусы читаются из реестра в памяти и сбрасываются при изменении."""
+
+    def setUp(self):
+        status_registry.invalidate()
+        self.editor = User.objects.create_user(username='editor', password='pass', role='editor')
+        self.client.force_authenticate(self.editor)
+        self.todo = Status.objects.create(title='TODO', order=0)
+        self.done = Status.objects.create(title='DONE', order=1)
+
+    def test_default_status_and_validation_without_queries(self):
+        status_registry.all()
+        with self.assertNumQueries(0):
+            self.assertEqual(Task(title='new').status_id, self.todo.id)
+
+        response = self.client.post('/api/tasks/tasks/', {'title': 'x', 'status_id': 999}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('status_id', response.data)
+
+        response = self.client.post('/api/tasks/tasks/', {'title': 'x', 'status_id': self.done.id}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['status']['title'], 'DONE')
+
+    def test_list_etag_follows_registry_version(self):
+        response = self.client.get('/api/tasks/statuses/')
+        self.assertEqual([s['title'] for s in response.data], ['TODO', 'DONE'])
+        etag = response['ETag']
+
+        with self.assertNumQueries(0):
+            cached = self.client.get('/api/tasks/statuses/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(cached.status_code, 304)
+        # Каждый тег сравнивается целиком; слабый тег с той же версией тоже совпадает
+        weak = self.client.get('/api/tasks/statuses/', HTTP_IF_NONE_MATCH=f'"x", W/{etag}')
+        self.assertEqual(weak.status_code, 304)
+        embedded = self.client.get('/api/tasks/statuses/', HTTP_IF_NONE_MATCH=f'{etag}-gzip')
+        self.assertEqual(embedded.status_code, 200)
+
+        # Сохранение статуса сбрасывает реестр — меняются и список, и ETag
+        self.done.order = -1
+        self.done.save()
+        response = self.client.get('/api/tasks/statuses/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual([s['title'] for s in response.data], ['DONE', 'TODO'])
+
+        done_id = self.done.pk
+        self.done.delete()
+        self.assertIsNone(status_registry.get(done_id))
+
+
+class TaskListTests(APITestCase):
+    """Список задач: keyset-страницы, серверные фильтры и сортировка."""
+
+    def setUp(self):
+        status_registry.invalidate()
+        self.admin = User.objects.create_user(username='admin', password='pass', role='admin')
+        self.member = User.objects.create_user(username='member', password='pass')
+        self.todo = Status.objects.create(title='TODO', order=0)
+        self.done = Status.objects.create(title='DONE', order=1)
+
+        now = timezone.now()
+        self.late = Task.objects.create(title='late', status=self.todo, creator=self.admin, due_date=now - timedelta(days=2))
+        self.closed = Task.objects.create(title='closed', status=self.done, creator=self.admin, due_date=now - timedelta(days=1))
+        self.soon = Task.objects.create(title='soon', status=self.todo, creator=self.member, due_date=now + timedelta(days=1))
+        self.later = Task.objects.create(title='later', status=self.todo, creator=self.admin, due_date=now + timedelta(days=5))
+        self.someday = Task.objects.create(title='someday', status=self.done, creator=self.admin)
+        for task in (self.late, self.soon, self.someday):
+            task.assigned_to.set([self.member, self.admin])
+        self.later.assigned_to.set([self.admin])
+
+    def titles(self, user, **params):
+        self.client.force_authenticate(user)
+        response = self.client.get('/api/tasks/tasks/', params)
+        self.assertEqual(response.status_code, 200, response.data)
+        return [task['title'] for task in response.data['results']]
+
+    def test_cursor_pages_cover_list_in_order(self):
+        self.client.force_authenticate(self.admin)
+        seen, cursor = [], None
+        while True:
+            params = {'limit': 2, **({'cursor': cursor} if cursor else {})}
+            data = self.client.get('/api/tasks/tasks/', params).data
+            seen += [task['title'] for task in data['results']]
+            cursor = data['next_cursor']
+            if not cursor:
+                break
+        self.assertEqual(seen, ['late', 'closed', 'soon', 'later', 'someday'])
+
+        self.assertEqual(
+            self.titles(self.admin, ordering='-due_date'), ['later', 'soon', 'closed', 'late', 'someday'],
+        )
+        self.assertEqual(self.titles(self.admin, ordering='-created_at')[0], 'someday')
+
+    def test_filters(self):
+        self.assertEqual(self.titles(self.admin, status=self.done.id), ['closed', 'someday'])
+        self.assertEqual(self.titles(self.admin, assigned_to=self.member.id), ['late', 'soon', 'someday'])
+        self.assertEqual(self.titles(self.member, creator='me'), ['soon'])
+        self.assertEqual(self.titles(self.admin, overdue='true'), ['late'])
+        tomorrow = timezone.localdate(timezone.now() + timedelta(days=1)).isoformat()
+        self.assertEqual(self.titles(self.admin, due_after=tomorrow, due_before=tomorrow), ['soon'])
+
+    def test_member_sees_assigned_without_duplicates(self):
+        # EXISTS вместо JOIN: задача с двумя исполнителями не дублируется
+        self.assertEqual(self.titles(self.member), ['late', 'soon', 'someday'])
+        self.assertEqual(self.titles(self.member, assigned_to=self.admin.id), ['late', 'soon', 'someday'])
+
+    def test_invalid_parameters(self):
+        self.client.force_authenticate(self.admin)
+        for params in ({'ordering': 'title'}, {'status': 999}, {'assigned_to': 'x'},
+                       {'due_after': 'yesterday'}, {'overdue': 'maybe'}, {'cursor': 'garbage'}):
+            self.assertEqual(self.client.get('/api/tasks/tasks/', params).status_code, 400, params)
+
+
+class TimeRollupTests(APITestCase):
+    """Сводка учета времени обновляется инкрементально и обслуживает отчёт."""
+
+    def setUp(self):
+        status_registry.invalidate()
+        Status.objects.create(title='TODO', order=0)
+        self.admin = User.objects.create_user(username='admin', password='pass', role='admin')
+        self.member = User.objects.create_user(username='member', password='pass')
+        self.task = Task.objects.create(title='report', creator=self.admin)
+        self.other = Task.objects.create(title='other', creator=self.admin)
+        self.day = timezone.now().replace(hour=10, minute=0, second=0, microsecond=0) - timedelta(days=3)
+
+    def track(self, user, task, start, minutes):
+        return TimeEntry.objects.create(task=task, user=user, start_time=start, end_time=start + timedelta(minutes=minutes))
+
+    def rollup_state(self):
+        return sorted(TimeRollup.objects.values_list('day', 'user_id', 'task_id', 'seconds', 'entries'))
+
+    def test_incremental_updates_match_rebuild(self):
+        entry = self.track(self.member, self.task, self.day, 30)
+        self.track(self.member, self.task, self.day + timedelta(hours=2), 15)
+        self.track(self.admin, self.other, self.day + timedelta(days=1), 60)
+        self.assertEqual(
+            TimeRollup.objects.get(user=self.member, task=self.task).seconds, 45 * 60,
+        )
+
+        # Перенос записи на другой день и удаление — вычитается прежний вклад
+        entry = TimeEntry.objects.get(pk=entry.pk)
+        entry.start_time -= timedelta(days=1)
+        entry.end_time -= timedelta(days=1)
+        entry.save()
+        TimeEntry.objects.get(user=self.admin).delete()
+        # Незавершённый таймер в сводку не попадает
+        TimeEntry.objects.create(task=self.task, user=self.member, start_time=self.day)
+
+        incremental = self.rollup_state()
+        self.assertEqual(len(incremental), 2)
+        self.assertFalse(TimeRollup.objects.filter(user=self.admin).exists())
+
+        TimeRollup.objects.all().delete()
+        call_command('rebuild_time_rollups', stdout=StringIO())
+        self.assertEqual(self.rollup_state(), incremental)
+
+    def test_report_grouping_and_visibility(self):
+        self.track(self.member, self.task, self.day, 30)
+        self.track(self.member, self.other, self.day, 10)
+        self.track(self.admin, self.task, self.day, 20)
+
+        self.client.force_authenticate(self.admin)
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/tasks/reports/time/', {'group_by': 'user'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [(row['username'], row['total_seconds']) for row in response.data['results']],
+            [('admin', 20 * 60), ('member', 40 * 60)],
+        )
+
+        response = self.client.get('/api/tasks/reports/time/', {'group_by': 'task,day'})
+        self.assertEqual(
+            [(row['task_title'], row['period'], row['total_seconds']) for row in response.data['results']],
+            [('report', timezone.localdate(self.day), 50 * 60), ('other', timezone.localdate(self.day), 10 * 60)],
+        )
+
+        # Обычный пользователь видит только своё время
+        self.client.force_authenticate(self.member)
+        response = self.client.get('/api/tasks/reports/time/', {'group_by': 'week'})
+        self.assertEqual(response.data['total_seconds'], 40 * 60)
+        response = self.client.get('/api/tasks/reports/time/', {'user': self.admin.id})
+        self.assertEqual(response.status_code, 403)
+
+        for params in ({'group_by': 'day,week'}, {'group_by': 'status'}, {'date_from': 'x'},
+                       {'date_from': '2020-01-01', 'date_to': '2024-01-01'}):
+            self.assertEqual(self.client.get('/api/tasks/reports/time/', params).status_code, 400, params)
+
+
+class BulkTaskTests(APITestCase):
+    """Пакетные операции: проверка всего пакета и запись в одной транзакции."""
+
+    def setUp(self):
+        status_registry.invalidate()
+        self.todo = Status.objects.create(title='TODO', order=0)
+        self.done = Status.objects.create(title='DONE', order=1)
+        self.admin = User.objects.create_user(username='admin', password='pass', role='admin')
+        self.member = User.objects.create_user(username='member', password='pass')
+        self.other = User.objects.create_user(username='other', password='pass')
+        self.tasks = [Task.objects.create(title=f'task {i}', creator=self.admin) for i in range(4)]
+        for task in self.tasks[:2]:
+            task.assigned_to.set([self.member])
+        status_registry.all()
+
+    def test_bulk_create_with_assignments(self):
+        self.client.force_authenticate(self.admin)
+        payload = {'tasks': [
+            {'title': f'new {i}', 'status_id': self.done.id, 'assigned_to_ids': [self.member.id, self.other.id]}
+            for i in range(20)
+        ]}
+        # Проверка исполнителей, блокировка колонок и их последние ранги, вставка задач
+        # и назначений (+ транзакция)
+        with self.assertNumQueries(7):
+            response = self.client.post('/api/tasks/tasks/bulk/', payload, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['count'], 20)
+        created = Task.objects.filter(id__in=response.data['ids'])
+        self.assertEqual(created.filter(status=self.done, creator=self.admin).count(), 20)
+        self.assertEqual(Task.assigned_to.through.objects.filter(task__in=created).count(), 40)
+
+        self.client.force_authenticate(self.member)
+        self.assertEqual(self.client.post('/api/tasks/tasks/bulk/', payload, format='json').status_code, 403)
+
+    def test_invalid_item_rejects_whole_batch(self):
+        self.client.force_authenticate(self.admin)
+        payload = {'tasks': [{'title': 'ok'}, {'status_id': 999}, {'title': 'x', 'assigned_to_ids': [12345]}]}
+        response = self.client.post('/api/tasks/tasks/bulk/', payload, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([error['index'] for error in response.data['errors']], [1])
+
+        response = self.client.post('/api/tasks/tasks/bulk/', {'tasks': payload['tasks'][2:]}, format='json')
+        self.assertEqual(response.data['errors'][0]['index'], 0)
+        self.assertEqual(Task.objects.count(), 4)
+
+    def test_bulk_update_checks_assignment_once(self):
+        self.client.force_authenticate(self.member)
+        payload = {'tasks': [{'id': task.id, 'title': f'renamed {task.id}'} for task in self.tasks[:2]]}
+        response = self.client.patch('/api/tasks/tasks/bulk/', payload, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Task.objects.filter(title__startswith='renamed').count(), 2)
+
+        # Смена статуса в пакете — карточки в конец новой колонки
+        existing = Task.objects.create(title='done', status=self.done, creator=self.admin)
+        moved = {'tasks': [{'id': task.id, 'status_id': self.done.id} for task in self.tasks[:2]]}
+        self.assertEqual(self.client.patch('/api/tasks/tasks/bulk/', moved, format='json').status_code, 200)
+        self.assertEqual(
+            list(Task.objects.filter(status=self.done).order_by('rank').values_list('id', flat=True)),
+            [existing.id, self.tasks[0].id, self.tasks[1].id],
+        )
+
+        # Задача, на которую участник не назначен, блокирует весь пакет
+        payload['tasks'].append({'id': self.tasks[3].id, 'due_date': None})
+        response = self.client.patch('/api/tasks/tasks/bulk/', payload, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['errors'][0]['index'], 2)
+
+    def test_bulk_move_appends_to_target_column(self):
+        self.client.force_authenticate(self.admin)
+        existing = Task.objects.create(title='done', status=self.done, creator=self.admin)
+        ids = [task.id for task in reversed(self.tasks)]
+        # Проверка прав, блокировка колонки, её последний ранг и один UPDATE (+ транзакция)
+        with self.assertNumQueries(6):
+            response = self.client.post('/api/tasks/tasks/bulk/move/', {'ids': ids, 'status_id': self.done.id}, format='json')
+        self.assertEqual(response.status_code, 200)
+        column = list(Task.objects.filter(status=self.done).order_by('rank').values_list('id', 'rank'))
+        self.assertEqual([task_id for task_id, _ in column], [existing.id] + ids)
+        self.assertEqual(len({rank for _, rank in column}), 5)
+
+        self.client.force_authenticate(self.member)
+        response = self.client.post('/api/tasks/tasks/bulk/move/', {'ids': ids, 'status_id': self.todo.id}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Task.objects.filter(status=self.todo).count(), 0)
+
+    def test_bulk_assign_and_unassign(self):
+        self.client.force_authenticate(self.admin)
+        ids = [task.id for task in self.tasks]
+        response = self.client.post(
+            '/api/tasks/tasks/bulk/assign/', {'ids': ids, 'add': [self.other.id], 'remove': [self.member.id]}, format='json',
+        )
+        self.assertEqual(response.status_code, 200)
+        for task in Task.objects.filter(id__in=ids).prefetch_related('assigned_to'):
+            self.assertEqual([user.id for user in task.assigned_to.all()], [self.other.id])
+
+        # Повторное назначение не создаёт дублей
+        response = self.client.post('/api/tasks/tasks/bulk/assign/', {'ids': ids, 'add': [self.other.id]}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Task.assigned_to.through.objects.count(), 4)
+
+
+IN_MEMORY_CHANNEL_LAYERS = {'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}}
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS, TASKS_BOARD_EVENTS_WINDOW=0)
+class BoardUpdatesTests(TransactionTestCase):
+    """Живые обновления доски: изменения задач после коммита с учётом видимости."""
+
+    def setUp(self):
+        status_registry.invalidate()
+        board_events.clear()
+        self.todo = Status.objects.create(title='TODO', order=0)
+        self.done = Status.objects.create(title='DONE', order=1)
+        self.admin = User.objects.create_user(username='admin', password='pass', role='admin')
+        self.member = User.objects.create_user(username='member', password='pass')
+        self.outsider = User.objects.create_user(username='outsider', password='pass')
+        self.tokens = {
+            user.id: Token.objects.create(user=user).key for user in (self.admin, self.member, self.outsider)
+        }
+        self.application = TokenAuthMiddlewareStack(URLRouter(websocket_urlpatterns))
+        async_to_sync(get_channel_layer().flush)()
+
+    def tearDown(self):
+        status_registry.invalidate()
+
+    async def connect(self, user):
+        communicator = WebsocketCommunicator(self.application, f'/ws/board/?token={self.tokens[user.id]}')
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        return communicator
+
+    @database_sync_to_async
+    def api(self, user, method, url, data):
+        client = APIClient()
+        client.force_authenticate(user)
+        return getattr(client, method)(url, data, format='json')
+
+    async def test_task_deltas_follow_visibility(self):
+        manager = await self.connect(self.admin)
+        member = await self.connect(self.member)
+        outsider = await self.connect(self.outsider)
+
+        response = await self.api(self.admin, 'post', '/api/tasks/tasks/', {
+            'title': 'live', 'assigned_to_ids': [self.member.id],
+        })
+        task_id = response.data['id']
+        for communicator in (manager, member):
+            frame = await communicator.receive_json_from()
+            self.assertEqual(frame['type'], 'board')
+            self.assertEqual(frame['tasks'][0]['id'], task_id)
+            self.assertEqual(frame['tasks'][0]['assigned_to'], [self.member.id])
+        self.assertTrue(await outsider.receive_nothing())
+
+        # Снятие исполнителя: участник получает ID задачи в 'removed'
+        await self.api(self.admin, 'post', '/api/tasks/tasks/bulk/assign/', {
+            'ids': [task_id], 'add': [self.outsider.id], 'remove': [self.member.id],
+        })
+        self.assertEqual((await member.receive_json_from())['removed'], [task_id])
+        self.assertEqual((await outsider.receive_json_from())['tasks'][0]['id'], task_id)
+        self.assertEqual((await manager.receive_json_from())['tasks'][0]['assigned_to'], [self.outsider.id])
+
+        await self.api(self.admin, 'delete', f'/api/tasks/tasks/{task_id}/', None)
+        self.assertEqual((await outsider.receive_json_from())['removed'], [task_id])
+        self.assertEqual((await manager.receive_json_from())['removed'], [task_id])
+        self.assertTrue(await member.receive_nothing())
+
+        for communicator in (manager, member, outsider):
+            await communicator.disconnect()
+
+    async def test_changes_within_window_are_coalesced(self):
+        manager = await self.connect(self.admin)
+        with self.settings(TASKS_BOARD_EVENTS_WINDOW=60):
+            response = await self.api(self.admin, 'post', '/api/tasks/tasks/bulk/', {
+                'tasks': [{'title': 'a'}, {'title': 'b'}],
+            })
+            ids = response.data['ids']
+            await self.api(self.admin, 'post', '/api/tasks/tasks/bulk/move/', {'ids': ids, 'status_id': self.done.id})
+            self.assertTrue(await manager.receive_nothing())
+            self.assertEqual(await database_sync_to_async(board_events.flush)(), 2)
+
+        frame = await manager.receive_json_from()
+        self.assertEqual(sorted(task['id'] for task in frame['tasks']), sorted(ids))
+        self.assertEqual({task['status_id'] for task in frame['tasks']}, {self.done.id})
+        self.assertTrue(await manager.receive_nothing())
+
+        await manager.disconnect()
+
+    async def test_anonymous_socket_is_rejected(self):
+        communicator = WebsocketCommunicator(self.application, '/ws/board/')
+        connected, _ = await communicator.connect()
+        self.assertFalse(connected)
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS, TASKS_BOARD_EVENTS_WINDOW=0)
+class TaskRankTests(APITestCase):
+    """Ручной порядок карточек: перенос одной строкой и перенумерация при исчерпании."""
+
+    def setUp(self):
+        status_registry.invalidate()
+        self.todo = Status.objects.create(title='TODO', order=0)
+        self.done = Status.objects.create(title='DONE', order=1)
+        self.admin = User.objects.create_user(username='admin', password='pass', role='admin')
+        self.member = User.objects.create_user(username='member', password='pass')
+        self.tasks = [Task.objects.create(title=f'card {i}', creator=self.admin) for i in range(4)]
+        self.client.force_authenticate(self.admin)
+
+    def column(self, status):
+        return list(Task.objects.filter(status=status).order_by('rank', 'id').values_list('title', flat=True))
+
+    def move(self, task, **data):
+        return self.client.post(f'/api/tasks/tasks/{task.id}/move/', data, format='json')
+
+    def test_rank_between_keeps_order(self):
+        ranks = spread_ranks(3)
+        self.assertEqual(ranks, sorted(ranks))
+        low, high = ranks[0], ranks[1]
+        for _ in range(50):
+            middle = rank_between(low, high)
+            self.assertTrue(low < middle < high)
+            high = middle
+        self.assertLess(rank_between(None, 'i'), 'i')
+        self.assertGreater(rank_between('z', None), 'z')
+        with self.assertRaises(ValueError):
+            rank_between('i', 'i')
+
+    def test_move_updates_single_row(self):
+        first, second, third, fourth = self.tasks
+        with CaptureQueriesContext(connection) as queries:
+            response = self.move(fourth, after_id=first.id, before_id=second.id)
+        self.assertEqual(response.status_code, 200)
+        writes = [query['sql'] for query in queries if not query['sql'].startswith(('SELECT', 'SAVEPOINT', 'RELEASE'))]
+        self.assertEqual(len(writes), 1)
+        self.assertIn('UPDATE "tasks_task"', writes[0])
+        self.assertEqual(self.column(self.todo), ['card 0', 'card 3', 'card 1', 'card 2'])
+
+        # Только один сосед: второй находится по индексу; без соседей — в конец
+        self.assertEqual(self.move(third, before_id=first.id).status_code, 200)
+        self.assertEqual(self.move(first).status_code, 200)
+        self.assertEqual(self.column(self.todo), ['card 2', 'card 3', 'card 1', 'card 0'])
+
+        # Перенос в другую колонку
+        self.assertEqual(self.move(second, status_id=self.done.id).status_code, 200)
+        self.assertEqual(self.column(self.done), ['card 1'])
+        self.assertEqual(self.move(third, status_id=self.done.id, before_id=second.id).status_code, 200)
+        self.assertEqual(self.column(self.done), ['card 2', 'card 1'])
+
+    def test_patch_status_appends_to_target_column(self):
+        first, second, third = self.tasks[:3]
+        self.assertEqual(self.move(second, status_id=self.done.id).status_code, 200)
+        # Ранг первой карточки старой колонки совпал бы с рангом первой карточки новой
+        response = self.client.patch(f'/api/tasks/tasks/{first.id}/', {'status_id': self.done.id}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.column(self.done), ['card 1', 'card 0'])
+        self.assertEqual(Task.objects.filter(status=self.done).values('rank').distinct().count(), 2)
+
+        # Без смены статуса ранг не меняется
+        rank = Task.objects.get(id=third.id).rank
+        self.client.patch(f'/api/tasks/tasks/{third.id}/', {'status_id': self.todo.id, 'title': 'x'}, format='json')
+        self.assertEqual(Task.objects.get(id=third.id).rank, rank)
+
+    def test_move_validation_and_permissions(self):
+        first, second = self.tasks[:2]
+        self.assertEqual(self.move(first, after_id=999).status_code, 400)
+        # Сосед из другой колонки
+        self.assertEqual(self.move(first, status_id=self.done.id, after_id=second.id).status_code, 400)
+
+        self.client.force_authenticate(self.member)
+        self.assertEqual(self.move(first, after_id=second.id).status_code, 404)
+        first.assigned_to.add(self.member)
+        self.assertEqual(self.move(first, after_id=second.id).status_code, 200)
+
+    @override_settings(TASKS_RANK_REBALANCE_LENGTH=8, TASKS_RANK_REBALANCE_DELAY=0)
+    def test_rebalance_only_when_key_space_exhausted(self):
+        first, second, third, fourth = self.tasks
+        ranks_before = dict(Task.objects.values_list('id', 'rank'))
+
+        # Раз за разом кладём карточку сразу под первой — ранг удлиняется
+        moves = 0
+        while True:
+            mover = third if moves % 2 == 0 else fourth
+            with self.captureOnCommitCallbacks(execute=True):
+                self.assertEqual(self.move(mover, after_id=first.id).status_code, 200)
+            moves += 1
+            ranks = dict(Task.objects.values_list('id', 'rank'))
+            if ranks[second.id] != ranks_before[second.id]:
+                break
+            self.assertLess(moves, 100)
+        # Перенумерация случилась лишь после многих переносов, порядок сохранён
+        self.assertGreater(moves, 5)
+        self.assertTrue(all(len(rank) <= 6 for rank in Task.objects.values_list('rank', flat=True)))
+        self.assertEqual(self.column(self.todo)[0], 'card 0')
+        self.assertEqual(self.column(self.todo)[-1], 'card 1')
+
+    @override_settings(TASKS_RANK_REBALANCE_DELAY=0)
+    def test_duplicate_ranks_conflict_and_rebalance(self):
+        first, second, third = self.tasks[:3]
+        Task.objects.filter(id__in=[first.id, second.id]).update(rank='i')
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.move(third, after_id=first.id, before_id=second.id)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(Task.objects.filter(status=self.todo).values('rank').distinct().count(), 4)
+        self.assertEqual(self.move(third, after_id=first.id, before_id=second.id).status_code, 200)
+
+
+class TimerTests(APITestCase):
+    """Таймеры на сервере: один запущенный таймер на пользователя и остановка одним UPDATE."""
+
+    def setUp(self):
+        status_registry.invalidate()
+        Status.objects.create(title='TODO', order=0)
+        self.admin = User.objects.create_user(username='admin', password='pass', role='admin')
+        self.member = User.objects.create_user(username='member', password='pass')
+        self.task = Task.objects.create(title='timer', creator=self.admin)
+        self.other = Task.objects.create(title='other', creator=self.admin)
+        self.task.assigned_to.add(self.member)
+        self.client.force_authenticate(self.member)
+
+    def start(self, task, **data):
+        return self.client.post('/api/tasks/time_entries/start/', {'task': task.id, **data}, format='json')
+
+    def test_start_rejects_or_replaces_running_timer(self):
+        response = self.start(self.task)
+        self.assertEqual(response.status_code, 201)
+        first_id = response.data['entry']['id']
+
+        response = self.start(self.task)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data['entry']['id'], first_id)
+
+        # Запись без end_time в обход таймеров упирается в тот же индекс
+        response = self.client.post('/api/tasks/time_entries/', {'task': self.task.id}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+        self.client.force_authenticate(self.admin)
+        self.assertEqual(self.start(self.other).status_code, 201)
+        self.client.force_authenticate(self.member)
+        # Задача, на которую пользователь не назначен
+        self.assertEqual(self.start(self.other, replace=True).status_code, 403)
+
+        response = self.start(self.task, replace=True)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['stopped']['id'], first_id)
+        self.assertIsNotNone(TimeEntry.objects.get(pk=first_id).duration)
+        self.assertEqual(TimeEntry.objects.running_for(self.member.pk).count(), 1)
+        self.assertEqual(TimeEntry.objects.running().count(), 2)
+
+    def test_stop_computes_duration_and_updates_rollup(self):
+        started = timezone.now() - timedelta(minutes=20)
+        TimeEntry.objects.create(task=self.task, user=self.member, start_time=started)
+
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/tasks/time_entries/active/')
+        self.assertEqual(response.data['entry']['task'], self.task.id)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post('/api/tasks/time_entries/stop/')
+        self.assertEqual(response.status_code, 200)
+        updates = [query['sql'] for query in queries if query['sql'].startswith('UPDATE "tasks_timeentry"')]
+        self.assertEqual(len(updates), 1)
+
+        entry = TimeEntry.objects.get()
+        self.assertEqual(entry.duration, entry.end_time - entry.start_time)
+        self.assertGreaterEqual(entry.duration, timedelta(minutes=20))
+        rollup = TimeRollup.objects.get(user=self.member, task=self.task)
+        self.assertEqual((rollup.seconds, rollup.entries), (int(entry.duration.total_seconds()), 1))
+
+        self.assertEqual(self.client.post('/api/tasks/time_entries/stop/').status_code, 404)
+        self.assertIsNone(self.client.get('/api/tasks/time_entries/active/').data['entry'])
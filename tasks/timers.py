@@ -0,0 +1,76 @@
+# tasks/timers.py
+"""
+Таймеры учета времени на сервере (POST /api/tasks/time_entries/start/,
+POST .../stop/, GET .../active/).
+
+Запущенный таймер — запись TimeEntry без end_time. Частичный уникальный
+индекс tasks_timeentry_running_uniq — (user) WHERE end_time IS NULL —
+оставляет пользователю не больше одного таймера и при параллельных
+запросах: второй INSERT завершается IntegrityError, без предварительной
+проверки и блокировок. Тот же индекс обслуживает поиск активного таймера.
+
+Остановка — один UPDATE ... SET end_time = now, duration = now - start_time
+WHERE id = ... AND end_time IS NULL: если таймер уже остановлен другим
+запросом, строка не изменится. QuerySet.update() не отправляет сигналы,
+поэтому вклад записи в сводку TimeRollup добавляется явно (tasks/rollups.py).
+"""
+from django.db import IntegrityError, transaction
+from django.db.models import DateTimeField, DurationField, ExpressionWrapper, F, Value
+from django.utils import timezone
+
+from . import rollups
+from .models import TimeEntry
+
+
+class TimerRunning(Exception):
+    """У пользователя уже запущен таймер entry (None — если он успел завершиться)."""
+
+    def __init__(self, entry):
+        super().__init__(entry)
+        self.entry = entry
+
+
+def active_timer(user_id):
+    """Запущенный таймер пользователя или None — одним запросом по частичному индексу."""
+    return TimeEntry.objects.running_for(user_id).select_related('user').first()
+
+
+def stop_timer(user_id, at=None):
+    """Останавливает запущенный таймер пользователя. Возвращает запись или None."""
+    at = at or timezone.now()
+    with transaction.atomic():
+        entry = active_timer(user_id)
+        if entry is None:
+            return None
+        end_time = max(at, entry.start_time)
+        stopped = TimeEntry.objects.filter(pk=entry.pk, end_time__isnull=True).update(
+            end_time=end_time,
+            duration=ExpressionWrapper(
+                Value(end_time, output_field=DateTimeField()) - F('start_time'), output_field=DurationField(),
+            ),
+        )
+        if not stopped:
+            # Таймер остановлен параллельным запросом
+            return None
+        entry.end_time = end_time
+        entry.duration = end_time - entry.start_time
+        rollups.entry_saved(entry)
+    return entry
+
+
+def start_timer(user, task, replace=False, at=None):
+    """
+    Запускает таймер пользователя на задаче. Уже запущенный таймер при
+    replace останавливается в той же транзакции, иначе — TimerRunning.
+    Возвращает (новая запись, остановленная запись или None).
+    """
+    at = at or timezone.now()
+    with transaction.atomic():
+        stopped = stop_timer(user.pk, at) if replace else None
+        try:
+            with transaction.atomic():
+                entry = TimeEntry.objects.create(task=task, user=user, start_time=at)
+        except IntegrityError:
+            # Таймер запущен параллельным запросом; остановка выше откатывается вместе с транзакцией
+            raise TimerRunning(active_timer(user.pk))
+    return entry, stopped
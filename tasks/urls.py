@@ -13,6 +13,12 @@ urlpatterns = [
     # Ендпоїнт для отримання списку статусів
     path('statuses/', views.StatusListView.as_view(), name='status-list'),
 
+    # Доска: статусы с задачами за постоянное количество запросов
+    path('board/', views.BoardView.as_view(), name='task-board'),
+
+    # Отчёт по затраченному времени из сводной таблицы
+    path('reports/time/', views.TimeReportView.as_view(), name='time-report'),
+
     # Підключаємо роутер для TaskViewSet та TimeEntryViewSet
     path('', include(router.urls)),
 ]
\ No newline at end of file
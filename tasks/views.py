@@ -1,40 +1,155 @@
 # tasks/views.py
-from rest_framework import viewsets, generics, permissions
-from .models import Task, Status, TimeEntry
-from .serializers import TaskSerializer, StatusSerializer, TimeEntrySerializer
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from django.utils.http import parse_etags
+from rest_framework import viewsets, generics, permissions, status
+from rest_framework.decorators import action
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from .models import Task, TimeEntry, TimeRollup
+from . import bulk, timers
+from .filters import filter_tasks
+from .pagination import BOARD_ORDERING, TASK_ORDERINGS, parse_limit
+from .rollups import GROUP_FIELDS, PERIODS, time_report
+from .ranking import needs_rebalance, rank_in_column, rank_rebalancer
+from .serializers import (
+    TaskSerializer, StatusSerializer, TaskMoveSerializer, TimeEntrySerializer, TimerStartSerializer,
+)
+from .realtime import board_events
+from .statuses import status_registry
 from .permissions import IsAdminOrEditor, IsAssignedUserOrAdmin
-from rest_framework.exceptions import PermissionDenied
+from rest_framework.exceptions import PermissionDenied, ValidationError
 
 
 # -------------------- 1. Статусы (Колонки) --------------------
 
 class StatusListView(generics.ListAPIView):
-    """Возвращает список всех статусов для построения доски."""
-    queryset = Status.objects.all().order_by('order')
+    """
+    Возвращает список всех статусов для построения доски.
+    Данные берутся из реестра статусов; ETag — версия реестра, поэтому клиент
+    с актуальным списком получает 304 без тела.
+    """
     serializer_class = StatusSerializer
     permission_classes = [permissions.IsAuthenticated]
 
+    def get_queryset(self):
+        return status_registry.all()
+
+    def list(self, request, *args, **kwargs):
+        etag = f'"{status_registry.version}"'
+        # If-None-Match сравнивается слабо: W/"v" совпадает с "v"
+        tags = parse_etags(request.headers.get('If-None-Match', ''))
+        if '*' in tags or etag in {tag.removeprefix('W/') for tag in tags}:
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+        response = super().list(request, *args, **kwargs)
+        response['ETag'] = etag
+        return response
+
 
 # -------------------- 2. Задачи (Task) --------------------
 
+class BoardView(APIView):
+    """
+    Доска задач (GET /api/tasks/board/): статусы по `order`, в каждом — его задачи.
+
+    Количество запросов не зависит ни от числа задач, ни от числа колонок:
+    задачи (первые `limit` в каждой колонке — одним запросом с ROW_NUMBER()
+    по статусу) и исполнители (prefetch); статусы берутся из реестра. У колонки, где задач
+    больше `limit`, есть `next_cursor`; следующую порцию отдаёт
+    `?status=<id>&cursor=<next_cursor>`.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_limit(self):
+        return parse_limit(
+            self.request.query_params,
+            getattr(settings, 'TASKS_BOARD_COLUMN_LIMIT', 50),
+            getattr(settings, 'TASKS_BOARD_MAX_COLUMN_LIMIT', 200),
+        )
+
+    def get(self, request):
+        limit = self.get_limit()
+        statuses = status_registry.all()
+        tasks = Task.objects.visible_to(request.user).for_board()
+
+        status_id = request.query_params.get('status')
+        if status_id is not None:
+            # "Загрузить ещё" для одной колонки
+            statuses = [item for item in statuses if str(item.id) == status_id]
+            if not statuses:
+                status_registry.invalidate()
+                statuses = [item for item in status_registry.all() if str(item.id) == status_id]
+            if not statuses:
+                raise ValidationError({'status': 'Неизвестный статус.'})
+            rows, next_cursor = BOARD_ORDERING.paginate(
+                tasks.filter(status_id=statuses[0].id), request.query_params.get('cursor'), limit,
+            )
+            cursors = {statuses[0].id: next_cursor}
+        else:
+            rows = list(
+                tasks.annotate(column_row=Window(
+                    RowNumber(), partition_by=[F('status_id')], order_by=BOARD_ORDERING.order_by(),
+                )).filter(column_row__lte=limit + 1).order_by('status_id', *BOARD_ORDERING.order_by())
+            )
+            cursors = {}
+
+        # Один проход: раскладываем задачи по колонкам и запоминаем курсоры
+        columns = {item.id: [] for item in statuses}
+        if status_id is None and any(task.status_id not in columns for task in rows):
+            # Статус добавлен в другом процессе, а реестр ещё не истёк по TTL — перечитываем
+            status_registry.invalidate()
+            statuses = status_registry.all()
+            columns = {item.id: [] for item in statuses}
+        data = TaskSerializer(rows, many=True, context={'request': request}).data
+        for index, (task, item) in enumerate(zip(rows, data)):
+            column = columns.get(task.status_id)
+            if column is None:
+                # Статус удалён после выборки задач
+                continue
+            if len(column) < limit:
+                column.append(item)
+            elif task.status_id not in cursors:
+                # Лишняя (limit + 1)-я строка: курсор — последняя показанная задача колонки
+                cursors[task.status_id] = BOARD_ORDERING.encode(rows[index - 1])
+
+        return Response({
+            'columns': [
+                {
+                    'status': StatusSerializer(item).data,
+                    'tasks': columns[item.id],
+                    'next_cursor': cursors.get(item.id),
+                }
+                for item in statuses
+            ],
+        })
+
+
 class TaskViewSet(viewsets.ModelViewSet):
+    """
+    Список задач — keyset-страницы `{'results': [...], 'next_cursor': ...}`.
+    Фильтры — см. tasks/filters.py; `ordering` — due_date (по умолчанию),
+    -due_date, created_at, -created_at, rank (ручной порядок колонки, как на
+    доске); `limit` — размер страницы.
+    """
     serializer_class = TaskSerializer
 
     def get_queryset(self):
         """Фильтрация задач по ролям."""
-        user = self.request.user
-        if user.role in ['admin', 'editor']:
-            # Администраторы и редакторы видят все задачи
-            return Task.objects.all()
-        # Обычные пользователи видят только те, на которые назначены
-        return Task.objects.filter(assigned_to=user).distinct()
+        # Администраторы и редакторы видят все задачи, обычные пользователи — назначенные им
+        return Task.objects.visible_to(self.request.user).for_board()
 
     def get_permissions(self):
         """Определяет разрешения в зависимости от действия."""
-        if self.action in ['create', 'destroy']:
-            # Создавать и удалять могут только Admin/Editor
+        if self.action in ['create', 'destroy', 'bulk_assign'] or (self.action == 'bulk' and self.request.method == 'POST'):
+            # Создавать и удалять (и массово назначать) могут только Admin/Editor
             permission_classes = [IsAdminOrEditor]
-        elif self.action in ['update', 'partial_update']:
+        elif self.action in ['update', 'partial_update', 'move']:
             # Обновлять могут Admin/Editor ИЛИ назначенный пользователь
             permission_classes = [IsAssignedUserOrAdmin]
         else:
@@ -42,10 +157,117 @@ class TaskViewSet(viewsets.ModelViewSet):
             permission_classes = [permissions.IsAuthenticated]
         return [permission() for permission in permission_classes]
 
+    def list(self, request, *args, **kwargs):
+        ordering = request.query_params.get('ordering', 'due_date')
+        keyset = TASK_ORDERINGS.get(ordering)
+        if keyset is None:
+            raise ValidationError({'ordering': f'Допустимые значения: {", ".join(TASK_ORDERINGS)}.'})
+        limit = parse_limit(
+            request.query_params,
+            getattr(settings, 'TASKS_LIST_PAGE_SIZE', 50),
+            getattr(settings, 'TASKS_LIST_MAX_PAGE_SIZE', 200),
+        )
+
+        queryset = filter_tasks(request, self.get_queryset())
+        tasks, next_cursor = keyset.paginate(queryset, request.query_params.get('cursor'), limit)
+        return Response({
+            'results': self.get_serializer(tasks, many=True).data,
+            'next_cursor': next_cursor,
+        })
+
     def perform_create(self, serializer):
         # При создании автоматически устанавливаем создателя
         serializer.save(creator=self.request.user)
 
+    def perform_update(self, serializer):
+        # Исполнители до изменения (из prefetch): доски снятых с задачи получат 'removed'
+        previous = [user.id for user in serializer.instance.assigned_to.all()]
+        extra = {}
+        target = serializer.validated_data.get('status')
+        if target is not None and target.id != serializer.instance.status_id:
+            # Ранг из старой колонки совпал бы с рангами новой — ставим карточку в конец
+            extra['rank'] = rank_in_column(Task.objects.filter(status_id=target.id))
+            if needs_rebalance(extra['rank']):
+                rank_rebalancer.request(target.id)
+        task = serializer.save(**extra)
+        board_events.changed([task.id], previous)
+
+    def perform_destroy(self, instance):
+        previous = [user.id for user in instance.assigned_to.all()]
+        task_id = instance.id
+        instance.delete()
+        board_events.changed([task_id], previous)
+
+    @action(detail=True, methods=['post'])
+    def move(self, request, pk=None):
+        """
+        Перенос карточки между соседями (и, при необходимости, в другую колонку).
+        Новый ранг вычисляется из рангов соседей, записывается одна строка.
+        """
+        task = self.get_object()
+        serializer = TaskMoveSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        target = serializer.validated_data.get('status') or task.status
+        after_id = serializer.validated_data.get('after_id')
+        before_id = serializer.validated_data.get('before_id')
+
+        column = Task.objects.filter(status_id=target.id).exclude(pk=task.pk)
+        neighbours = dict(
+            column.filter(id__in=[i for i in (after_id, before_id) if i is not None]).values_list('id', 'rank')
+        )
+        for name, neighbour_id in (('after_id', after_id), ('before_id', before_id)):
+            if neighbour_id is not None and neighbour_id not in neighbours:
+                raise ValidationError({name: 'Карточка не найдена в целевой колонке.'})
+
+        try:
+            rank = rank_in_column(column, neighbours.get(after_id), neighbours.get(before_id))
+        except ValueError:
+            # Соседи в обратном порядке или с одинаковым рангом — колонка устарела у клиента
+            # либо ранги совпали после гонки; перенумерация вернёт уникальные ранги
+            rank_rebalancer.request(target.id)
+            return Response(
+                {'detail': 'Порядок колонки изменился, обновите доску и повторите перенос.'},
+                status=status.HTTP_409_CONFLICT,
+            )
+
+        Task.objects.filter(pk=task.pk).update(rank=rank, status=target)
+        if needs_rebalance(rank):
+            rank_rebalancer.request(target.id)
+        board_events.changed([task.id])
+        return Response({'id': task.id, 'status_id': target.id, 'rank': rank})
+
+    # --- Пакетные операции (tasks/bulk.py) ---
+
+    def bulk_response(self, operation, response_status=status.HTTP_200_OK):
+        try:
+            ids = operation(self.request.user, self.request.data)
+        except bulk.BulkItemsError as exc:
+            return Response({'errors': exc.errors}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'ids': ids, 'count': len(ids)}, status=response_status)
+
+    @action(detail=False, methods=['post', 'patch'])
+    def bulk(self, request):
+        """
+        POST — создать задачи `{'tasks': [{title, description, status_id, due_date, assigned_to_ids}, ...]}`;
+        PATCH — изменить `{'tasks': [{id, title?, description?, status_id?, due_date?}, ...]}`.
+        """
+        if request.method == 'POST':
+            return self.bulk_response(
+                lambda user, data: [task.id for task in bulk.bulk_create_tasks(user, data)],
+                status.HTTP_201_CREATED,
+            )
+        return self.bulk_response(lambda user, data: [task.id for task in bulk.bulk_update_tasks(user, data)])
+
+    @action(detail=False, methods=['post'], url_path='bulk/move')
+    def bulk_move(self, request):
+        """Перенос задач `ids` в колонку `status_id` одним UPDATE."""
+        return self.bulk_response(bulk.bulk_move_tasks)
+
+    @action(detail=False, methods=['post'], url_path='bulk/assign')
+    def bulk_assign(self, request):
+        """Добавление (`add`) и снятие (`remove`) исполнителей у задач `ids`."""
+        return self.bulk_response(bulk.bulk_assign_tasks)
+
 
 # -------------------- 3. Учет времени (TimeEntry) --------------------
 
@@ -54,13 +276,143 @@ class TimeEntryViewSet(viewsets.ModelViewSet):
     serializer_class = TimeEntrySerializer
     permission_classes = [permissions.IsAuthenticated]
 
-    def perform_create(self, serializer):
+    def check_can_track(self, task):
         # Убеждаемся, что пользователь, который трекает время, назначен на задачу
-        task = serializer.validated_data['task']
         user = self.request.user
-
-        if user not in task.assigned_to.all() and user.role not in ['admin', 'editor']:
+        if getattr(user, 'role', None) in ['admin', 'editor']:
+            return
+        if not Task.objects.filter(pk=task.pk).assigned_to_user(user.pk).exists():
             raise PermissionDenied("Вы не назначены на эту задачу и не имеете прав администратора.")
 
+    def save_entry(self, serializer, **kwargs):
+        try:
+            with transaction.atomic():
+                serializer.save(**kwargs)
+        except IntegrityError:
+            # Частичный уникальный индекс: второй незавершённый интервал пользователя
+            raise ValidationError({'end_time': 'У пользователя уже запущен таймер, укажите время окончания.'})
+
+    def perform_create(self, serializer):
+        self.check_can_track(serializer.validated_data['task'])
         # Автоматически устанавливаем пользователя, который создал запись времени
-        serializer.save(user=user)
+        self.save_entry(serializer, user=self.request.user)
+
+    def perform_update(self, serializer):
+        self.save_entry(serializer)
+
+    # --- Таймеры на сервере (tasks/timers.py) ---
+
+    @action(detail=False, methods=['get'])
+    def active(self, request):
+        """Запущенный таймер текущего пользователя (`{'entry': null}`, если таймера нет)."""
+        entry = timers.active_timer(request.user.pk)
+        return Response({'entry': TimeEntrySerializer(entry).data if entry else None})
+
+    @action(detail=False, methods=['post'])
+    def start(self, request):
+        """
+        Запуск таймера на задаче `task`. Если таймер уже запущен — 409, либо
+        при `replace: true` он останавливается в той же транзакции.
+        """
+        serializer = TimerStartSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        task = serializer.validated_data['task']
+        self.check_can_track(task)
+
+        try:
+            entry, stopped = timers.start_timer(request.user, task, replace=serializer.validated_data['replace'])
+        except timers.TimerRunning as exc:
+            return Response(
+                {
+                    'detail': 'Таймер уже запущен. Остановите его или передайте replace: true.',
+                    'entry': TimeEntrySerializer(exc.entry).data if exc.entry else None,
+                },
+                status=status.HTTP_409_CONFLICT,
+            )
+        return Response(
+            {
+                'entry': TimeEntrySerializer(entry).data,
+                'stopped': TimeEntrySerializer(stopped).data if stopped else None,
+            },
+            status=status.HTTP_201_CREATED,
+        )
+
+    @action(detail=False, methods=['post'])
+    def stop(self, request):
+        """Остановка запущенного таймера текущего пользователя."""
+        entry = timers.stop_timer(request.user.pk)
+        if entry is None:
+            return Response({'detail': 'Нет запущенного таймера.'}, status=status.HTTP_404_NOT_FOUND)
+        return Response({'entry': TimeEntrySerializer(entry).data})
+
+
+# -------------------- 4. Отчёты --------------------
+
+class TimeReportView(APIView):
+    """
+    Отчёт по затраченному времени (GET /api/tasks/reports/time/) из сводной
+    таблицы TimeRollup — без чтения исходных записей TimeEntry.
+
+    Параметры: `date_from`, `date_to` (даты включительно, по умолчанию —
+    последние 30 дней), `group_by` — через запятую из user, task и одного
+    периода day/week/month (по умолчанию user,task), фильтры `user` и `task`.
+    Обычный пользователь видит только своё время.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def parse_date(self, name, default):
+        value = self.request.query_params.get(name, '').strip()
+        if not value:
+            return default
+        try:
+            day = parse_date(value)
+        except ValueError:
+            day = None
+        if day is None:
+            raise ValidationError({name: 'Ожидается дата в формате ГГГГ-ММ-ДД.'})
+        return day
+
+    def parse_id(self, name):
+        value = self.request.query_params.get(name, '').strip()
+        if not value:
+            return None
+        if not value.isdigit():
+            raise ValidationError({name: 'Ожидается целое число.'})
+        return int(value)
+
+    def get(self, request):
+        date_to = self.parse_date('date_to', timezone.localdate())
+        date_from = self.parse_date('date_from', date_to - timedelta(days=29))
+        max_days = getattr(settings, 'TASKS_TIME_REPORT_MAX_DAYS', 366)
+        if date_from > date_to:
+            raise ValidationError({'date_from': 'Начало диапазона позже конца.'})
+        if (date_to - date_from).days >= max_days:
+            raise ValidationError({'date_from': f'Диапазон не может превышать {max_days} дней.'})
+
+        group_by = [name.strip() for name in request.query_params.get('group_by', 'user,task').split(',') if name.strip()]
+        unknown = [name for name in group_by if name not in GROUP_FIELDS and name not in PERIODS]
+        if not group_by or unknown or len(group_by) != len(set(group_by)):
+            raise ValidationError({'group_by': f'Допустимые значения: {", ".join([*GROUP_FIELDS, *PERIODS])}.'})
+        if sum(name in PERIODS for name in group_by) > 1:
+            raise ValidationError({'group_by': 'Можно указать только один период.'})
+
+        rollups = TimeRollup.objects.filter(day__gte=date_from, day__lte=date_to)
+        user_id = self.parse_id('user')
+        if getattr(request.user, 'role', None) not in ['admin', 'editor']:
+            if user_id is not None and user_id != request.user.pk:
+                raise PermissionDenied("Можно просматривать только собственное время.")
+            user_id = request.user.pk
+        if user_id is not None:
+            rollups = rollups.filter(user_id=user_id)
+        task_id = self.parse_id('task')
+        if task_id is not None:
+            rollups = rollups.filter(task_id=task_id)
+
+        rows = time_report(rollups, group_by)
+        return Response({
+            'date_from': date_from,
+            'date_to': date_to,
+            'group_by': group_by,
+            'results': rows,
+            'total_seconds': sum(row['total_seconds'] for row in rows),
+        })
@@ -3,6 +3,8 @@ import json
 import threading
 import time
 
+# Ручна перевірка одного сокета. Для навантажувального тесту: python -m benchmarks.ws_load
+
 # --- НАЛАШТУВАННЯ ---
 CHAT_ID = 1
 AUTH_TOKEN = "ac0636c4461385787c33d46ccd4f6df6313df057" # Ваш токен
@@ -29,6 +31,8 @@ def on_open(ws):
         # Надсилаємо перше повідомлення через 3 секунди
         time.sleep(3)
         test_message = {
+            "command": "send_message",
+            "chat_id": CHAT_ID,
             "content": "Це тестове повідомлення з Python-скрипта."
         }
 